@@ -0,0 +1,516 @@
+-- Миграции для уже развернутых баз данных.
+-- Новые установки получают эти изменения из Tables.sql.
+-- Скрипты идемпотентны: их можно выполнять повторно.
+
+-- ================================ ЛОГИН СОТРУДНИКА =======================
+-- Точное сопоставление пользователя PostgreSQL и сотрудника вместо поиска
+-- по email ILIKE '%username%' (полный просмотр employees на каждый вход)
+ALTER TABLE employees ADD COLUMN IF NOT EXISTS login_name VARCHAR(100);
+
+-- 1. Пользователи PostgreSQL, чье имя совпадает с началом email
+--    (petrova_es -> petrova@company.ru)
+UPDATE employees e
+SET login_name = m.usename
+FROM (
+    SELECT DISTINCT ON (c.employee_id) c.employee_id, c.usename
+    FROM (
+        SELECT e2.employee_id,
+               u.usename,
+               SPLIT_PART(e2.email, '@', 1) = u.usename AS exact_match,
+               COUNT(*) OVER (PARTITION BY u.usename) AS candidates
+        FROM employees e2
+        JOIN pg_user u
+          ON SPLIT_PART(e2.email, '@', 1) = u.usename
+          OR SPLIT_PART(e2.email, '@', 1) = SPLIT_PART(u.usename, '_', 1)
+        WHERE e2.login_name IS NULL
+          AND NOT EXISTS (SELECT 1 FROM employees e3 WHERE e3.login_name = u.usename)
+    ) c
+    -- Неоднозначные совпадения оставляем для ручного назначения
+    WHERE c.candidates = 1
+    ORDER BY c.employee_id, c.exact_match DESC, c.usename
+) m
+WHERE e.employee_id = m.employee_id;
+
+-- 2. Учетные записи, не выводимые из email
+UPDATE employees SET login_name = 'ivanov_ii'
+WHERE email = 'director@company.ru' AND login_name IS NULL
+  AND NOT EXISTS (SELECT 1 FROM employees WHERE login_name = 'ivanov_ii');
+
+-- 3. Остальным сотрудникам - начало email
+UPDATE employees e
+SET login_name = SPLIT_PART(e.email, '@', 1)
+WHERE e.login_name IS NULL
+  AND NOT EXISTS (SELECT 1 FROM employees e2 WHERE e2.login_name = SPLIT_PART(e.email, '@', 1));
+
+CREATE UNIQUE INDEX IF NOT EXISTS employees_login_name_key ON employees (login_name);
+
+-- ================================ ИНДЕКСЫ СПИСКОВ =======================
+-- Постраничный вывод списков по индексированным колонкам сортировки
+CREATE INDEX IF NOT EXISTS idx_clients_full_name ON clients (full_name, client_id);
+CREATE INDEX IF NOT EXISTS idx_clients_created_at ON clients (created_at, client_id);
+CREATE INDEX IF NOT EXISTS idx_employees_full_name ON employees (full_name, employee_id);
+CREATE INDEX IF NOT EXISTS idx_employees_created_at ON employees (created_at, employee_id);
+CREATE INDEX IF NOT EXISTS idx_policies_start_date ON policies (start_date, policy_id);
+CREATE INDEX IF NOT EXISTS idx_documents_created_at ON documents (created_at, document_id);
+
+-- ================================ СЧЕТЧИКИ ДАШБОРДОВ =====================
+-- Количество строк основных таблиц, поддерживается триггерами (Trigger.sql).
+-- department_id = 0 - общий итог, иначе - значение по отделу.
+CREATE TABLE IF NOT EXISTS dashboard_counters (
+    metric VARCHAR(50) NOT NULL, -- 'employees', 'employees_active', 'clients', 'policies', 'documents', 'documents_public'
+    department_id INT NOT NULL DEFAULT 0,
+    value BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ DEFAULT NOW(),
+    PRIMARY KEY (metric, department_id)
+);
+
+-- Функции счетчиков (см. Trigger.sql)
+CREATE OR REPLACE FUNCTION bump_dashboard_counter(p_metric TEXT, p_department_id INT, p_delta BIGINT)
+RETURNS VOID AS $$
+BEGIN
+    INSERT INTO dashboard_counters (metric, department_id, value)
+    VALUES (p_metric, p_department_id, p_delta)
+    ON CONFLICT (metric, department_id)
+    DO UPDATE SET value = dashboard_counters.value + EXCLUDED.value, updated_at = NOW();
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+CREATE OR REPLACE FUNCTION count_employees_change()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'UPDATE'
+       AND OLD.department_id IS NOT DISTINCT FROM NEW.department_id
+       AND (OLD.is_active IS TRUE) = (NEW.is_active IS TRUE) THEN
+        RETURN NULL;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM bump_dashboard_counter('employees', 0, -1);
+        PERFORM bump_dashboard_counter('employees', OLD.department_id, -1);
+        IF OLD.is_active IS TRUE THEN
+            PERFORM bump_dashboard_counter('employees_active', 0, -1);
+        END IF;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM bump_dashboard_counter('employees', 0, 1);
+        PERFORM bump_dashboard_counter('employees', NEW.department_id, 1);
+        IF NEW.is_active IS TRUE THEN
+            PERFORM bump_dashboard_counter('employees_active', 0, 1);
+        END IF;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+CREATE OR REPLACE FUNCTION count_clients_change()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM bump_dashboard_counter('clients', 0, CASE WHEN TG_OP = 'INSERT' THEN 1 ELSE -1 END);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+CREATE OR REPLACE FUNCTION count_policies_change()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'UPDATE' AND OLD.created_in_department_id = NEW.created_in_department_id THEN
+        RETURN NULL;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM bump_dashboard_counter('policies', 0, -1);
+        PERFORM bump_dashboard_counter('policies', OLD.created_in_department_id, -1);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM bump_dashboard_counter('policies', 0, 1);
+        PERFORM bump_dashboard_counter('policies', NEW.created_in_department_id, 1);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+CREATE OR REPLACE FUNCTION count_documents_change()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'UPDATE'
+       AND OLD.created_in_department_id = NEW.created_in_department_id
+       AND (OLD.confidentiality_level < 2) = (NEW.confidentiality_level < 2) THEN
+        RETURN NULL;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM bump_dashboard_counter('documents', 0, -1);
+        PERFORM bump_dashboard_counter('documents', OLD.created_in_department_id, -1);
+        IF OLD.confidentiality_level < 2 THEN
+            PERFORM bump_dashboard_counter('documents_public', 0, -1);
+        END IF;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM bump_dashboard_counter('documents', 0, 1);
+        PERFORM bump_dashboard_counter('documents', NEW.created_in_department_id, 1);
+        IF NEW.confidentiality_level < 2 THEN
+            PERFORM bump_dashboard_counter('documents_public', 0, 1);
+        END IF;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+-- Полный пересчет (после TRUNCATE, массовой загрузки или для сверки)
+CREATE OR REPLACE FUNCTION refresh_dashboard_counters()
+RETURNS VOID AS $$
+BEGIN
+    LOCK TABLE employees, clients, policies, documents IN SHARE MODE;
+    DELETE FROM dashboard_counters;
+    INSERT INTO dashboard_counters (metric, department_id, value)
+    SELECT 'employees', 0, COUNT(*) FROM employees
+    UNION ALL
+    SELECT 'employees', department_id, COUNT(*) FROM employees GROUP BY department_id
+    UNION ALL
+    SELECT 'employees_active', 0, COUNT(*) FROM employees WHERE is_active = true
+    UNION ALL
+    SELECT 'clients', 0, COUNT(*) FROM clients
+    UNION ALL
+    SELECT 'policies', 0, COUNT(*) FROM policies
+    UNION ALL
+    SELECT 'policies', created_in_department_id, COUNT(*) FROM policies GROUP BY created_in_department_id
+    UNION ALL
+    SELECT 'documents', 0, COUNT(*) FROM documents
+    UNION ALL
+    SELECT 'documents', created_in_department_id, COUNT(*) FROM documents GROUP BY created_in_department_id
+    UNION ALL
+    SELECT 'documents_public', 0, COUNT(*) FROM documents WHERE confidentiality_level < 2;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+DROP TRIGGER IF EXISTS trigger_count_employees ON employees;
+CREATE TRIGGER trigger_count_employees
+    AFTER INSERT OR UPDATE OR DELETE ON employees
+    FOR EACH ROW
+    EXECUTE FUNCTION count_employees_change();
+
+DROP TRIGGER IF EXISTS trigger_count_clients ON clients;
+CREATE TRIGGER trigger_count_clients
+    AFTER INSERT OR DELETE ON clients
+    FOR EACH ROW
+    EXECUTE FUNCTION count_clients_change();
+
+DROP TRIGGER IF EXISTS trigger_count_policies ON policies;
+CREATE TRIGGER trigger_count_policies
+    AFTER INSERT OR UPDATE OR DELETE ON policies
+    FOR EACH ROW
+    EXECUTE FUNCTION count_policies_change();
+
+DROP TRIGGER IF EXISTS trigger_count_documents ON documents;
+CREATE TRIGGER trigger_count_documents
+    AFTER INSERT OR UPDATE OR DELETE ON documents
+    FOR EACH ROW
+    EXECUTE FUNCTION count_documents_change();
+
+-- Начальные значения счетчиков
+SELECT refresh_dashboard_counters();
+
+-- ================================ ИНДЕКСЫ ДОСТУПА К ДОКУМЕНТАМ ============
+-- Ветки условия доступа к документам: отдел, автор, уровень конфиденциальности
+CREATE INDEX IF NOT EXISTS idx_documents_dept_level_created ON documents (created_in_department_id, confidentiality_level, created_at);
+CREATE INDEX IF NOT EXISTS idx_documents_created_by ON documents (created_by_employee_id);
+CREATE INDEX IF NOT EXISTS idx_documents_level_created ON documents (confidentiality_level, created_at);
+
+-- ================================ ЛЕНТА УВЕДОМЛЕНИЙ ======================
+-- Прямая ссылка на получателя вместо поиска по документам автора
+ALTER TABLE notifications ADD COLUMN IF NOT EXISTS recipient_id INT REFERENCES employees(employee_id) ON DELETE CASCADE;
+ALTER TABLE notifications ADD COLUMN IF NOT EXISTS is_read BOOLEAN NOT NULL DEFAULT FALSE;
+
+UPDATE notifications n
+SET recipient_id = d.created_by_employee_id
+FROM documents d
+WHERE n.document_id = d.document_id AND n.recipient_id IS NULL;
+
+-- Уведомления без документа некому адресовать
+DELETE FROM notifications WHERE recipient_id IS NULL;
+
+ALTER TABLE notifications ALTER COLUMN recipient_id SET NOT NULL;
+UPDATE notifications SET created_at = NOW() WHERE created_at IS NULL;
+ALTER TABLE notifications ALTER COLUMN created_at SET NOT NULL;
+
+CREATE INDEX IF NOT EXISTS idx_notifications_recipient_feed ON notifications (recipient_id, created_at DESC, notification_id DESC);
+CREATE INDEX IF NOT EXISTS idx_notifications_recipient_unread ON notifications (recipient_id, is_read, created_at DESC, notification_id DESC);
+
+CREATE TABLE IF NOT EXISTS notification_counters (
+    recipient_id INT PRIMARY KEY REFERENCES employees(employee_id) ON DELETE CASCADE,
+    unread BIGINT NOT NULL DEFAULT 0
+);
+
+-- Счетчик непрочитанных (см. Trigger.sql)
+CREATE OR REPLACE FUNCTION count_notifications_change()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') AND NOT OLD.is_read THEN
+        UPDATE notification_counters SET unread = unread - 1 WHERE recipient_id = OLD.recipient_id;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') AND NOT NEW.is_read THEN
+        INSERT INTO notification_counters (recipient_id, unread)
+        VALUES (NEW.recipient_id, 1)
+        ON CONFLICT (recipient_id)
+        DO UPDATE SET unread = notification_counters.unread + 1;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+DROP TRIGGER IF EXISTS trigger_count_notifications ON notifications;
+CREATE TRIGGER trigger_count_notifications
+    AFTER INSERT OR DELETE OR UPDATE OF is_read, recipient_id ON notifications
+    FOR EACH ROW
+    EXECUTE FUNCTION count_notifications_change();
+
+-- Начальные значения счетчиков
+BEGIN;
+LOCK TABLE notifications IN SHARE MODE;
+DELETE FROM notification_counters;
+INSERT INTO notification_counters (recipient_id, unread)
+SELECT recipient_id, COUNT(*) FROM notifications WHERE NOT is_read GROUP BY recipient_id;
+COMMIT;
+
+-- ================================ УВЕДОМЛЕНИЯ В РЕАЛЬНОМ ВРЕМЕНИ =========
+-- notify_document_change использует реальные колонки (вместо несуществующей
+-- title), берет изменившего из app.current_user_id и отправляет pg_notify
+ALTER TABLE documents DROP COLUMN IF EXISTS title;
+
+CREATE OR REPLACE FUNCTION notify_document_change()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_changed_by INT := NULLIF(current_setting('app.current_user_id', true), '')::INT;
+    v_changed_by_name TEXT;
+    v_description TEXT;
+    v_notification_id INT;
+BEGIN
+    -- Изменения вне приложения и правки самого автора не уведомляются
+    IF v_changed_by IS NULL OR v_changed_by = NEW.created_by_employee_id OR NEW IS NOT DISTINCT FROM OLD THEN
+        RETURN NEW;
+    END IF;
+
+    SELECT full_name INTO v_changed_by_name FROM employees WHERE employee_id = v_changed_by;
+    v_description := format('Документ ''%s'' был изменен пользователем %s.',
+                            NEW.file_name, COALESCE(v_changed_by_name, 'Неизвестный пользователь'));
+    IF NEW.stored_file_path IS DISTINCT FROM OLD.stored_file_path THEN
+        v_description := v_description || ' Файл заменен.';
+    END IF;
+
+    INSERT INTO notifications (document_id, recipient_id, changed_by_employee_id, change_description)
+    VALUES (NEW.document_id, NEW.created_by_employee_id, v_changed_by, v_description)
+    RETURNING notification_id INTO v_notification_id;
+
+    PERFORM pg_notify('document_notifications', json_build_object(
+        'notification_id', v_notification_id,
+        'recipient_id', NEW.created_by_employee_id,
+        'document_id', NEW.document_id,
+        'file_name', NEW.file_name,
+        'change_description', v_description,
+        'changed_by_name', v_changed_by_name
+    )::text);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+DROP TRIGGER IF EXISTS trigger_document_change_notification ON documents;
+CREATE TRIGGER trigger_document_change_notification
+    AFTER UPDATE ON documents
+    FOR EACH ROW
+    EXECUTE FUNCTION notify_document_change();
+
+-- ================================ ФОНОВЫЕ ЗАДАЧИ ==========================
+-- Очередь задач для фонового обработчика (python -m tasks.worker).
+-- Задачи забираются через FOR UPDATE SKIP LOCKED, неудачные повторяются с задержкой.
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id BIGSERIAL PRIMARY KEY,
+    kind VARCHAR(50) NOT NULL, -- 'delete_file', 'delete_blob', 'process_upload'
+    payload JSONB NOT NULL DEFAULT '{}',
+    status VARCHAR(20) NOT NULL DEFAULT 'pending' CHECK (status IN ('pending', 'running', 'done', 'failed')),
+    attempts INT NOT NULL DEFAULT 0,
+    max_attempts INT NOT NULL DEFAULT 5,
+    run_at TIMESTAMPTZ NOT NULL DEFAULT NOW(), -- Не раньше этого времени
+    locked_at TIMESTAMPTZ,
+    last_error TEXT,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    finished_at TIMESTAMPTZ
+);
+
+-- Выборка готовых к выполнению задач
+CREATE INDEX IF NOT EXISTS idx_jobs_pending ON jobs (run_at, job_id) WHERE status = 'pending';
+-- Поиск зависших задач
+CREATE INDEX IF NOT EXISTS idx_jobs_running ON jobs (locked_at) WHERE status = 'running';
+
+-- ================================ ХРАНИЛИЩЕ ФАЙЛОВ ========================
+-- Документы с одинаковым содержимым ссылаются на один файл, путь больше не уникален
+ALTER TABLE documents DROP CONSTRAINT IF EXISTS documents_stored_file_path_key;
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS content_hash CHAR(64);
+
+-- Файлы документов хранятся по SHA-256 (documents/blob_store.py), одинаковые
+-- файлы - один раз. Число документов, ссылающихся на файл, ведет триггер
+-- count_document_blobs (Trigger.sql); документы старого формата (content_hash IS NULL) не учитываются.
+CREATE TABLE IF NOT EXISTS document_blobs (
+    content_hash CHAR(64) PRIMARY KEY,
+    ref_count INT NOT NULL DEFAULT 0,
+    byte_size BIGINT,
+    released_at TIMESTAMPTZ, -- Когда счетчик стал нулевым
+    last_used_at TIMESTAMPTZ -- Последняя загрузка файла (store_upload); delete_blob не трогает недавно загруженные
+);
+ALTER TABLE document_blobs ADD COLUMN IF NOT EXISTS last_used_at TIMESTAMPTZ;
+
+-- Проверка ссылок на файл старого формата перед удалением (задача delete_file)
+CREATE INDEX IF NOT EXISTS idx_documents_stored_file_path ON documents (stored_file_path);
+
+-- Счетчик ссылок на файлы хранилища. Когда ссылок не осталось, ставится
+-- задача delete_blob с задержкой (Config.BLOB_GC_DELAY): за это время
+-- загрузка того же файла успеет снова на него сослаться.
+CREATE OR REPLACE FUNCTION count_document_blobs()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_ref_count INT;
+BEGIN
+    IF TG_OP = 'UPDATE' AND OLD.content_hash IS NOT DISTINCT FROM NEW.content_hash THEN
+        RETURN NULL;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.content_hash IS NOT NULL THEN
+        INSERT INTO document_blobs (content_hash, ref_count, byte_size)
+        VALUES (NEW.content_hash, 1, NEW.file_size)
+        ON CONFLICT (content_hash)
+        DO UPDATE SET ref_count = document_blobs.ref_count + 1, released_at = NULL;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.content_hash IS NOT NULL THEN
+        UPDATE document_blobs
+        SET ref_count = ref_count - 1,
+            released_at = CASE WHEN ref_count = 1 THEN NOW() END
+        WHERE content_hash = OLD.content_hash
+        RETURNING ref_count INTO v_ref_count;
+        IF v_ref_count = 0 THEN
+            INSERT INTO jobs (kind, payload, run_at)
+            VALUES ('delete_blob', json_build_object('content_hash', OLD.content_hash), NOW() + INTERVAL '600 seconds');
+        END IF;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+DROP TRIGGER IF EXISTS trigger_count_document_blobs ON documents;
+CREATE TRIGGER trigger_count_document_blobs
+    AFTER INSERT OR DELETE OR UPDATE OF content_hash ON documents
+    FOR EACH ROW
+    EXECUTE FUNCTION count_document_blobs();
+
+-- ================================ ИНДЕКС ФАЙЛОВ ===========================
+-- Файлы хранилища (documents/file_index.py): поиск файла - запрос по индексу
+-- вместо перебора папок. Обновляется при сохранении и удалении файлов,
+-- сверяется с диском командой python -m documents.reconcile.
+CREATE TABLE IF NOT EXISTS document_files (
+    path TEXT PRIMARY KEY, -- Путь относительно папки загрузок (как documents.stored_file_path)
+    file_name TEXT NOT NULL, -- Имя файла без папки
+    size BIGINT NOT NULL,
+    mtime TIMESTAMPTZ,
+    content_hash CHAR(64),
+    indexed_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX IF NOT EXISTS idx_document_files_file_name ON document_files (file_name);
+CREATE INDEX IF NOT EXISTS idx_document_files_content_hash ON document_files (content_hash);
+
+-- Пути тестовых документов старого формата (раньше переводились в коде);
+-- остальные пути исправляет python -m documents.reconcile
+UPDATE documents d SET stored_file_path = v.new_path
+FROM (VALUES
+    ('/docs/public/rules_osago.pdf', 'public/rules_osago.pdf'),
+    ('/docs/public/tariffs_2025.pdf', 'public/tariffs_2025.pdf'),
+    ('/docs/sales/policy_001.pdf', 'department_2/policy_001.pdf'),
+    ('/docs/sales/policy_002.pdf', 'department_2/policy_002.pdf'),
+    ('/docs/confidential/fin_report.xlsx', 'department_1/fin_report.xlsx'),
+    ('/docs/confidential/strategy.pdf', 'department_1/strategy.pdf'),
+    ('/docs/confidential/sales_plan.xlsx', 'department_2/sales_plan.xlsx')
+) AS v(old_path, new_path)
+WHERE d.stored_file_path = v.old_path;
+
+-- ================================ ПОЛНОТЕКСТОВЫЙ ПОИСК ===================
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS search_vector tsvector;
+
+-- Текст, извлеченный из файла документа фоновой задачей process_upload
+-- (documents/text_extraction.py). Хранится отдельно, чтобы не увеличивать
+-- строки documents, читаемые списками.
+CREATE TABLE IF NOT EXISTS document_texts (
+    document_id INT PRIMARY KEY REFERENCES documents(document_id) ON DELETE CASCADE,
+    content_text TEXT NOT NULL,
+    extracted_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- Поисковый вектор документа: название (вес A), описание (B), текст файла (C)
+CREATE OR REPLACE FUNCTION document_search_vector(p_file_name TEXT, p_description TEXT, p_content TEXT)
+RETURNS tsvector AS $$
+    SELECT setweight(to_tsvector('russian', COALESCE(p_file_name, '')), 'A')
+        || setweight(to_tsvector('russian', COALESCE(p_description, '')), 'B')
+        || setweight(to_tsvector('russian', COALESCE(p_content, '')), 'C');
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Изменение названия или описания документа
+CREATE OR REPLACE FUNCTION update_document_search_vector()
+RETURNS TRIGGER AS $$
+BEGIN
+    NEW.search_vector := document_search_vector(
+        NEW.file_name, NEW.description,
+        (SELECT content_text FROM document_texts WHERE document_id = NEW.document_id)
+    );
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Извлечение текста файла (или его удаление при замене файла)
+CREATE OR REPLACE FUNCTION document_text_changed()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_document_id INT := CASE WHEN TG_OP = 'DELETE' THEN OLD.document_id ELSE NEW.document_id END;
+BEGIN
+    UPDATE documents
+    SET search_vector = document_search_vector(
+        file_name, description,
+        CASE WHEN TG_OP = 'DELETE' THEN NULL ELSE NEW.content_text END
+    )
+    WHERE document_id = v_document_id;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+DROP TRIGGER IF EXISTS trigger_document_search_vector ON documents;
+CREATE TRIGGER trigger_document_search_vector
+    BEFORE INSERT OR UPDATE OF file_name, description ON documents
+    FOR EACH ROW
+    EXECUTE FUNCTION update_document_search_vector();
+
+DROP TRIGGER IF EXISTS trigger_document_text_changed ON document_texts;
+CREATE TRIGGER trigger_document_text_changed
+    AFTER INSERT OR UPDATE OR DELETE ON document_texts
+    FOR EACH ROW
+    EXECUTE FUNCTION document_text_changed();
+
+-- Заполнение для существующих документов (текст файлов извлекается задачей process_upload)
+UPDATE documents SET search_vector = document_search_vector(file_name, description, NULL)
+WHERE search_vector IS NULL;
+
+-- documents.search_vector ведут триггеры (Trigger.sql), поиск - documents/search.py
+CREATE INDEX IF NOT EXISTS idx_documents_search ON documents USING GIN (search_vector);
+
+-- ================================ ПОДСКАЗКИ В ФОРМАХ =====================
+-- Поиск полисов и сотрудников по префиксу вместо полных выпадающих списков
+CREATE INDEX IF NOT EXISTS idx_policies_number_prefix ON policies (upper(policy_number) text_pattern_ops);
+CREATE INDEX IF NOT EXISTS idx_employees_full_name_prefix ON employees (lower(full_name) text_pattern_ops);
+
+-- ================================ МЕТАДАННЫЕ СХЕМЫ =======================
+-- Изменение таблиц (DDL) - сигнал сбросить кэш метаданных схемы
+-- редактора таблиц в процессах приложения (database/schema.py).
+-- Создание событийного триггера требует прав суперпользователя.
+CREATE OR REPLACE FUNCTION notify_schema_change()
+RETURNS event_trigger AS $$
+BEGIN
+    PERFORM pg_notify('schema_changes', TG_TAG);
+END;
+$$ LANGUAGE plpgsql;
+
+DROP EVENT TRIGGER IF EXISTS trigger_schema_change;
+CREATE EVENT TRIGGER trigger_schema_change
+    ON ddl_command_end
+    WHEN TAG IN ('CREATE TABLE', 'ALTER TABLE', 'DROP TABLE')
+    EXECUTE FUNCTION notify_schema_change();
@@ -29,6 +29,10 @@ GRANT department_manager TO grigoryev_dv;
 GRANT auditor TO afanasiev_vv;
 GRANT public_users TO user_public;
 
+-- Пользователь веб-приложения (Config.DB_USER) должен состоять во всех ролях,
+-- чтобы выполнять запросы под ролью пользователя через SET ROLE (DB_ROLE_SESSIONS)
+-- GRANT company_director, department_manager, employee, hr_manager, auditor, db_admin TO <пользователь приложения>;
+
 -- ================================ ПРЕДСТАВЛЕНИЯ =========================
 
 -- Представление для сотрудников - просмотр и редактирование полисов
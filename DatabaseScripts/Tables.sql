@@ -8,6 +8,12 @@ DROP TABLE IF EXISTS policies CASCADE;
 DROP TABLE IF EXISTS documents CASCADE;
 DROP TABLE IF EXISTS notifications CASCADE;
 DROP TABLE IF EXISTS user_roles CASCADE;
+DROP TABLE IF EXISTS dashboard_counters CASCADE;
+DROP TABLE IF EXISTS notification_counters CASCADE;
+DROP TABLE IF EXISTS jobs CASCADE;
+DROP TABLE IF EXISTS document_blobs CASCADE;
+DROP TABLE IF EXISTS document_files CASCADE;
+DROP TABLE IF EXISTS document_texts CASCADE;
 
 
 -- отделs компании
@@ -26,6 +32,7 @@ CREATE TABLE employees (
     email VARCHAR(100) UNIQUE NOT NULL,
 	
     -- Поля для системы аутентификации
+    login_name VARCHAR(100) UNIQUE, -- Имя пользователя PostgreSQL (уникальный индекс для входа)
     is_active BOOLEAN DEFAULT TRUE,
     created_at TIMESTAMPTZ DEFAULT NOW(),
     updated_at TIMESTAMPTZ DEFAULT NOW()
@@ -114,7 +121,9 @@ CREATE TABLE documents (
 	-- Описание документа
     file_name VARCHAR(500) NOT NULL, 
     description TEXT,
-    stored_file_path TEXT NOT NULL UNIQUE, -- Путь к файлу в файловой системе / S3 хранилище
+    stored_file_path TEXT NOT NULL, -- Путь к файлу в файловой системе / S3 хранилище
+    content_hash CHAR(64), -- SHA-256 файла в хранилище (NULL - файл старого формата)
+    search_vector tsvector, -- Полнотекстовый поиск, ведется триггерами (Trigger.sql)
     file_size BIGINT, -- Размер файла в байтах
     --mime_type VARCHAR(100), -- MIME-тип
     
@@ -127,8 +136,117 @@ CREATE TABLE documents (
 CREATE TABLE notifications (
     notification_id SERIAL PRIMARY KEY,
     document_id INT NOT NULL REFERENCES documents(document_id) ON DELETE CASCADE,
+    recipient_id INT NOT NULL REFERENCES employees(employee_id) ON DELETE CASCADE, -- Кому адресовано (автор документа)
     changed_by_employee_id INT NOT NULL REFERENCES employees(employee_id) ON DELETE CASCADE,
     change_description TEXT, -- 'Было изменено поле X'
-    created_at TIMESTAMPTZ DEFAULT NOW()
+    is_read BOOLEAN NOT NULL DEFAULT FALSE,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
 );
 
+-- Лента уведомлений получателя и выборка непрочитанных
+CREATE INDEX idx_notifications_recipient_feed ON notifications (recipient_id, created_at DESC, notification_id DESC);
+CREATE INDEX idx_notifications_recipient_unread ON notifications (recipient_id, is_read, created_at DESC, notification_id DESC);
+
+-- Количество непрочитанных уведомлений, поддерживается триггером (Trigger.sql)
+CREATE TABLE notification_counters (
+    recipient_id INT PRIMARY KEY REFERENCES employees(employee_id) ON DELETE CASCADE,
+    unread BIGINT NOT NULL DEFAULT 0
+);
+
+-- ================================ ИНДЕКСЫ СПИСКОВ =======================
+-- Колонки сортировки постраничного вывода (keyset-пагинация): последняя
+-- колонка делает порядок однозначным, страница читается по индексу
+CREATE INDEX idx_clients_full_name ON clients (full_name, client_id);
+CREATE INDEX idx_clients_created_at ON clients (created_at, client_id);
+CREATE INDEX idx_employees_full_name ON employees (full_name, employee_id);
+CREATE INDEX idx_employees_created_at ON employees (created_at, employee_id);
+CREATE INDEX idx_policies_start_date ON policies (start_date, policy_id);
+CREATE INDEX idx_documents_created_at ON documents (created_at, document_id);
+
+-- Подсказки в формах (поиск по префиксу без учета регистра, см. database/reference_data.py)
+CREATE INDEX idx_policies_number_prefix ON policies (upper(policy_number) text_pattern_ops);
+CREATE INDEX idx_employees_full_name_prefix ON employees (lower(full_name) text_pattern_ops);
+
+-- ================================ СЧЕТЧИКИ ДАШБОРДОВ =====================
+-- Количество строк основных таблиц, поддерживается триггерами (Trigger.sql).
+-- department_id = 0 - общий итог, иначе - значение по отделу.
+CREATE TABLE dashboard_counters (
+    metric VARCHAR(50) NOT NULL, -- 'employees', 'employees_active', 'clients', 'policies', 'documents', 'documents_public'
+    department_id INT NOT NULL DEFAULT 0,
+    value BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMPTZ DEFAULT NOW(),
+    PRIMARY KEY (metric, department_id)
+);
+
+-- ================================ ИНДЕКСЫ ДОСТУПА К ДОКУМЕНТАМ ============
+-- Условие доступа (documents/access_control.py) - OR из веток по отделу,
+-- автору и уровню конфиденциальности; каждая ветка читается своим индексом
+CREATE INDEX idx_documents_dept_level_created ON documents (created_in_department_id, confidentiality_level, created_at);
+CREATE INDEX idx_documents_created_by ON documents (created_by_employee_id);
+CREATE INDEX idx_documents_level_created ON documents (confidentiality_level, created_at);
+
+-- ================================ ФОНОВЫЕ ЗАДАЧИ ==========================
+-- Очередь задач для фонового обработчика (python -m tasks.worker).
+-- Задачи забираются через FOR UPDATE SKIP LOCKED, неудачные повторяются с задержкой.
+CREATE TABLE jobs (
+    job_id BIGSERIAL PRIMARY KEY,
+    kind VARCHAR(50) NOT NULL, -- 'delete_file', 'delete_blob', 'process_upload'
+    payload JSONB NOT NULL DEFAULT '{}',
+    status VARCHAR(20) NOT NULL DEFAULT 'pending' CHECK (status IN ('pending', 'running', 'done', 'failed')),
+    attempts INT NOT NULL DEFAULT 0,
+    max_attempts INT NOT NULL DEFAULT 5,
+    run_at TIMESTAMPTZ NOT NULL DEFAULT NOW(), -- Не раньше этого времени
+    locked_at TIMESTAMPTZ,
+    last_error TEXT,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    finished_at TIMESTAMPTZ
+);
+
+-- Выборка готовых к выполнению задач
+CREATE INDEX idx_jobs_pending ON jobs (run_at, job_id) WHERE status = 'pending';
+-- Поиск зависших задач
+CREATE INDEX idx_jobs_running ON jobs (locked_at) WHERE status = 'running';
+
+-- ================================ ХРАНИЛИЩЕ ФАЙЛОВ ========================
+-- Файлы документов хранятся по SHA-256 (documents/blob_store.py), одинаковые
+-- файлы - один раз. Число документов, ссылающихся на файл, ведет триггер
+-- count_document_blobs (Trigger.sql); документы старого формата (content_hash IS NULL) не учитываются.
+CREATE TABLE document_blobs (
+    content_hash CHAR(64) PRIMARY KEY,
+    ref_count INT NOT NULL DEFAULT 0,
+    byte_size BIGINT,
+    released_at TIMESTAMPTZ, -- Когда счетчик стал нулевым
+    last_used_at TIMESTAMPTZ -- Последняя загрузка файла (store_upload); delete_blob не трогает недавно загруженные
+);
+
+-- Проверка ссылок на файл старого формата перед удалением (задача delete_file)
+CREATE INDEX idx_documents_stored_file_path ON documents (stored_file_path);
+
+-- ================================ ИНДЕКС ФАЙЛОВ ===========================
+-- Файлы хранилища (documents/file_index.py): поиск файла - запрос по индексу
+-- вместо перебора папок. Обновляется при сохранении и удалении файлов,
+-- сверяется с диском командой python -m documents.reconcile.
+CREATE TABLE document_files (
+    path TEXT PRIMARY KEY, -- Путь относительно папки загрузок (как documents.stored_file_path)
+    file_name TEXT NOT NULL, -- Имя файла без папки
+    size BIGINT NOT NULL,
+    mtime TIMESTAMPTZ,
+    content_hash CHAR(64),
+    indexed_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX idx_document_files_file_name ON document_files (file_name);
+CREATE INDEX idx_document_files_content_hash ON document_files (content_hash);
+
+-- ================================ ПОЛНОТЕКСТОВЫЙ ПОИСК ===================
+-- Текст, извлеченный из файла документа фоновой задачей process_upload
+-- (documents/text_extraction.py). Хранится отдельно, чтобы не увеличивать
+-- строки documents, читаемые списками.
+CREATE TABLE document_texts (
+    document_id INT PRIMARY KEY REFERENCES documents(document_id) ON DELETE CASCADE,
+    content_text TEXT NOT NULL,
+    extracted_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- documents.search_vector ведут триггеры (Trigger.sql), поиск - documents/search.py
+CREATE INDEX idx_documents_search ON documents USING GIN (search_vector);
@@ -6,18 +6,18 @@ INSERT INTO departments (name, manager_id) VALUES
 ('Отдел безопасности', NULL);     -- department_id = 4
 
 -- 2. Вставляем сотрудников (пароль: '123456' в bcrypt хэше)
-INSERT INTO employees (full_name, department_id, phone, email) VALUES
+INSERT INTO employees (full_name, department_id, phone, email, login_name) VALUES
 -- Руководство
-('Иванов Иван Иванович', 1, '79101112233', 'director@company.ru'),
+('Иванов Иван Иванович', 1, '79101112233', 'director@company.ru', 'ivanov_ii'),
 -- Отдел продаж
-('Петрова Елена Сергеевна', 2, '79112223344', 'petrova@company.ru'),
-('Сидоров Алексей Дмитриевич', 2, '79113334455', 'sidorov@company.ru'),
-('Козлова Мария Викторовна', 2, '79114445566', 'kozlova@company.ru'),
+('Петрова Елена Сергеевна', 2, '79112223344', 'petrova@company.ru', 'petrova_es'),
+('Сидоров Алексей Дмитриевич', 2, '79113334455', 'sidorov@company.ru', 'sidorov_ad'),
+('Козлова Мария Викторовна', 2, '79114445566', 'kozlova@company.ru', 'kozlova_mv'),
 -- HR отдел
-('Васильева Анна Михайловна', 3, '79117778899', 'vasilyeva@company.ru'),
+('Васильева Анна Михайловна', 3, '79117778899', 'vasilyeva@company.ru', 'vasilyeva_am'),
 -- Отдел безопасности
-('Григорьев Денис Владимирович', 4, '79118889900', 'grigoryev@company.ru'),
-('Афанасьев Владимир Владимирович', 4, '79118889100', 'afanasiev@company.ru');
+('Григорьев Денис Владимирович', 4, '79118889900', 'grigoryev@company.ru', 'grigoryev_dv'),
+('Афанасьев Владимир Владимирович', 4, '79118889100', 'afanasiev@company.ru', 'afanasiev_vv');
 
 -- 3. Обновляем начальников отделов
 UPDATE departments SET manager_id = 1 WHERE department_id = 1; -- Иванов - руководитель
@@ -66,21 +66,21 @@ INSERT INTO policies (status_id, created_by_employee_id, created_in_department_i
 -- 8. Вставляем документы с разными уровнями конфиденциальности
 INSERT INTO documents (policy_id, created_by_employee_id, created_in_department_id, file_name, description, stored_file_path, file_size, confidentiality_level) VALUES
 -- Публичные документы (confidentiality_level = 0)
-(NULL, 1, 1, 'Правила страхования.pdf', 'Публичные правила страхования ОСАГО', '/docs/public/rules_osago.pdf', 2048576, 0),
-(NULL, 1, 1, 'Тарифы 2024.pdf', 'Публичные тарифы на 2024 год', '/docs/public/tariffs_2025.pdf', 1536890, 0),
+(NULL, 1, 1, 'Правила страхования.pdf', 'Публичные правила страхования ОСАГО', 'public/rules_osago.pdf', 2048576, 0),
+(NULL, 1, 1, 'Тарифы 2024.pdf', 'Публичные тарифы на 2024 год', 'public/tariffs_2025.pdf', 1536890, 0),
 
 -- Документы ДСП отдела продаж (confidentiality_level = 1)
-(NULL, 3, 2, 'Расписание смен сотрудников.pdf', 'Детальное описание рабочего времени сотрудников', '/docs/sales/policy_001.pdf', 3456789, 1),
-(NULL, 3, 2, 'План показателей для сотрудников.pdf', 'Информация о базовой ставке и надбавках', '/docs/sales/policy_002.pdf', 2987654, 1),
+(NULL, 3, 2, 'Расписание смен сотрудников.pdf', 'Детальное описание рабочего времени сотрудников', 'department_2/policy_001.pdf', 3456789, 1),
+(NULL, 3, 2, 'План показателей для сотрудников.pdf', 'Информация о базовой ставке и надбавках', 'department_2/policy_002.pdf', 2987654, 1),
 
 -- Документы только для начальников (confidentiality_level = 2)
-(NULL, 1, 1, 'Финансовый отчет 2025.xlsx', 'Годовой финансовый отчет', '/docs/confidential/fin_report.xlsx', 5678901, 2),
-(NULL, 1, 1, 'Стратегия развития.pdf', 'Стратегия развития компании на 2025-2030', '/docs/confidential/strategy.pdf', 4456789, 2),
-(NULL, 2, 2, 'План продаж.xlsx', 'План продаж на следующий квартал', '/docs/confidential/sales_plan.xlsx', 2345678, 2);
+(NULL, 1, 1, 'Финансовый отчет 2025.xlsx', 'Годовой финансовый отчет', 'department_1/fin_report.xlsx', 5678901, 2),
+(NULL, 1, 1, 'Стратегия развития.pdf', 'Стратегия развития компании на 2025-2030', 'department_1/strategy.pdf', 4456789, 2),
+(NULL, 2, 2, 'План продаж.xlsx', 'План продаж на следующий квартал', 'department_2/sales_plan.xlsx', 2345678, 2);
 
 -- 9. Вставляем несколько уведомлений
-INSERT INTO notifications (document_id, changed_by_employee_id, change_description) VALUES
-(3, 2, 'Была исправлена стоимость полиса'),
-(6, 1, 'Добавлены новые условия страхования'),
+INSERT INTO notifications (document_id, recipient_id, changed_by_employee_id, change_description) VALUES
+(3, 3, 2, 'Была исправлена стоимость полиса'),
+(6, 1, 1, 'Добавлены новые условия страхования'),
 
-(7, 1, 'Обновлены финансовые показатели');
+(7, 2, 1, 'Обновлены финансовые показатели');
@@ -1,20 +1,313 @@
--- Триггер для уведомлений при изменении документа
+-- Триггер для уведомлений при изменении документа.
+-- Изменившего сотрудника приложение передает через set_config('app.current_user_id')
+-- в той же транзакции. Уведомление сохраняется для автора документа и сразу
+-- отправляется слушателям канала document_notifications (pg_notify).
 CREATE OR REPLACE FUNCTION notify_document_change()
 RETURNS TRIGGER AS $$
+DECLARE
+    v_changed_by INT := NULLIF(current_setting('app.current_user_id', true), '')::INT;
+    v_changed_by_name TEXT;
+    v_description TEXT;
+    v_notification_id INT;
 BEGIN
-    IF TG_OP = 'UPDATE' THEN
-        INSERT INTO notifications (document_id, changed_by_employee_id, change_description)
-        VALUES (
-            NEW.document_id,
-            current_setting('app.current_user_id')::INT,
-            format('Документ "%s" был изменен сотрудником %s', NEW.title, current_setting('app.current_user_name'))
-        );
+    -- Изменения вне приложения и правки самого автора не уведомляются
+    IF v_changed_by IS NULL OR v_changed_by = NEW.created_by_employee_id OR NEW IS NOT DISTINCT FROM OLD THEN
+        RETURN NEW;
     END IF;
+
+    SELECT full_name INTO v_changed_by_name FROM employees WHERE employee_id = v_changed_by;
+    v_description := format('Документ ''%s'' был изменен пользователем %s.',
+                            NEW.file_name, COALESCE(v_changed_by_name, 'Неизвестный пользователь'));
+    IF NEW.stored_file_path IS DISTINCT FROM OLD.stored_file_path THEN
+        v_description := v_description || ' Файл заменен.';
+    END IF;
+
+    INSERT INTO notifications (document_id, recipient_id, changed_by_employee_id, change_description)
+    VALUES (NEW.document_id, NEW.created_by_employee_id, v_changed_by, v_description)
+    RETURNING notification_id INTO v_notification_id;
+
+    PERFORM pg_notify('document_notifications', json_build_object(
+        'notification_id', v_notification_id,
+        'recipient_id', NEW.created_by_employee_id,
+        'document_id', NEW.document_id,
+        'file_name', NEW.file_name,
+        'change_description', v_description,
+        'changed_by_name', v_changed_by_name
+    )::text);
     RETURN NEW;
 END;
-$$ LANGUAGE plpgsql;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
 
 CREATE TRIGGER trigger_document_change_notification
     AFTER UPDATE ON documents
     FOR EACH ROW
-    EXECUTE FUNCTION notify_document_change();
\ No newline at end of file
+    EXECUTE FUNCTION notify_document_change();
+
+-- ================================ СЧЕТЧИКИ ДАШБОРДОВ =====================
+-- Инкрементальное обновление dashboard_counters вместо COUNT(*) на каждый
+-- просмотр дашборда. SECURITY DEFINER: счетчики обновляются и при изменениях
+-- под ролями без прав на dashboard_counters.
+CREATE OR REPLACE FUNCTION bump_dashboard_counter(p_metric TEXT, p_department_id INT, p_delta BIGINT)
+RETURNS VOID AS $$
+BEGIN
+    INSERT INTO dashboard_counters (metric, department_id, value)
+    VALUES (p_metric, p_department_id, p_delta)
+    ON CONFLICT (metric, department_id)
+    DO UPDATE SET value = dashboard_counters.value + EXCLUDED.value, updated_at = NOW();
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+CREATE OR REPLACE FUNCTION count_employees_change()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'UPDATE'
+       AND OLD.department_id IS NOT DISTINCT FROM NEW.department_id
+       AND (OLD.is_active IS TRUE) = (NEW.is_active IS TRUE) THEN
+        RETURN NULL;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM bump_dashboard_counter('employees', 0, -1);
+        PERFORM bump_dashboard_counter('employees', OLD.department_id, -1);
+        IF OLD.is_active IS TRUE THEN
+            PERFORM bump_dashboard_counter('employees_active', 0, -1);
+        END IF;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM bump_dashboard_counter('employees', 0, 1);
+        PERFORM bump_dashboard_counter('employees', NEW.department_id, 1);
+        IF NEW.is_active IS TRUE THEN
+            PERFORM bump_dashboard_counter('employees_active', 0, 1);
+        END IF;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+CREATE OR REPLACE FUNCTION count_clients_change()
+RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM bump_dashboard_counter('clients', 0, CASE WHEN TG_OP = 'INSERT' THEN 1 ELSE -1 END);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+CREATE OR REPLACE FUNCTION count_policies_change()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'UPDATE' AND OLD.created_in_department_id = NEW.created_in_department_id THEN
+        RETURN NULL;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM bump_dashboard_counter('policies', 0, -1);
+        PERFORM bump_dashboard_counter('policies', OLD.created_in_department_id, -1);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM bump_dashboard_counter('policies', 0, 1);
+        PERFORM bump_dashboard_counter('policies', NEW.created_in_department_id, 1);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+CREATE OR REPLACE FUNCTION count_documents_change()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'UPDATE'
+       AND OLD.created_in_department_id = NEW.created_in_department_id
+       AND (OLD.confidentiality_level < 2) = (NEW.confidentiality_level < 2) THEN
+        RETURN NULL;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM bump_dashboard_counter('documents', 0, -1);
+        PERFORM bump_dashboard_counter('documents', OLD.created_in_department_id, -1);
+        IF OLD.confidentiality_level < 2 THEN
+            PERFORM bump_dashboard_counter('documents_public', 0, -1);
+        END IF;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM bump_dashboard_counter('documents', 0, 1);
+        PERFORM bump_dashboard_counter('documents', NEW.created_in_department_id, 1);
+        IF NEW.confidentiality_level < 2 THEN
+            PERFORM bump_dashboard_counter('documents_public', 0, 1);
+        END IF;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+-- Полный пересчет (после TRUNCATE, массовой загрузки или для сверки)
+CREATE OR REPLACE FUNCTION refresh_dashboard_counters()
+RETURNS VOID AS $$
+BEGIN
+    LOCK TABLE employees, clients, policies, documents IN SHARE MODE;
+    DELETE FROM dashboard_counters;
+    INSERT INTO dashboard_counters (metric, department_id, value)
+    SELECT 'employees', 0, COUNT(*) FROM employees
+    UNION ALL
+    SELECT 'employees', department_id, COUNT(*) FROM employees GROUP BY department_id
+    UNION ALL
+    SELECT 'employees_active', 0, COUNT(*) FROM employees WHERE is_active = true
+    UNION ALL
+    SELECT 'clients', 0, COUNT(*) FROM clients
+    UNION ALL
+    SELECT 'policies', 0, COUNT(*) FROM policies
+    UNION ALL
+    SELECT 'policies', created_in_department_id, COUNT(*) FROM policies GROUP BY created_in_department_id
+    UNION ALL
+    SELECT 'documents', 0, COUNT(*) FROM documents
+    UNION ALL
+    SELECT 'documents', created_in_department_id, COUNT(*) FROM documents GROUP BY created_in_department_id
+    UNION ALL
+    SELECT 'documents_public', 0, COUNT(*) FROM documents WHERE confidentiality_level < 2;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+CREATE TRIGGER trigger_count_employees
+    AFTER INSERT OR UPDATE OR DELETE ON employees
+    FOR EACH ROW
+    EXECUTE FUNCTION count_employees_change();
+
+CREATE TRIGGER trigger_count_clients
+    AFTER INSERT OR DELETE ON clients
+    FOR EACH ROW
+    EXECUTE FUNCTION count_clients_change();
+
+CREATE TRIGGER trigger_count_policies
+    AFTER INSERT OR UPDATE OR DELETE ON policies
+    FOR EACH ROW
+    EXECUTE FUNCTION count_policies_change();
+
+CREATE TRIGGER trigger_count_documents
+    AFTER INSERT OR UPDATE OR DELETE ON documents
+    FOR EACH ROW
+    EXECUTE FUNCTION count_documents_change();
+
+
+-- ================================ НЕПРОЧИТАННЫЕ УВЕДОМЛЕНИЯ ==============
+-- Счетчик непрочитанных по получателю: значок в шапке читает одну строку
+CREATE OR REPLACE FUNCTION count_notifications_change()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') AND NOT OLD.is_read THEN
+        UPDATE notification_counters SET unread = unread - 1 WHERE recipient_id = OLD.recipient_id;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') AND NOT NEW.is_read THEN
+        INSERT INTO notification_counters (recipient_id, unread)
+        VALUES (NEW.recipient_id, 1)
+        ON CONFLICT (recipient_id)
+        DO UPDATE SET unread = notification_counters.unread + 1;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+CREATE TRIGGER trigger_count_notifications
+    AFTER INSERT OR DELETE OR UPDATE OF is_read, recipient_id ON notifications
+    FOR EACH ROW
+    EXECUTE FUNCTION count_notifications_change();
+
+
+-- ================================ ХРАНИЛИЩЕ ФАЙЛОВ ========================
+-- Счетчик ссылок на файлы хранилища. Когда ссылок не осталось, ставится
+-- задача delete_blob с задержкой (Config.BLOB_GC_DELAY): за это время
+-- загрузка того же файла успеет снова на него сослаться.
+CREATE OR REPLACE FUNCTION count_document_blobs()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_ref_count INT;
+BEGIN
+    IF TG_OP = 'UPDATE' AND OLD.content_hash IS NOT DISTINCT FROM NEW.content_hash THEN
+        RETURN NULL;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') AND NEW.content_hash IS NOT NULL THEN
+        INSERT INTO document_blobs (content_hash, ref_count, byte_size)
+        VALUES (NEW.content_hash, 1, NEW.file_size)
+        ON CONFLICT (content_hash)
+        DO UPDATE SET ref_count = document_blobs.ref_count + 1, released_at = NULL;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') AND OLD.content_hash IS NOT NULL THEN
+        UPDATE document_blobs
+        SET ref_count = ref_count - 1,
+            released_at = CASE WHEN ref_count = 1 THEN NOW() END
+        WHERE content_hash = OLD.content_hash
+        RETURNING ref_count INTO v_ref_count;
+        IF v_ref_count = 0 THEN
+            INSERT INTO jobs (kind, payload, run_at)
+            VALUES ('delete_blob', json_build_object('content_hash', OLD.content_hash), NOW() + INTERVAL '600 seconds');
+        END IF;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+CREATE TRIGGER trigger_count_document_blobs
+    AFTER INSERT OR DELETE OR UPDATE OF content_hash ON documents
+    FOR EACH ROW
+    EXECUTE FUNCTION count_document_blobs();
+
+
+-- ================================ ПОЛНОТЕКСТОВЫЙ ПОИСК ===================
+-- Поисковый вектор документа: название (вес A), описание (B), текст файла (C)
+CREATE OR REPLACE FUNCTION document_search_vector(p_file_name TEXT, p_description TEXT, p_content TEXT)
+RETURNS tsvector AS $$
+    SELECT setweight(to_tsvector('russian', COALESCE(p_file_name, '')), 'A')
+        || setweight(to_tsvector('russian', COALESCE(p_description, '')), 'B')
+        || setweight(to_tsvector('russian', COALESCE(p_content, '')), 'C');
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Изменение названия или описания документа
+CREATE OR REPLACE FUNCTION update_document_search_vector()
+RETURNS TRIGGER AS $$
+BEGIN
+    NEW.search_vector := document_search_vector(
+        NEW.file_name, NEW.description,
+        (SELECT content_text FROM document_texts WHERE document_id = NEW.document_id)
+    );
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Извлечение текста файла (или его удаление при замене файла)
+CREATE OR REPLACE FUNCTION document_text_changed()
+RETURNS TRIGGER AS $$
+DECLARE
+    v_document_id INT := CASE WHEN TG_OP = 'DELETE' THEN OLD.document_id ELSE NEW.document_id END;
+BEGIN
+    UPDATE documents
+    SET search_vector = document_search_vector(
+        file_name, description,
+        CASE WHEN TG_OP = 'DELETE' THEN NULL ELSE NEW.content_text END
+    )
+    WHERE document_id = v_document_id;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER;
+
+CREATE TRIGGER trigger_document_search_vector
+    BEFORE INSERT OR UPDATE OF file_name, description ON documents
+    FOR EACH ROW
+    EXECUTE FUNCTION update_document_search_vector();
+
+CREATE TRIGGER trigger_document_text_changed
+    AFTER INSERT OR UPDATE OR DELETE ON document_texts
+    FOR EACH ROW
+    EXECUTE FUNCTION document_text_changed();
+
+-- ================================ МЕТАДАННЫЕ СХЕМЫ =======================
+-- Изменение таблиц (DDL) - сигнал сбросить кэш метаданных схемы
+-- редактора таблиц в процессах приложения (database/schema.py).
+-- Создание событийного триггера требует прав суперпользователя.
+CREATE OR REPLACE FUNCTION notify_schema_change()
+RETURNS event_trigger AS $$
+BEGIN
+    PERFORM pg_notify('schema_changes', TG_TAG);
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE EVENT TRIGGER trigger_schema_change
+    ON ddl_command_end
+    WHEN TAG IN ('CREATE TABLE', 'ALTER TABLE', 'DROP TABLE')
+    EXECUTE FUNCTION notify_schema_change();
+
+-- Начальные значения счетчиков дашбордов по уже загруженным данным
+SELECT refresh_dashboard_counters();
@@ -1,23 +1,43 @@
-from flask import Flask, render_template, session, request, redirect, url_for, send_from_directory, send_file
+from flask import Flask, render_template, session, request, redirect, url_for, send_from_directory, send_file, jsonify, Response
 from config import Config
 from auth.decorators import login_required, role_required
+from auth.identity import resolve_identity, store_user_context, get_user_context, invalidate_user_context
 from database.db import execute_query
 import psycopg2
 import time
-from database.db import get_db_connection, execute_query
+from database.db import (
+    execute_query, execute_role_query,
+    init_db_pool, get_pool_stats, get_session_db_role, transaction
+)
+from database.pagination import paginate
+from database.export import export_response
+from database.stats import get_company_stats, get_department_stats, invalidate_stats
+from database.reference_data import get_departments, invalidate_reference_data, search_policies, search_employees
+from database.schema import get_table_schema, get_primary_key_column, invalidate_schema, coerce_value
+from database.bulk_import import IMPORT_TABLES, import_file, get_import_format
+from database.batch import FILTER_OPERATORS, batch_update, batch_update_rows, batch_delete
 
 
 # Добавляем импорты для Документов и
 from documents.access_control import (
-    get_user_department, get_documents_for_user, get_document_by_id, 
-    check_document_access, can_edit_document, can_delete_document
+    get_documents_for_user, get_document_by_id, 
+    check_document_access, can_edit_document, can_delete_document, DOCUMENT_COLUMNS
+)
+from documents.notifications import (
+    get_user_notifications, get_unread_count, mark_notifications_as_read
 )
-from documents.notifications import create_notification, get_user_notifications
+from documents.realtime import event_stream
+from tasks.queue import enqueue_job
+from documents.uploads import UploadRequest, HashingUploadFile, spool_stream, get_upload_quota
+from documents.downloads import send_document_file
+from documents.previews import get_preview, get_preview_version
+from documents.search import search_documents
+from documents.storage_layout import get_layout
+from documents.storage_backends import get_storage
 # В начале файла app.py
 from documents.file_storage import (
     save_document_file, 
-    get_document_file_path, 
-    delete_document_file, find_document_file, update_document_safely, get_upload_folder,
+    update_document_safely, 
     document_file_exists 
 )
 from config import allowed_file
@@ -26,6 +46,11 @@ import os
 
 app = Flask(__name__)
 app.config.from_object(Config)
+# Загружаемые файлы пишутся на диск потоком с проверкой лимита роли
+app.request_class = UploadRequest
+init_db_pool(app)
+# Папка загрузок создается и проверяется один раз при запуске
+get_layout().validate()
 
 
 
@@ -41,143 +66,12 @@ failed_attempts = {}
 
 def is_employee(username):
     """Проверяет, является ли пользователь сотрудником компании"""
-    try:
-        # Для пользователей с ролью db_admin создаем специальную запись
-        roles_query = """
-            SELECT r.rolname 
-            FROM pg_roles r
-            JOIN pg_auth_members am ON r.oid = am.roleid
-            JOIN pg_user u ON u.usesysid = am.member
-            WHERE u.usename = %s
-        """
-        roles = execute_query(roles_query, (username,))
-        
-        if roles:
-            role_names = [role['rolname'] for role in roles]
-            
-            # Если пользователь db_admin, создаем специальную запись
-            if 'db_admin' in role_names:
-                return {
-                    'employee_id': 0,  # Специальный ID для db_admin
-                    'full_name': 'Администратор БД',
-                    'email': f"{username}@company.ru",
-                    'is_active': True
-                }
-        
-        # Для остальных пользователей ищем в таблице employees
-        employee_query = """
-            SELECT employee_id, full_name, email, is_active 
-            FROM employees 
-            WHERE (
-                -- Ищем по начальной части email (до @)
-                SPLIT_PART(email, '@', 1) = %s
-                OR
-                -- Или по начальной части username (до _)
-                SPLIT_PART(email, '@', 1) = SPLIT_PART(%s, '_', 1)
-                OR
-                -- Или username содержится в email
-                email ILIKE %s
-            ) AND is_active = true
-            LIMIT 1
-        """
-        search_pattern = f"%{username}%"
-        employee_data = execute_query(employee_query, (username, username, search_pattern))
-        
-        if employee_data:
-            return employee_data[0]
-        
-        # Если не нашли, но пользователь имеет другие роли сотрудника
-        role_check_query = """
-            SELECT EXISTS(
-                SELECT 1 
-                FROM pg_roles r
-                JOIN pg_auth_members am ON r.oid = am.roleid
-                JOIN pg_user u ON u.usesysid = am.member
-                WHERE u.usename = %s 
-                AND r.rolname IN ('company_director', 'hr_manager', 'department_manager', 'auditor', 'employee')
-            ) as has_employee_role
-        """
-        role_check = execute_query(role_check_query, (username,))
-        
-        if role_check and role_check[0]['has_employee_role']:
-            # Возвращаем первого активного сотрудника как fallback
-            any_employee_query = """
-                SELECT employee_id, full_name, email, is_active 
-                FROM employees 
-                WHERE is_active = true
-                LIMIT 1
-            """
-            any_employee = execute_query(any_employee_query)
-            if any_employee:
-                return any_employee[0]
-        
-        return None
-        
-    except Exception as e:
-        print(f"Error checking employee: {e}")
-        return None
+    identity = resolve_identity(username)
+    return identity['employee'] if identity else None
 
 def get_user_role_db(username):
-    try:
-        # Сначала проверяем PostgreSQL роли
-        roles_query = """
-            SELECT r.rolname 
-            FROM pg_roles r
-            JOIN pg_auth_members am ON r.oid = am.roleid  
-            JOIN pg_user u ON u.usesysid = am.member
-            WHERE u.usename = %s
-            AND r.rolname IN ('company_director', 'hr_manager', 'department_manager', 'auditor', 'db_admin', 'employee')
-        """
-        roles = execute_query(roles_query, (username,))
-        
-        if roles:
-            role_names = [role['rolname'] for role in roles]
-            
-            # grigoryev_dv имеет роль auditor, но он начальник отдела безопасности
-            # Проверяем является ли пользователь начальником отдела
-            if 'auditor' in role_names:
-                # Проверяем, является ли этот пользователь начальником какого-либо отдела
-                manager_check = execute_query("""
-                    SELECT department_id FROM departments WHERE manager_id = (
-                        SELECT employee_id FROM employees WHERE email ILIKE %s
-                    )
-                """, (f"%{username}%",))
-                
-                if manager_check:
-                    # Если он начальник отдела, возвращаем department_manager
-                    return 'department_manager'
-            
-            # Возвращаем первую найденную роль
-            for role_name in ['company_director', 'hr_manager', 'department_manager', 'auditor', 'db_admin', 'employee']:
-                if role_name in role_names:
-                    return role_name
-        
-        # Fallback: проверяем по данным employees
-        employee_role_query = """
-            SELECT 
-                CASE 
-                    WHEN e.employee_id = d.manager_id AND d.department_id = 1 THEN 'company_director'
-                    WHEN e.employee_id = d.manager_id THEN 'department_manager'  -- Начальник любого отдела
-                    WHEN e.department_id = 3 THEN 'hr_manager'
-                    WHEN e.department_id = 4 THEN 'auditor'  -- Сотрудник отдела безопасности
-                    ELSE 'employee'
-                END as role
-            FROM employees e
-            LEFT JOIN departments d ON e.department_id = d.department_id
-            WHERE (e.email ILIKE %s OR e.email ILIKE %s) AND e.is_active = true
-        """
-        search_pattern = f"%{username}%"
-        role_data = execute_query(employee_role_query, (search_pattern, f"{username}@company.ru"))
-        
-        if role_data and role_data[0]['role']:
-            return role_data[0]['role']
-        
-        # Fallback для неизвестных пользователей
-        return 'employee'
-            
-    except Exception as e:
-        print(f"Error getting user role: {e}")
-        return 'employee'
+    identity = resolve_identity(username)
+    return identity['role'] if identity and identity['role'] else 'employee'
     
 def validate_username(username):
     import re
@@ -249,25 +143,22 @@ def login_post():
             update_failed_attempts(username)
             return redirect(url_for('login', error='invalid_credentials'))
         
-        # 2. Проверяем, является ли пользователь сотрудником
-        employee_data = is_employee(username)
+        # 2. Определяем сотрудника, роль и отдел одним запросом
+        identity = resolve_identity(username)
+        employee_data = identity['employee'] if identity else None
         
         if not employee_data:
             update_failed_attempts(username)
             return redirect(url_for('login', error='not_employee'))
         
-         # 3. Получаем роль пользователя
-        user_role = get_user_role_db(username)
-        
-        # 4. Определяем расширенную роль с учетом отдела
-        user_role = get_extended_user_role(username, user_role)
+        user_role = identity['role']
         
-        # 5. Запрещаем доступ пользователям без ролей сотрудника
+        # 3. Запрещаем доступ пользователям без ролей сотрудника
         if user_role == 'public_users' or not user_role:
             update_failed_attempts(username)
             return redirect(url_for('login', error='not_employee'))
         
-          # 6. Создаем сессию
+        # 4. Создаем сессию
         session.clear()
         session.permanent = True
         
@@ -275,15 +166,12 @@ def login_post():
         session['user_name'] = employee_data['full_name']
         session['user_email'] = employee_data['email']
         session['user_login'] = username
-        session['user_role'] = user_role
         session['authenticated'] = True
         session['login_time'] = int(time.time())
         
-        # ДОБАВЛЯЕМ отдел пользователя в сессию
-        user_dept = get_user_department(employee_data['employee_id'])
-        print(f"DEBUG: User {username} department = {user_dept}")
-        if user_dept:
-            session['user_dept_id'] = user_dept
+        # Контекст пользователя (роль, отдел, руководство отделом) хранится в сессии
+        context = store_user_context(identity)
+        print(f"DEBUG: User {username} department = {context['department_id']}")
         
         # Принудительно сохраняем сессию
         session.modified = True
@@ -295,6 +183,12 @@ def login_post():
         update_failed_attempts(username)
         return redirect(url_for('login', error='system_error'))
 
+@app.before_request
+def refresh_user_context():
+    """Обновляет устаревший контекст пользователя; деактивированный сотрудник выходит из системы"""
+    if session.get('authenticated') and get_user_context() is None:
+        return redirect(url_for('login'))
+
 def is_session_valid():
     """Проверяет валидность сессии"""
     # Базовая проверка - если пользователь аутентифицирован и есть роль
@@ -312,75 +206,39 @@ def dashboard():
     
     try:
         if user_role == 'employee':
-            policies = execute_query("SELECT COUNT(*) as count FROM employee_policies_view")
-            policies_count = policies[0]['count'] if policies else 0
+            policies_count = get_company_stats()['policies_count']
             return render_template('employee/dashboard.html', policies_count=policies_count)
         
         elif user_role == 'department_manager':
             # Проверяем, действительно ли пользователь начальник отдела
-            user_id = session.get('user_id')
-            department_info = execute_query("""
-                SELECT d.department_id, d.name
-                FROM departments d
-                WHERE d.manager_id = %s
-            """, (user_id,))
+            context = get_user_context()
             
-            if not department_info:
-                # Если не начальник, проверяем может ли он быть аудитором из отдела безопасности
-                user_dept = get_user_department(user_id)
-                if user_dept == 4:  # Отдел безопасности
-                    # Это аудитор из отдела безопасности
-                    session['user_role'] = 'auditor'
-                    return redirect(url_for('dashboard'))
-                else:
-                    # Не начальник и не аудитор безопасности
-                    return render_template('employee/dashboard.html', policies_count=0)
+            if context['managed_department_id'] is None:
+                # Не начальник (сотрудник отдела безопасности получает роль auditor
+                # при определении личности, см. resolve_identity)
+                return render_template('employee/dashboard.html', policies_count=0)
             
             # Пользователь действительно начальник отдела
-            department_id = department_info[0]['department_id']
-            department_name = department_info[0]['name']
+            department_id = context['managed_department_id']
+            department_name = context['managed_department_name']
             
             # Получаем статистику для отдела
-            department_stats = execute_query("""
-                SELECT 
-                    (SELECT COUNT(*) FROM employees WHERE department_id = %s) as employees_count,
-                    (SELECT COUNT(*) FROM policies WHERE created_in_department_id = %s) as policies_count,
-                    (SELECT COUNT(*) FROM documents WHERE created_in_department_id = %s) as documents_count
-            """, (department_id, department_id, department_id))
-            
-            stats_data = department_stats[0] if department_stats else {
-                'employees_count': 0,
-                'policies_count': 0,
-                'documents_count': 0
-            }
+            stats_data = get_department_stats(department_id)
             
             return render_template('department_manager/dashboard.html',
                                 department_name=department_name,
                                 stats=stats_data)
         
         elif user_role == 'hr_manager':
-            employees_count = execute_query("SELECT COUNT(*) as count FROM employees")
-            active_count = execute_query("SELECT COUNT(*) as count FROM employees WHERE is_active = true")
-            total_employees = employees_count[0]['count'] if employees_count else 0
-            active_employees = active_count[0]['count'] if active_count else 0
+            stats_data = get_company_stats()
+            total_employees = stats_data['employees_count']
+            active_employees = stats_data['active_employees']
             return render_template('hr_manager/dashboard.html',
                                 total_employees=total_employees,
                                 active_employees=active_employees)
         
         elif user_role == 'company_director':
-            stats = execute_query("""
-                SELECT 
-                    (SELECT COUNT(*) FROM employees) as employees_count,
-                    (SELECT COUNT(*) FROM clients) as clients_count,
-                    (SELECT COUNT(*) FROM policies) as policies_count,
-                    (SELECT COUNT(*) FROM documents) as documents_count
-            """)
-            stats_data = stats[0] if stats else {
-                'employees_count': 0,
-                'clients_count': 0, 
-                'policies_count': 0,
-                'documents_count': 0
-            }
+            stats_data = get_company_stats()
             return render_template('company_director/dashboard.html', stats=stats_data)
         
         elif user_role == 'auditor':
@@ -388,19 +246,7 @@ def dashboard():
         
         elif user_role == 'db_admin':
             # Статистика для администратора БД
-            stats = execute_query("""
-                SELECT 
-                    (SELECT COUNT(*) FROM employees) as employees_count,
-                    (SELECT COUNT(*) FROM clients) as clients_count,
-                    (SELECT COUNT(*) FROM policies) as policies_count,
-                    (SELECT COUNT(*) FROM documents) as documents_count
-            """)
-            stats_data = stats[0] if stats else {
-                'employees_count': 0,
-                'clients_count': 0, 
-                'policies_count': 0,
-                'documents_count': 0
-            }
+            stats_data = get_company_stats()
             return render_template('db_admin/dashboard.html', stats=stats_data)
         
         else:
@@ -418,41 +264,84 @@ def logout():
     session.clear()
     return redirect(url_for('login'))
 
+# Роли PostgreSQL, которым выданы привилегии на объекты запросов (Roles and Views.sql).
+# Для остальных ролей запрос выполняется под пользователем приложения.
+CLIENTS_DB_ROLES = ('employee', 'department_manager', 'company_director', 'db_admin')
+POLICIES_VIEW_DB_ROLES = ('employee', 'department_manager', 'company_director')
+HR_VIEW_DB_ROLES = ('hr_manager', 'company_director')
+AUDITOR_VIEW_DB_ROLES = ('auditor', 'company_director')
+
+# Список клиентов (общий для сотрудников и аудиторов)
+CLIENTS_QUERY = """
+    SELECT 
+        client_id,
+        full_name,
+        phone,
+        email,
+        passport_series,
+        passport_number,
+        birth_date,
+        registration_address,
+        driver_license_series,
+        driver_license_number,
+        created_at
+    FROM clients
+"""
+CLIENTS_SORTS = {
+    'full_name': ('full_name', 'client_id'),
+    'created_at': ('created_at', 'client_id'),
+}
+
 @app.route('/clients')
 @login_required
 @role_required(['employee', 'department_manager', 'company_director'])
 def clients_list():
     try:
-        clients_data = execute_query("""
-            SELECT 
-                client_id,
-                full_name,
-                phone,
-                email,
-                passport_series,
-                passport_number,
-                birth_date,
-                registration_address,
-                driver_license_series,
-                driver_license_number,
-                created_at
-            FROM clients 
-            ORDER BY full_name
-        """)
-        return render_template('employee/clients.html', clients=clients_data)
+        page = paginate(CLIENTS_QUERY, sort_columns=CLIENTS_SORTS, default_sort='full_name',
+                        role=get_session_db_role(CLIENTS_DB_ROLES))
+        return render_template('employee/clients.html', clients=page['rows'], page=page)
     except Exception as e:
         print(f"Error loading clients: {e}")
         return render_template('employee/clients.html', clients=[])
 
+@app.route('/clients/export.<export_format>')
+@login_required
+@role_required(['employee', 'department_manager', 'company_director', 'auditor'])
+def export_clients(export_format):
+    """Выгрузка базы клиентов (CSV/NDJSON)"""
+    response = export_response(CLIENTS_QUERY + " ORDER BY client_id", 'clients', export_format,
+                               role=get_session_db_role(CLIENTS_DB_ROLES))
+    if response is None:
+        return redirect(url_for('clients_list'))
+    return response
+
+# policy_number уникален, поэтому дополнительная колонка не нужна
+POLICIES_SORTS = {
+    'policy_number': ('policy_number',),
+    'start_date': ('start_date', 'policy_id'),
+}
+
 @app.route('/policies')
 @login_required
 def policies():
     try:
-        policies_data = execute_query("SELECT * FROM employee_policies_view")
-        return render_template('employee/policies.html', policies=policies_data)
+        page = paginate("SELECT * FROM employee_policies_view",
+                        sort_columns=POLICIES_SORTS, default_sort='policy_number',
+                        role=get_session_db_role(POLICIES_VIEW_DB_ROLES))
+        return render_template('employee/policies.html', policies=page['rows'], page=page)
     except Exception as e:
         return render_template('employee/policies.html', policies=[])
 
+@app.route('/policies/export.<export_format>')
+@login_required
+def export_policies(export_format):
+    """Выгрузка полисов (CSV/NDJSON)"""
+    response = export_response("SELECT * FROM employee_policies_view", 'policies', export_format,
+                               role=get_session_db_role(POLICIES_VIEW_DB_ROLES))
+    if response is None:
+        return redirect(url_for('policies'))
+    return response
+
 
 
 
@@ -464,27 +353,12 @@ def documents_list():
     """Список документов с учетом прав доступа"""
     try:
         user_id = session.get('user_id')
-        user_role = session.get('user_role')
-        
-        # Получаем отдел пользователя
-        user_dept = get_user_department(user_id)
-        if user_dept:
-            session['user_dept_id'] = user_dept
         
-        user_dept_id = session.get('user_dept_id')
-        
-        # ОСОБЫЙ СЛУЧАЙ: Если пользователь начальник отдела, но имеет роль auditor
-        # Проверяем, является ли пользователь начальником отдела
-        is_manager = execute_query("""
-            SELECT COUNT(*) as count 
-            FROM departments 
-            WHERE manager_id = %s
-        """, (user_id,))
-        
-        if is_manager and is_manager[0]['count'] > 0:
-            # Пользователь является начальником отдела
-            user_role = 'department_manager'
-            session['user_role'] = 'department_manager'
+        # Роль и отдел берем из контекста пользователя
+        # (аудитор-начальник отдела уже получил роль department_manager при входе)
+        context = get_user_context()
+        user_role = context['role']
+        user_dept_id = context['department_id']
         
         print(f"DEBUG: Final user_role={user_role}, user_dept_id={user_dept_id}")
         
@@ -520,25 +394,6 @@ def documents_list():
         return render_template('shared/access_denied.html', 
                              error="Ошибка при загрузке документов")
     
-# Добавляем функцию для получения отдела пользователя
-def get_user_department(user_id):
-    """Получает отдел пользователя по его ID"""
-    try:
-        result = execute_query(
-            "SELECT department_id FROM employees WHERE employee_id = %s", 
-            (user_id,)
-        )
-        if result:
-            dept_id = result[0]['department_id']
-            print(f"DEBUG: get_user_department for user_id={user_id} returned dept_id={dept_id}")
-            return dept_id
-        print(f"DEBUG: get_user_department for user_id={user_id} returned None")
-        return None
-    except Exception as e:
-        print(f"Error getting user department: {e}")
-        return None
-
-
 def can_manage_table(user_role, table_name, record=None, user_dept_id=None):
     """Проверяет может ли пользователь управлять таблицей"""
     
@@ -580,8 +435,9 @@ def view_document(document_id):
     """Просмотр информации о документе"""
     try:
         user_id = session.get('user_id')
-        user_role = session.get('user_role')
-        user_dept_id = get_user_department(user_id)
+        context = get_user_context()
+        user_role = context['role']
+        user_dept_id = context['department_id']
         
         # Проверяем доступ к документу
         has_access, document = check_document_access(user_role, user_dept_id, user_id, document_id, 'view')
@@ -592,20 +448,69 @@ def view_document(document_id):
         
         return render_template('shared/view_document.html', 
                              document=document,
-                             user_role=user_role)
+                             user_role=user_role,
+                             preview_version=get_preview_version(document))
                              
     except Exception as e:
         print(f"Error viewing document: {e}")
         return redirect(url_for('documents_list', error="Ошибка при просмотре документа"))
 
+@app.route('/documents/search')
+@login_required
+def documents_search():
+    """Полнотекстовый поиск по доступным пользователю документам"""
+    query_text = request.args.get('q', '').strip()
+    page = None
+    try:
+        if query_text:
+            user_id = session.get('user_id')
+            context = get_user_context()
+            page = search_documents(query_text, context['role'], context['department_id'], user_id)
+    except Exception as e:
+        print(f"Error searching documents: {e}")
+        return render_template('shared/document_search.html', q=query_text, page=None,
+                             error="Ошибка при поиске документов")
+    return render_template('shared/document_search.html', q=query_text, page=page)
+
+@app.route('/documents/<int:document_id>/preview')
+@login_required
+def document_preview(document_id):
+    """Превью документа (создается при первом запросе)"""
+    try:
+        user_id = session.get('user_id')
+        context = get_user_context()
+        
+        has_access, document = check_document_access(context['role'], context['department_id'], user_id, document_id, 'view')
+        if not has_access or not document:
+            return '', 404
+        
+        preview_key = get_preview(document['stored_file_path'])
+        if not preview_key:
+            return '', 404
+        
+        storage = get_storage()
+        preview_path = storage.local_path(preview_key)
+        response = send_file(preview_path or storage.open(preview_key),
+                             mimetype='image/jpeg',
+                             max_age=Config.PREVIEW_MAX_AGE)
+        # URL содержит версию файла (?v=...), поэтому превью не меняется; кешируется только браузером
+        response.cache_control.public = False
+        response.cache_control.private = True
+        response.cache_control.immutable = True
+        return response
+    except Exception as e:
+        print(f"Error serving document preview: {e}")
+        return '', 404
+
 @app.route('/documents/<int:document_id>/download')
 @login_required
 def download_document(document_id):
     """Скачивание документа"""
     try:
         user_id = session.get('user_id')
-        user_role = session.get('user_role')
-        user_dept_id = get_user_department(user_id)
+        context = get_user_context()
+        user_role = context['role']
+        user_dept_id = context['department_id']
         
         # Проверяем доступ к документу
         has_access, document = check_document_access(user_role, user_dept_id, user_id, document_id, 'view')
@@ -613,22 +518,11 @@ def download_document(document_id):
         if not has_access or not document:
             return redirect(url_for('documents_list', error="Доступ к файлу запрещен"))
         
-        # Получаем путь к файлу
-        file_path = get_document_file_path(document['stored_file_path'])
-        
-        # Если файл не найден по основному пути, ищем по имени
-        if not os.path.exists(file_path):
-            alt_path = find_document_file(document['file_name'])
-            if alt_path:
-                file_path = alt_path
-            else:
-                return redirect(url_for('documents_list', 
-                                      error=f"Файл не найден: {document['file_name']}"))
-        
-        # Отправляем файл для скачивания
-        return send_file(file_path, 
-                        as_attachment=True,
-                        download_name=document['file_name'])
+        response = send_document_file(document)
+        if response is None:
+            return redirect(url_for('documents_list', 
+                                  error=f"Файл не найден: {document['file_name']}"))
+        return response
                         
     except Exception as e:
         print(f"Error downloading document: {e}")
@@ -640,16 +534,15 @@ def add_document():
     """Добавление нового документа"""
     try:
         user_id = session.get('user_id')
-        user_role = session.get('user_role')
-        user_dept_id = get_user_department(user_id)
+        context = get_user_context()
+        user_role = context['role']
+        user_dept_id = context['department_id']
         
         if user_role not in ['department_manager', 'hr_manager', 'company_director', 'db_admin']:
             return render_template('shared/access_denied.html', 
                                  error="Недостаточно прав для добавления документов")
         
-        departments = execute_query("SELECT department_id, name FROM departments ORDER BY name")
-        employees = execute_query("SELECT employee_id, full_name FROM employees WHERE is_active = true ORDER BY full_name")
-        policies = execute_query("SELECT policy_id, policy_number FROM policies ORDER BY policy_number")
+        departments = get_departments()
         
         if request.method == 'POST':
             print(f"DEBUG: Request method: POST")
@@ -661,8 +554,6 @@ def add_document():
                 print(f"DEBUG: No document_file in request.files")
                 return render_template('company_director/documents/add_document.html',
                                     departments=departments,
-                                    employees=employees,
-                                    policies=policies,
                                     error="Файл не выбран")
             
             file = request.files['document_file']
@@ -674,16 +565,12 @@ def add_document():
                 print(f"DEBUG: Empty filename")
                 return render_template('company_director/documents/add_document.html',
                                     departments=departments,
-                                    employees=employees,
-                                    policies=policies,
                                     error="Файл не выбран")
             
             if file and not allowed_file(file.filename):
                 print(f"DEBUG: File not allowed: {file.filename}")
                 return render_template('company_director/documents/add_document.html',
                                     departments=departments,
-                                    employees=employees,
-                                    policies=policies,
                                     error="Недопустимый тип файла")
             
             # Получаем данные из формы
@@ -704,60 +591,59 @@ def add_document():
             if not file_name:
                 return render_template('company_director/documents/add_document.html',
                                     departments=departments,
-                                    employees=employees,
-                                    policies=policies,
                                     error="Название файла обязательно")
             
             # Сохраняем файл С ОРИГИНАЛЬНЫМ ИМЕНЕМ
             print(f"DEBUG: Calling save_document_file...")
-            stored_file_path, saved_filename, file_size = save_document_file(
+            stored_file_path, saved_filename, file_size, file_hash = save_document_file(
                 file, 
                 int(created_in_department_id), 
                 int(confidentiality_level),
                 use_original_name=True
             )
             
-            print(f"DEBUG: save_document_file returned: {stored_file_path}, {saved_filename}, {file_size}")
+            print(f"DEBUG: save_document_file returned: {stored_file_path}, {saved_filename}, {file_size}, {file_hash}")
             
             if not stored_file_path:
                 return render_template('company_director/documents/add_document.html',
                                     departments=departments,
-                                    employees=employees,
-                                    policies=policies,
                                     error="Ошибка при сохранении файла")
             
-            # Проверяем, что файл физически существует
-            upload_folder = get_upload_folder()
-            full_path = os.path.join(upload_folder, stored_file_path)
-            if not os.path.exists(full_path):
-                print(f"DEBUG: ERROR: File doesn't exist at {full_path}")
+            # Проверяем, что файл есть в хранилище
+            if not document_file_exists(stored_file_path):
+                print(f"DEBUG: ERROR: File doesn't exist: {stored_file_path}")
                 return render_template('company_director/documents/add_document.html',
                                     departments=departments,
-                                    employees=employees,
-                                    policies=policies,
                                     error="Файл не был сохранен на диск")
             
             # Сохраняем документ в БД
             insert_query = """
                 INSERT INTO documents (
                     policy_id, created_by_employee_id, created_in_department_id,
-                    file_name, description, stored_file_path, file_size, confidentiality_level
-                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                    file_name, description, stored_file_path, content_hash, file_size, confidentiality_level
+                ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+                RETURNING document_id
             """
             
             print(f"DEBUG: Executing DB insert...")
-            execute_query(insert_query, (
-                policy_id, created_by_employee_id, created_in_department_id,
-                file_name, description, stored_file_path, file_size, confidentiality_level
-            ), fetch=False)
+            try:
+                inserted = execute_query(insert_query, (
+                    policy_id, created_by_employee_id, created_in_department_id,
+                    file_name, description, stored_file_path, file_hash, file_size, confidentiality_level
+                ))
+            except Exception:
+                # Сохраненный файл удаляется в фоне (если на него не ссылаются другие документы)
+                enqueue_job('delete_blob', {'content_hash': file_hash}, delay=Config.BLOB_GC_DELAY)
+                raise
+            
+            # Обработка загруженного файла - в фоне
+            enqueue_job('process_upload', {'document_id': inserted[0]['document_id']})
             
             print(f"DEBUG: Document added successfully!")
             return redirect(url_for('documents_list', success="Документ успешно добавлен"))
         
         return render_template('company_director/documents/add_document.html',
-                            departments=departments,
-                            employees=employees,
-                            policies=policies)
+                            departments=departments)
                             
     except Exception as e:
         print(f"ERROR in add_document: {e}")
@@ -765,8 +651,6 @@ def add_document():
         traceback.print_exc()
         return render_template('company_director/documents/add_document.html',
                             departments=departments,
-                            employees=employees,
-                            policies=policies,
                             error=f"Ошибка при добавлении документа: {str(e)}")
     
 
@@ -776,8 +660,9 @@ def edit_document(document_id):
     """Редактирование документа с возможностью замены файла"""
     try:
         user_id = session.get('user_id')
-        user_role = session.get('user_role')
-        user_dept_id = get_user_department(user_id)
+        context = get_user_context()
+        user_role = context['role']
+        user_dept_id = context['department_id']
         
         # Проверяем доступ к редактированию
         has_access, document = check_document_access(user_role, user_dept_id, user_id, document_id, 'edit')
@@ -788,15 +673,18 @@ def edit_document(document_id):
         
         # GET запрос - показываем форму
         if request.method == 'GET':
-            departments = execute_query("SELECT department_id, name FROM departments ORDER BY name")
-            employees = execute_query("SELECT employee_id, full_name FROM employees WHERE is_active = true ORDER BY full_name")
-            policies = execute_query("SELECT policy_id, policy_number FROM policies ORDER BY policy_number")
+            departments = get_departments()
+            # Текущий полис показывается в поле подсказок по номеру
+            policy_number = None
+            if document['policy_id']:
+                policy = execute_query("SELECT policy_number FROM policies WHERE policy_id = %s",
+                                       (document['policy_id'],))
+                policy_number = policy[0]['policy_number'] if policy else None
             
             return render_template('company_director/documents/edit_document.html',
                                 document=document,
                                 departments=departments,
-                                employees=employees,
-                                policies=policies)
+                                policy_number=policy_number)
         
         # POST запрос - обрабатываем форму
         else:
@@ -812,6 +700,11 @@ def edit_document(document_id):
             created_by_employee_id = request.form.get('created_by_employee_id')
             created_in_department_id = request.form.get('created_in_department_id')
             
+            # Валидация до сохранения нового файла, чтобы он не остался без ссылок
+            if not file_name:
+                return redirect(url_for('view_document', document_id=document_id,
+                                      error="Название файла обязательно"))
+            
             # Проверяем, загружен ли новый файл
             new_file = None
             file_changed = False
@@ -824,11 +717,10 @@ def edit_document(document_id):
                 
                 if new_file and allowed_file(new_file.filename):
                     # Сохраняем новый файл
-                    new_file_path, saved_filename, new_file_size = save_document_file(
+                    new_file_path, saved_filename, new_file_size, new_file_hash = save_document_file(
                         new_file,
                         int(created_in_department_id),
                         int(confidentiality_level),
-                        document_id,  # Передаем ID для удаления старого файла
                         use_original_name=True
                     )
                     
@@ -839,11 +731,6 @@ def edit_document(document_id):
                         return redirect(url_for('view_document', document_id=document_id,
                                               error="Ошибка при сохранении нового файла"))
             
-            # Валидация
-            if not file_name:
-                return redirect(url_for('view_document', document_id=document_id,
-                                      error="Название файла обязательно"))
-            
             # Подготавливаем данные для обновления
             update_data = {
                 'file_name': file_name,
@@ -857,24 +744,26 @@ def edit_document(document_id):
             # Если файл изменился, добавляем новые путь и размер
             if file_changed and new_file_path and new_file_size:
                 update_data['stored_file_path'] = new_file_path
+                update_data['content_hash'] = new_file_hash
                 update_data['file_size'] = new_file_size
                 print(f"DEBUG: Updating file path to: {new_file_path}")
             
             # Безопасное обновление в БД
-            update_success = update_document_safely(document_id, update_data)
+            # Уведомление автору создает триггер notify_document_change
+            update_success = update_document_safely(document_id, update_data, user_id)
             
             if not update_success:
-                # Если файл был загружен, но обновление БД не удалось, удаляем новый файл
+                # Если файл был загружен, но обновление БД не удалось, новый файл
+                # удаляется в фоне (если на него не ссылаются другие документы)
                 if file_changed and new_file_path:
-                    delete_document_file(new_file_path)
+                    enqueue_job('delete_blob', {'content_hash': new_file_hash}, delay=Config.BLOB_GC_DELAY)
                 return redirect(url_for('view_document', document_id=document_id,
                                       error="Ошибка при обновлении документа в БД"))
             
-            # Создаем уведомление
-            change_description = f"Документ '{file_name}' был изменен"
+            # Прежний файл удаляется и новый обрабатывается в фоне
             if file_changed:
-                change_description += " (файл заменен)"
-            create_notification(document_id, user_id, change_description)
+                enqueue_job('delete_file', {'stored_file_path': document['stored_file_path']})
+                enqueue_job('process_upload', {'document_id': document_id})
             
             return redirect(url_for('view_document', document_id=document_id, 
                                   success="Документ успешно обновлен"))
@@ -892,8 +781,9 @@ def delete_document(document_id):
     """Удаление документа"""
     try:
         user_id = session.get('user_id')
-        user_role = session.get('user_role')
-        user_dept_id = get_user_department(user_id)
+        context = get_user_context()
+        user_role = context['role']
+        user_dept_id = context['department_id']
         
         # Проверяем доступ к удалению документа
         has_access, document = check_document_access(user_role, user_dept_id, user_id, document_id, 'delete')
@@ -901,13 +791,12 @@ def delete_document(document_id):
         if not has_access:
             return redirect(url_for('documents_list', error="Недостаточно прав для удаления документа"))
         
-        # Удаляем файл из файловой системы
-        if document.get('stored_file_path'):
-            delete_document_file(document['stored_file_path'])
-        
-        # Удаляем документ из БД
-        delete_query = "DELETE FROM documents WHERE document_id = %s"
-        execute_query(delete_query, (document_id,), fetch=False)
+        # Удаляем документ из БД; задача удаления файла фиксируется в той же
+        # транзакции, поэтому файл не останется без записи о нем
+        with transaction() as tx:
+            tx.execute("DELETE FROM documents WHERE document_id = %s", (document_id,))
+            if document.get('stored_file_path'):
+                enqueue_job('delete_file', {'stored_file_path': document['stored_file_path']})
         
         return redirect(url_for('documents_list', success="Документ успешно удален"))
         
@@ -917,21 +806,59 @@ def delete_document(document_id):
     
 
 
+# Роли, которым показываются уведомления (см. меню в base.html)
+NOTIFICATION_ROLES = ['employee', 'department_manager', 'hr_manager', 'company_director']
+
+@app.context_processor
+def inject_unread_notifications():
+    """Количество непрочитанных уведомлений для значка в меню"""
+    if not session.get('authenticated') or session.get('user_role') not in NOTIFICATION_ROLES:
+        return {}
+    return {'unread_notifications': get_unread_count(session.get('user_id'))}
+
 @app.route('/notifications')
 @login_required
 def notifications_list():
     """Список уведомлений пользователя"""
     try:
         user_id = session.get('user_id')
-        notifications = get_user_notifications(user_id)
+        unread_only = request.args.get('unread') == '1'
+        page = get_user_notifications(user_id, unread_only)
         
         return render_template('shared/notifications.html', 
-                             notifications=notifications)
+                             notifications=page['rows'],
+                             page=page,
+                             unread_only=unread_only)
                              
     except Exception as e:
         print(f"Error loading notifications: {e}")
         return render_template('shared/notifications.html', 
                              notifications=[])
+
+@app.route('/notifications/stream')
+@login_required
+def notifications_stream():
+    """Поток новых уведомлений пользователя (server-sent events)"""
+    # Без stream_with_context: генератору нужен только ID получателя, а контекст
+    # запроса (и закрепленные за ним соединения с БД) освобождается сразу
+    response = Response(event_stream(session.get('user_id')), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # Отключаем буферизацию ответа на nginx
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/notifications/mark_read', methods=['POST'])
+@login_required
+def mark_notifications_read():
+    """Отметка уведомлений прочитанными: выбранных или всех сразу"""
+    user_id = session.get('user_id')
+    if request.form.get('all') == '1':
+        marked = mark_notifications_as_read(user_id)
+    else:
+        notification_ids = [int(value) for value in request.form.getlist('notification_id') if value.isdigit()]
+        marked = mark_notifications_as_read(user_id, notification_ids)
+    print(f"DEBUG: Marked {marked} notifications as read for user {user_id}")
+    return redirect(url_for('notifications_list'))
     
     
 #---------------------------------------------------------------------------------------------------------------------------------------
@@ -941,8 +868,12 @@ def notifications_list():
 @role_required(['hr_manager', 'company_director', 'department_manager'])
 def employees_list():
     try:
-        employees_data = execute_query("SELECT * FROM hr_employees_view")
-        return render_template('hr_manager/employees.html', employees=employees_data)
+        page = paginate("SELECT * FROM hr_employees_view",
+                        sort_columns={'full_name': ('full_name', 'employee_id'),
+                                      'created_at': ('created_at', 'employee_id')},
+                        default_sort='full_name',
+                        role=get_session_db_role(HR_VIEW_DB_ROLES))
+        return render_template('hr_manager/employees.html', employees=page['rows'], page=page)
     except Exception as e:
         print(f"Error loading employees: {e}")
         return render_template('hr_manager/employees.html', employees=[])
@@ -952,11 +883,29 @@ def employees_list():
 @role_required(['auditor', 'company_director'])
 def audit():
     try:
-        audit_data = execute_query("SELECT * FROM auditor_view")
+        audit_data = execute_role_query("SELECT * FROM auditor_view", AUDITOR_VIEW_DB_ROLES)
         return render_template('auditor/audit.html', audit_data=audit_data)
     except Exception as e:
         return render_template('auditor/audit.html', audit_data=[])
 
+@app.route('/audit/export.<export_format>')
+@login_required
+@role_required(['auditor', 'company_director'])
+def export_audit(export_format):
+    """Выгрузка данных аудита (CSV/NDJSON)"""
+    response = export_response("SELECT * FROM auditor_view", 'audit', export_format,
+                               role=get_session_db_role(AUDITOR_VIEW_DB_ROLES))
+    if response is None:
+        return redirect(url_for('audit'))
+    return response
+
+@app.errorhandler(413)
+def upload_too_large(e):
+    """Файл больше лимита роли: запрос отклонен до или во время загрузки"""
+    limit_mb = get_upload_quota() // (1024 * 1024) if session.get('authenticated') else None
+    error = f"Файл слишком большой. Максимальный размер: {limit_mb} МБ" if limit_mb else "Файл слишком большой"
+    return render_template('shared/access_denied.html', error=error), 413
+
 @app.after_request
 def add_security_headers(response):
     response.headers['X-Content-Type-Options'] = 'nosniff'
@@ -978,14 +927,12 @@ def department_employees():
         user_role = session.get('user_role')
         
         if user_role == 'department_manager':
-            # Находим отдел для начальника
-            department_info = get_department_for_manager(session['user_login'])
+            # Отдел начальника из контекста пользователя
+            department_id = get_user_context()['managed_department_id']
             
-            if not department_info:
+            if department_id is None:
                 return render_template('department_manager/employees.html', employees=[])
             
-            department_id = department_info['department_id']
-            
             # Находим всех сотрудников этого отдела
             employees_query = """
                 SELECT 
@@ -1003,54 +950,59 @@ def department_employees():
             employees_data = execute_query(employees_query, (department_id,))
         else:
             # Для HR и директора - все сотрудники
-            employees_data = execute_query("SELECT * FROM hr_employees_view")
+            employees_data = execute_role_query("SELECT * FROM hr_employees_view", HR_VIEW_DB_ROLES)
             
         return render_template('department_manager/employees.html', employees=employees_data)
     except Exception as e:
         print(f"Error loading department employees: {e}")
         return render_template('department_manager/employees.html', employees=[])
     
-def get_department_for_manager(username):
-    """Находит отдел для начальника по username"""
+@app.route('/api/policies/search')
+@login_required
+def api_search_policies():
+    """Подсказки для поля полиса: полисы по началу номера
+
+    Доступны любому сотруднику: формы редактирования документа открывает
+    автор с любой ролью (см. check_document_access)
+    """
     try:
-        # Ищем начальника по username в email сотрудников
-        department_query = """
-            SELECT d.department_id, d.name
-            FROM departments d
-            JOIN employees e ON d.manager_id = e.employee_id
-            WHERE e.email ILIKE %s OR e.email ILIKE %s
-        """
-        
-        # Пробуем разные варианты поиска
-        patterns = [
-            f"%{username}%",           # username содержится в email
-            f"{username}@company.ru",  # полный email
-        ]
-        
-        for pattern in patterns:
-            department_data = execute_query(department_query, (pattern, pattern))
-            if department_data:
-                print(f"DEBUG: Found department for manager {username}: {department_data[0]}")
-                return department_data[0]
-        
-        # Если не нашли, проверяем по employee_id из сессии
-        if 'user_id' in session:
-            user_id = session['user_id']
-            dept_query = """
-                SELECT d.department_id, d.name
-                FROM departments d
-                WHERE d.manager_id = %s
-            """
-            dept_data = execute_query(dept_query, (user_id,))
-            if dept_data:
-                print(f"DEBUG: Found department by user_id {user_id}: {dept_data[0]}")
-                return dept_data[0]
-        
-        print(f"DEBUG: No department found for manager {username}")
-        return None
+        return jsonify(search_policies(request.args.get('q', ''), request.args.get('limit', type=int)))
+    except Exception as e:
+        print(f"Error searching policies: {e}")
+        return jsonify({'error': 'Ошибка поиска полисов'}), 500
+
+@app.route('/api/employees/search')
+@login_required
+def api_search_employees():
+    """Подсказки для поля сотрудника: активные сотрудники по началу ФИО"""
+    try:
+        return jsonify(search_employees(request.args.get('q', ''), request.args.get('limit', type=int)))
+    except Exception as e:
+        print(f"Error searching employees: {e}")
+        return jsonify({'error': 'Ошибка поиска сотрудников'}), 500
+
+@app.route('/health')
+def health():
+    """Проверка состояния для балансировщика и мониторинга: БД, хранилище файлов, папка загрузок"""
+    checks = {}
+    try:
+        execute_query("SELECT 1")
+        checks['database'] = {'ok': True}
     except Exception as e:
-        print(f"Error finding department for manager: {e}")
-        return None
+        checks['database'] = {'ok': False, 'error': str(e)}
+    checks['storage'] = get_storage().health()
+    # Временные файлы загрузок пишутся локально при любом хранилище
+    checks['upload_folder'] = get_layout().health()
+    
+    healthy = all(check['ok'] for check in checks.values())
+    return jsonify({'status': 'ok' if healthy else 'error', 'checks': checks}), 200 if healthy else 503
+    
+@app.route('/db_admin/pool_stats')
+@login_required
+@role_required(['db_admin'])
+def pool_stats():
+    """Метрики пула соединений с БД"""
+    return jsonify(get_pool_stats())
     
 @app.route('/db_admin/table/<table_name>')
 @login_required
@@ -1066,27 +1018,96 @@ def manage_table(table_name):
         if table_name not in allowed_tables:
             return redirect(url_for('dashboard'))
         
-        # Получаем данные таблицы
-        table_data = execute_query(f"SELECT * FROM {table_name} ORDER BY 1")
+        # Колонки и первичный ключ - из кэша метаданных схемы
+        schema = get_table_schema(table_name)
+        if schema is None:
+            return redirect(url_for('dashboard'))
+        columns = schema['columns']
         
-        # Получаем информацию о колонках
-        columns_query = """
-            SELECT column_name, data_type 
-            FROM information_schema.columns 
-            WHERE table_name = %s 
-            ORDER BY ordinal_position
-        """
-        columns = execute_query(columns_query, (table_name,))
+        # Получаем страницу данных таблицы в порядке первичного ключа
+        key_column = get_primary_key_column(table_name)
+        sort_key = schema['primary_key'] or [columns[0]['column_name']]
+        page = paginate(f"SELECT * FROM {table_name}",
+                        sort_columns={sort_key[0]: tuple(sort_key)},
+                        default_sort=sort_key[0])
         
         return render_template('db_admin/table_management.html', 
                             table_name=table_name,
-                            table_data=table_data,
-                            columns=columns)
+                            table_data=page['rows'],
+                            columns=columns,
+                            key_column=key_column,
+                            foreign_keys=schema['foreign_keys'],
+                            import_tables=IMPORT_TABLES,
+                            filter_operators=FILTER_OPERATORS,
+                            success=request.args.get('success'),
+                            message=request.args.get('message'),
+                            error=request.args.get('error'),
+                            page=page)
     except Exception as e:
         print(f"Error loading table {table_name}: {e}")
         return redirect(url_for('dashboard'))
+
+@app.route('/db_admin/table/<table_name>/export.<export_format>')
+@login_required
+@role_required(['db_admin'])
+def export_table(table_name, export_format):
+    """Выгрузка таблицы целиком (CSV/NDJSON)"""
+    allowed_tables = [
+        'employees', 'clients', 'policies', 'documents', 'departments',
+        'car_brands', 'car_models', 'policy_statuses', 'notifications'
+    ]
+    if table_name not in allowed_tables:
+        return redirect(url_for('dashboard'))
+
+    response = export_response(f"SELECT * FROM {table_name} ORDER BY 1", table_name, export_format)
+    if response is None:
+        return redirect(url_for('manage_table', table_name=table_name))
+    return response
     
 
+@app.route('/db_admin/table/<table_name>/import', methods=['GET', 'POST'])
+@login_required
+@role_required(['db_admin'])
+def import_table_records(table_name):
+    """Массовая загрузка записей из CSV/XLSX"""
+    schema = get_table_schema(table_name) if table_name in IMPORT_TABLES else None
+    if schema is None:
+        return redirect(url_for('dashboard'))
+
+    result = None
+    error = None
+    if request.method == 'POST':
+        file = request.files.get('import_file')
+        file_format = get_import_format(file.filename) if file else None
+        if not file or not file.filename:
+            error = "Файл не выбран"
+        elif file_format is None:
+            error = "Поддерживаются файлы CSV и XLSX"
+        else:
+            # Файл уже записан во временный файл при разборе запроса (UploadRequest)
+            upload = file.stream if isinstance(file.stream, HashingUploadFile) else spool_stream(file.stream)
+            try:
+                upload.flush()
+                result = import_file(table_name, upload.path, file_format,
+                                     dry_run=request.form.get('dry_run') == 'true')
+                if not result['dry_run'] and (result['inserted'] or result['updated']):
+                    invalidate_table_caches(table_name)
+            except ValueError as e:
+                error = str(e)
+            except Exception as e:
+                print(f"Error importing into {table_name}: {e}")
+                error = f"Ошибка при загрузке, изменения отменены: {str(e)}"
+            finally:
+                upload.close()
+
+    return render_template('db_admin/import_records.html',
+                        table_name=table_name,
+                        columns=[column for column in schema['columns']
+                                 if column['column_name'] not in ['created_at', 'updated_at']],
+                        primary_key=schema['primary_key'],
+                        result=result,
+                        error=error)
+
 @app.route('/db_admin/table/<table_name>/add', methods=['GET', 'POST'])
 @login_required
 @role_required(['db_admin'])
@@ -1099,19 +1120,13 @@ def add_table_record(table_name):
         if table_name not in allowed_tables:
             return redirect(url_for('dashboard'))
 
-        # Получаем информацию о колонках
-        columns_query = """
-            SELECT 
-                column_name, 
-                data_type,
-                is_nullable,
-                column_default,
-                character_maximum_length
-            FROM information_schema.columns 
-            WHERE table_name = %s 
-            ORDER BY ordinal_position
-        """
-        columns = execute_query(columns_query, (table_name,))
+        # Колонки таблицы - из кэша метаданных схемы
+        schema = get_table_schema(table_name)
+        key_column = get_primary_key_column(table_name)
+        if schema is None or key_column is None:
+            return redirect(url_for('dashboard'))
+        columns = schema['columns']
+        foreign_keys = schema['foreign_keys']
 
         if request.method == 'POST':
             # Собираем данные из формы
@@ -1128,33 +1143,19 @@ def add_table_record(table_name):
                     return render_template('db_admin/add_record.html', 
                                         table_name=table_name,
                                         columns=columns,
+                                        foreign_keys=foreign_keys,
                                         error=f"Поле '{col_name}' обязательно для заполнения")
                 
-                if value != '':
-                    # Преобразование типов
-                    if column['data_type'] in ['integer', 'bigint']:
-                        try:
-                            form_data[col_name] = int(value) if value else None
-                        except ValueError:
-                            return render_template('db_admin/add_record.html', 
-                                                table_name=table_name,
-                                                columns=columns,
-                                                error=f"Неверный формат числа в поле '{col_name}'")
-                    
-                    elif column['data_type'] in ['numeric', 'decimal']:
-                        try:
-                            form_data[col_name] = float(value) if value else None
-                        except ValueError:
-                            return render_template('db_admin/add_record.html', 
-                                                table_name=table_name,
-                                                columns=columns,
-                                                error=f"Неверный формат числа в поле '{col_name}'")
-                    
-                    elif column['data_type'] == 'boolean':
-                        form_data[col_name] = value.lower() in ['true', '1', 'yes', 'on']
-                    
-                    else:  # text, varchar, etc.
-                        form_data[col_name] = value
+                if value is not None and value != '':
+                    # Преобразование к типу колонки
+                    try:
+                        form_data[col_name] = coerce_value(column, value)
+                    except ValueError:
+                        return render_template('db_admin/add_record.html', 
+                                            table_name=table_name,
+                                            columns=columns,
+                                            foreign_keys=foreign_keys,
+                                            error=f"Неверный формат числа в поле '{col_name}'")
 
             # Формируем SQL запрос
             columns_str = ', '.join(form_data.keys())
@@ -1165,16 +1166,19 @@ def add_table_record(table_name):
             
             try:
                 execute_query(insert_query, values, fetch=False)
+                invalidate_table_caches(table_name)
                 return redirect(url_for('manage_table', table_name=table_name, success=True))
             except Exception as e:
                 return render_template('db_admin/add_record.html', 
                                     table_name=table_name,
                                     columns=columns,
+                                    foreign_keys=foreign_keys,
                                     error=f"Ошибка при добавлении: {str(e)}")
 
         return render_template('db_admin/add_record.html', 
                             table_name=table_name, 
-                            columns=columns)
+                            columns=columns,
+                            foreign_keys=foreign_keys)
 
     except Exception as e:
         print(f"Error adding record to {table_name}: {e}")
@@ -1192,22 +1196,16 @@ def edit_table_record(table_name, record_id):
         if table_name not in allowed_tables:
             return redirect(url_for('dashboard'))
 
-        # Получаем информацию о колонках
-        columns_query = """
-            SELECT 
-                column_name, 
-                data_type,
-                is_nullable,
-                column_default,
-                character_maximum_length
-            FROM information_schema.columns 
-            WHERE table_name = %s 
-            ORDER BY ordinal_position
-        """
-        columns = execute_query(columns_query, (table_name,))
+        # Колонки таблицы - из кэша метаданных схемы
+        schema = get_table_schema(table_name)
+        key_column = get_primary_key_column(table_name)
+        if schema is None or key_column is None:
+            return redirect(url_for('dashboard'))
+        columns = schema['columns']
+        foreign_keys = schema['foreign_keys']
 
         # Получаем текущие данные записи
-        current_data = execute_query(f"SELECT * FROM {table_name} WHERE {get_primary_key_column(table_name)} = %s", (record_id,))
+        current_data = execute_query(f"SELECT * FROM {table_name} WHERE {key_column} = %s", (record_id,))
         
         if not current_data:
             return redirect(url_for('manage_table', table_name=table_name, error="Запись не найдена"))
@@ -1229,54 +1227,40 @@ def edit_table_record(table_name, record_id):
                                         table_name=table_name,
                                         record_id=record_id,
                                         columns=columns,
+                                        foreign_keys=foreign_keys,
                                         current_record=current_record,
                                         error=f"Поле '{col_name}' обязательно для заполнения")
                 
                 if value is not None:
-                    # Преобразование типов
-                    if column['data_type'] in ['integer', 'bigint']:
-                        try:
-                            form_data[col_name] = int(value) if value else None
-                        except ValueError:
-                            return render_template('db_admin/edit_record.html', 
-                                                table_name=table_name,
-                                                record_id=record_id,
-                                                columns=columns,
-                                                current_record=current_record,
-                                                error=f"Неверный формат числа в поле '{col_name}'")
-                    
-                    elif column['data_type'] in ['numeric', 'decimal']:
-                        try:
-                            form_data[col_name] = float(value) if value else None
-                        except ValueError:
-                            return render_template('db_admin/edit_record.html', 
-                                                table_name=table_name,
-                                                record_id=record_id,
-                                                columns=columns,
-                                                current_record=current_record,
-                                                error=f"Неверный формат числа в поле '{col_name}'")
-                    
-                    elif column['data_type'] == 'boolean':
-                        form_data[col_name] = value.lower() in ['true', '1', 'yes', 'on']
-                    
-                    else:  # text, varchar, etc.
-                        form_data[col_name] = value
+                    # Преобразование к типу колонки
+                    try:
+                        form_data[col_name] = coerce_value(column, value)
+                    except ValueError:
+                        return render_template('db_admin/edit_record.html', 
+                                            table_name=table_name,
+                                            record_id=record_id,
+                                            columns=columns,
+                                            foreign_keys=foreign_keys,
+                                            current_record=current_record,
+                                            error=f"Неверный формат числа в поле '{col_name}'")
 
             # Формируем SQL запрос для UPDATE
             set_clause = ', '.join([f"{col} = %s" for col in form_data.keys()])
             values = list(form_data.values())
             values.append(record_id)  # для WHERE условия
             
-            update_query = f"UPDATE {table_name} SET {set_clause} WHERE {get_primary_key_column(table_name)} = %s"
+            update_query = f"UPDATE {table_name} SET {set_clause} WHERE {key_column} = %s"
             
             try:
                 execute_query(update_query, values, fetch=False)
+                invalidate_table_caches(table_name)
                 return redirect(url_for('manage_table', table_name=table_name, success=True))
             except Exception as e:
                 return render_template('db_admin/edit_record.html', 
                                     table_name=table_name,
                                     record_id=record_id,
                                     columns=columns,
+                                    foreign_keys=foreign_keys,
                                     current_record=current_record,
                                     error=f"Ошибка при обновлении: {str(e)}")
 
@@ -1284,6 +1268,7 @@ def edit_table_record(table_name, record_id):
                             table_name=table_name,
                             record_id=record_id,
                             columns=columns,
+                            foreign_keys=foreign_keys,
                             current_record=current_record)
 
     except Exception as e:
@@ -1302,15 +1287,10 @@ def delete_table_record(table_name, record_id):
         if table_name not in allowed_tables:
             return redirect(url_for('dashboard'))
 
-        # Проверяем существование записи
-        current_data = execute_query(f"SELECT * FROM {table_name} WHERE {get_primary_key_column(table_name)} = %s", (record_id,))
-        
-        if not current_data:
+        # Удаляем без предварительной проверки: отсутствие записи видно по числу удаленных строк
+        if not batch_delete(table_name, ids=[record_id]):
             return redirect(url_for('manage_table', table_name=table_name, error="Запись не найдена"))
-
-        # Выполняем удаление
-        delete_query = f"DELETE FROM {table_name} WHERE {get_primary_key_column(table_name)} = %s"
-        execute_query(delete_query, (record_id,), fetch=False)
+        invalidate_table_caches(table_name)
         
         return redirect(url_for('manage_table', table_name=table_name, success=True))
 
@@ -1318,19 +1298,90 @@ def delete_table_record(table_name, record_id):
         print(f"Error deleting record from {table_name}: {e}")
         return redirect(url_for('manage_table', table_name=table_name, error=f"Ошибка при удалении: {str(e)}"))
 
-def get_primary_key_column(table_name):
-    """Получает имя первичного ключа для таблицы"""
-    pk_columns = {
-        'employees': 'employee_id',
-        'clients': 'client_id', 
-        'policies': 'policy_id',
-        'documents': 'document_id',
-        'departments': 'department_id',
-        'car_brands': 'brand_id',
-        'car_models': 'model_id',
-        'policy_statuses': 'status_id'
-    }
-    return pk_columns.get(table_name, 'id')
+def get_batch_selection():
+    """Выбор записей пакетной операции из формы: отмеченные ID или фильтр по колонке"""
+    if request.form.get('scope') == 'filter':
+        return None, [(request.form.get('filter_column', ''),
+                       request.form.get('filter_operator', ''),
+                       request.form.get('filter_value', '').strip())]
+    ids = request.form.getlist('ids', type=int)
+    if not ids:
+        raise ValueError("Не отмечены записи")
+    return ids, None
+
+@app.route('/db_admin/table/<table_name>/batch_update', methods=['POST'])
+@login_required
+@role_required(['db_admin'])
+def batch_update_records(table_name):
+    """
+    Пакетное изменение записей одним запросом
+
+    Форма: одно значение колонки для отмеченных записей или записей по фильтру.
+    JSON {"rows": [{<первичный ключ>: ID, <колонка>: значение, ...}]}: свои значения для каждой записи.
+    """
+    allowed_tables = ['employees', 'clients', 'policies', 'documents', 'departments',
+                     'car_brands', 'car_models', 'policy_statuses']
+    if table_name not in allowed_tables:
+        return redirect(url_for('dashboard'))
+
+    if request.is_json:
+        try:
+            updated = batch_update_rows(table_name, (request.get_json(silent=True) or {}).get('rows') or [])
+            invalidate_table_caches(table_name)
+            return jsonify({'updated': updated})
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        except Exception as e:
+            print(f"Error batch updating {table_name}: {e}")
+            return jsonify({'error': f"Ошибка при изменении: {str(e)}"}), 500
+
+    try:
+        ids, filters = get_batch_selection()
+        updated = batch_update(table_name, {request.form.get('set_column', ''): request.form.get('set_value', '')},
+                               ids=ids, filters=filters)
+        invalidate_table_caches(table_name)
+        return redirect(url_for('manage_table', table_name=table_name, message=f"Изменено записей: {updated}"))
+    except ValueError as e:
+        return redirect(url_for('manage_table', table_name=table_name, error=str(e)))
+    except Exception as e:
+        print(f"Error batch updating {table_name}: {e}")
+        return redirect(url_for('manage_table', table_name=table_name, error=f"Ошибка при изменении: {str(e)}"))
+
+@app.route('/db_admin/table/<table_name>/batch_delete', methods=['POST'])
+@login_required
+@role_required(['db_admin'])
+def batch_delete_records(table_name):
+    """Пакетное удаление отмеченных записей или записей по фильтру одним запросом"""
+    allowed_tables = ['employees', 'clients', 'policies', 'documents', 'departments',
+                     'car_brands', 'car_models', 'policy_statuses']
+    if table_name not in allowed_tables:
+        return redirect(url_for('dashboard'))
+
+    try:
+        ids, filters = get_batch_selection()
+        deleted = batch_delete(table_name, ids=ids, filters=filters)
+        invalidate_table_caches(table_name)
+        return redirect(url_for('manage_table', table_name=table_name, message=f"Удалено записей: {deleted}"))
+    except ValueError as e:
+        return redirect(url_for('manage_table', table_name=table_name, error=str(e)))
+    except Exception as e:
+        print(f"Error batch deleting from {table_name}: {e}")
+        return redirect(url_for('manage_table', table_name=table_name, error=f"Ошибка при удалении: {str(e)}"))
+
+def invalidate_table_caches(table_name):
+    """Сбрасывает кэши, зависящие от таблицы, после изменения ее записей"""
+    invalidate_stats()
+    invalidate_reference_data(table_name)
+    if table_name in ['employees', 'departments']:
+        invalidate_user_context()
+
+@app.route('/db_admin/schema/refresh', methods=['POST'])
+@login_required
+@role_required(['db_admin'])
+def refresh_schema():
+    """Сброс кэша метаданных схемы (после изменения таблиц вне приложения)"""
+    invalidate_schema()
+    return redirect(request.referrer or url_for('dashboard'))
 
 
 # Маршруты для управления сотрудниками (company_director)
@@ -1344,29 +1395,50 @@ def manage_employees():
         success = request.args.get('success')
         error = request.args.get('error')
         
-        # Получаем всех сотрудников с информацией об отделах
-        employees_query = """
+        # Фильтры по отделу и статусу
+        filters = []
+        params = []
+        department_filter = request.args.get('department_id', '')
+        if department_filter.isdigit():
+            filters.append("e.department_id = %s")
+            params.append(int(department_filter))
+        status_filter = request.args.get('status', '')
+        if status_filter in ['active', 'inactive']:
+            filters.append("e.is_active = %s")
+            params.append(status_filter == 'active')
+        where = f"WHERE {' AND '.join(filters)}" if filters else ''
+        
+        # Получаем сотрудников с информацией об отделах
+        employees_query = f"""
             SELECT 
                 e.employee_id,
                 e.full_name,
                 e.phone,
                 e.email,
+                e.department_id,
                 d.name as department_name,
                 e.is_active,
                 e.created_at,
                 e.updated_at
             FROM employees e
             LEFT JOIN departments d ON e.department_id = d.department_id
-            ORDER BY e.full_name
+            {where}
         """
-        employees = execute_query(employees_query)
+        page = paginate(employees_query, params,
+                        sort_columns={'full_name': ('full_name', 'employee_id'),
+                                      'employee_id': ('employee_id',),
+                                      'created_at': ('created_at', 'employee_id')},
+                        default_sort='full_name')
         
         # Получаем отделы для фильтрации
-        departments = execute_query("SELECT department_id, name FROM departments ORDER BY name")
+        departments = get_departments()
         
         return render_template('company_director/employees.html', 
-                             employees=employees,
+                             employees=page['rows'],
                              departments=departments,
+                             page=page,
+                             department_filter=department_filter,
+                             status_filter=status_filter,
                              success=success,
                              error=error)
     except Exception as e:
@@ -1383,13 +1455,14 @@ def add_employee():
     """Добавление нового сотрудника"""
     try:
         # Получаем отделы для выпадающего списка
-        departments = execute_query("SELECT department_id, name FROM departments ORDER BY name")
+        departments = get_departments()
         
         if request.method == 'POST':
             # Собираем данные из формы
             full_name = request.form.get('full_name', '').strip()
             phone = request.form.get('phone', '').strip()
             email = request.form.get('email', '').strip()
+            login_name = request.form.get('login_name', '').strip() or None
             department_id = request.form.get('department_id')
             is_active = request.form.get('is_active', 'true')
             
@@ -1412,6 +1485,9 @@ def add_employee():
             if phone and not phone.replace('+', '').isdigit():
                 errors.append("Телефон должен содержать только цифры")
             
+            if login_name and not validate_username(login_name):
+                errors.append("Неверный формат логина")
+            
             if errors:
                 return render_template('company_director/add_employee.html',
                                     departments=departments,
@@ -1426,43 +1502,44 @@ def add_employee():
                                     departments=departments,
                                     errors=["Неверный формат данных"])
             
-            # Проверка уникальности email и телефона
-            check_query = """
-                SELECT EXISTS(
-                    SELECT 1 FROM employees 
-                    WHERE email = %s OR phone = %s
-                ) as exists
-            """
-            check_result = execute_query(check_query, (email, phone))
-            
-            if check_result and check_result[0]['exists']:
-                return render_template('company_director/add_employee.html',
-                                    departments=departments,
-                                    errors=["Сотрудник с таким email или телефоном уже существует"])
-            
-            # Вставляем сотрудника
+            # Сотрудник, проверка уникальности и назначение начальником - в одной транзакции
             insert_query = """
                 INSERT INTO employees (
-                    full_name, department_id, phone, email, is_active
-                ) VALUES (%s, %s, %s, %s, %s)
+                    full_name, department_id, phone, email, login_name, is_active
+                )
+                SELECT %s, %s, %s, %s, %s, %s
+                WHERE NOT EXISTS(
+                    SELECT 1 FROM employees 
+                    WHERE email = %s OR phone = %s OR login_name = %s
+                )
                 RETURNING employee_id
             """
+            update_manager = request.form.get('is_manager') == 'true'
             
             try:
-                result = execute_query(insert_query, (
-                    full_name, department_id, phone, email, is_active
-                ), fetch=True)
-                
-                if result:
-                    # Обновляем отдел, если этот сотрудник назначен начальником
-                    update_manager = request.form.get('is_manager') == 'true'
+                with transaction() as tx:
+                    employee = tx.execute_one(insert_query, (
+                        full_name, department_id, phone, email, login_name, is_active,
+                        email, phone, login_name
+                    ))
+                    
+                    if not employee:
+                        return render_template('company_director/add_employee.html',
+                                            departments=departments,
+                                            errors=["Сотрудник с таким email, телефоном или логином уже существует"])
+                    
                     if update_manager:
+                        # Обновляем отдел, если этот сотрудник назначен начальником
                         update_department_query = """
                             UPDATE departments 
                             SET manager_id = %s 
                             WHERE department_id = %s
                         """
-                        execute_query(update_department_query, (result[0]['employee_id'], department_id), fetch=False)
+                        tx.execute(update_department_query, (employee['employee_id'], department_id))
+                
+                if update_manager:
+                    # Прежний начальник отдела больше им не является
+                    invalidate_user_context()
                 
                 return redirect(url_for('manage_employees', success=True))
                 
@@ -1491,6 +1568,7 @@ def edit_employee(employee_id):
                 e.full_name,
                 e.phone,
                 e.email,
+                e.login_name,
                 e.department_id,
                 e.is_active,
                 d.manager_id
@@ -1507,13 +1585,14 @@ def edit_employee(employee_id):
         is_manager = employee['manager_id'] == employee_id
 
         # Получаем отделы
-        departments = execute_query("SELECT department_id, name FROM departments ORDER BY name")
+        departments = get_departments()
         
         if request.method == 'POST':
             # Собираем данные из формы
             full_name = request.form.get('full_name', '').strip()
             phone = request.form.get('phone', '').strip()
             email = request.form.get('email', '').strip()
+            login_name = request.form.get('login_name', '').strip() or None
             department_id = request.form.get('department_id')
             is_active = request.form.get('is_active', 'true')
             is_manager_new = request.form.get('is_manager') == 'true'
@@ -1537,6 +1616,9 @@ def edit_employee(employee_id):
             if phone and not phone.replace('+', '').isdigit():
                 errors.append("Телефон должен содержать только цифры")
             
+            if login_name and not validate_username(login_name):
+                errors.append("Неверный формат логина")
+            
             if errors:
                 return render_template('company_director/edit_employee.html',
                                     employee=employee,
@@ -1555,97 +1637,87 @@ def edit_employee(employee_id):
                                     is_manager=is_manager,
                                     errors=["Неверный формат данных"])
             
-            # Проверка уникальности email и телефона (кроме текущего сотрудника)
-            check_query = """
-                SELECT EXISTS(
+            # Изменение сотрудника (с проверкой уникальности email, телефона и логина
+            # среди остальных) и отделов - в одной транзакции
+            update_employee_query = """
+                UPDATE employees SET
+                    full_name = %s,
+                    department_id = %s,
+                    phone = %s,
+                    email = %s,
+                    login_name = %s,
+                    is_active = %s,
+                    updated_at = NOW()
+                WHERE employee_id = %s
+                AND NOT EXISTS(
                     SELECT 1 FROM employees 
-                    WHERE (email = %s OR phone = %s)
+                    WHERE (email = %s OR phone = %s OR login_name = %s)
                     AND employee_id != %s
-                ) as exists
+                )
+                RETURNING employee_id
             """
-            check_result = execute_query(check_query, (email, phone, employee_id))
-            
-            if check_result and check_result[0]['exists']:
-                return render_template('company_director/edit_employee.html',
-                                    employee=employee,
-                                    departments=departments,
-                                    is_manager=is_manager,
-                                    errors=["Сотрудник с таким email или телефоном уже существует"])
-            
-            # Начинаем транзакцию
-            conn = get_db_connection()
-            cur = conn.cursor()
+            old_department_id = employee['department_id']
             
             try:
-                # Обновляем сотрудника
-                update_employee_query = """
-                    UPDATE employees SET
-                        full_name = %s,
-                        department_id = %s,
-                        phone = %s,
-                        email = %s,
-                        is_active = %s,
-                        updated_at = NOW()
-                    WHERE employee_id = %s
-                """
-                cur.execute(update_employee_query, (
-                    full_name, department_id, phone, email, is_active, employee_id
-                ))
-                
-                # Управление назначением начальником отдела
-                old_department_id = employee['department_id']
-                
-                if is_manager_new and not is_manager:
-                    # Назначаем нового начальника
-                    update_department_query = """
-                        UPDATE departments 
-                        SET manager_id = %s 
-                        WHERE department_id = %s
-                    """
-                    cur.execute(update_department_query, (employee_id, department_id))
+                with transaction() as tx:
+                    updated = tx.execute_one(update_employee_query, (
+                        full_name, department_id, phone, email, login_name, is_active, employee_id,
+                        email, phone, login_name, employee_id
+                    ))
+                    
+                    if not updated:
+                        return render_template('company_director/edit_employee.html',
+                                            employee=employee,
+                                            departments=departments,
+                                            is_manager=is_manager,
+                                            errors=["Сотрудник с таким email, телефоном или логином уже существует"])
                     
-                elif not is_manager_new and is_manager:
-                    # Снимаем с должности начальника
-                    if department_id == old_department_id:
-                        # Если отдел не изменился, очищаем manager_id
-                        clear_manager_query = """
+                    # Управление назначением начальником отдела
+                    if is_manager_new and not is_manager:
+                        # Назначаем нового начальника
+                        update_department_query = """
                             UPDATE departments 
-                            SET manager_id = NULL 
-                            WHERE department_id = %s AND manager_id = %s
+                            SET manager_id = %s 
+                            WHERE department_id = %s
                         """
-                        cur.execute(clear_manager_query, (department_id, employee_id))
-                    else:
-                        # Если отдел изменился, начальником старого отдела больше не является
-                        pass
-                
-                elif is_manager_new and is_manager and department_id != old_department_id:
-                    # Переводим начальника в другой отдел
-                    # Очищаем старый отдел
-                    clear_old_department_query = """
-                        UPDATE departments 
-                        SET manager_id = NULL 
-                        WHERE department_id = %s AND manager_id = %s
-                    """
-                    cur.execute(clear_old_department_query, (old_department_id, employee_id))
+                        tx.execute(update_department_query, (employee_id, department_id))
+                        
+                    elif not is_manager_new and is_manager:
+                        # Снимаем с должности начальника
+                        if department_id == old_department_id:
+                            # Если отдел не изменился, очищаем manager_id
+                            clear_manager_query = """
+                                UPDATE departments 
+                                SET manager_id = NULL 
+                                WHERE department_id = %s AND manager_id = %s
+                            """
+                            tx.execute(clear_manager_query, (department_id, employee_id))
+                        else:
+                            # Если отдел изменился, начальником старого отдела больше не является
+                            pass
                     
-                    # Назначаем в новый отдел
-                    update_new_department_query = """
-                        UPDATE departments 
-                        SET manager_id = %s 
-                        WHERE department_id = %s
-                    """
-                    cur.execute(update_new_department_query, (employee_id, department_id))
+                    elif is_manager_new and is_manager and department_id != old_department_id:
+                        # Переводим начальника в другой отдел: очищаем старый отдел
+                        # и назначаем в новый одним запросом
+                        move_manager_query = """
+                            UPDATE departments 
+                            SET manager_id = CASE WHEN department_id = %s THEN %s END 
+                            WHERE department_id = %s
+                            OR (department_id = %s AND manager_id = %s)
+                        """
+                        tx.execute(move_manager_query, (
+                            department_id, employee_id, department_id, old_department_id, employee_id
+                        ))
                 
-                conn.commit()
-                cur.close()
-                conn.close()
+                # Контекст сотрудника устарел; при смене начальника отдела - контексты всех
+                if is_manager_new != is_manager or department_id != old_department_id:
+                    invalidate_user_context()
+                else:
+                    invalidate_user_context(employee_id)
                 
                 return redirect(url_for('manage_employees', success=True))
                 
             except Exception as e:
-                conn.rollback()
-                cur.close()
-                conn.close()
                 return render_template('company_director/edit_employee.html',
                                     employee=employee,
                                     departments=departments,
@@ -1667,73 +1739,40 @@ def edit_employee(employee_id):
 def delete_employee(employee_id):
     """Удаление сотрудника"""
     try:
-        # Проверяем существование сотрудника
-        employee_data = execute_query("SELECT * FROM employees WHERE employee_id = %s", (employee_id,))
-        
-        if not employee_data:
-            return redirect(url_for('manage_employees', error="Сотрудник не найден"))
-        
-        # Проверяем, является ли сотрудник начальником отдела
-        is_manager_query = """
-            SELECT EXISTS(
-                SELECT 1 FROM departments 
-                WHERE manager_id = %s
-            ) as is_manager
-        """
-        is_manager_result = execute_query(is_manager_query, (employee_id,))
-        
-        # Проверяем, есть ли связанные записи
-        has_policies_query = """
-            SELECT EXISTS(
-                SELECT 1 FROM policies 
-                WHERE created_by_employee_id = %s
-            ) as has_policies
-        """
-        has_policies_result = execute_query(has_policies_query, (employee_id,))
-        
-        has_documents_query = """
-            SELECT EXISTS(
-                SELECT 1 FROM documents 
-                WHERE created_by_employee_id = %s
-            ) as has_documents
-        """
-        has_documents_result = execute_query(has_documents_query, (employee_id,))
-        
-        # Удаляем сотрудника
-        conn = get_db_connection()
-        cur = conn.cursor()
-        
+        # Снятие с должности начальника отдела и удаление - в одной транзакции;
+        # связанные полисы и документы не дают удалить сотрудника (внешние ключи)
         try:
-            # Если сотрудник начальник отдела, очищаем это поле
-            if is_manager_result and is_manager_result[0]['is_manager']:
-                clear_manager_query = """
+            with transaction() as tx:
+                tx.execute("""
                     UPDATE departments 
                     SET manager_id = NULL 
                     WHERE manager_id = %s
-                """
-                cur.execute(clear_manager_query, (employee_id,))
-            
-            # Удаляем сотрудника
-            delete_query = "DELETE FROM employees WHERE employee_id = %s"
-            cur.execute(delete_query, (employee_id,))
-            
-            conn.commit()
-            cur.close()
-            conn.close()
-            
-            return redirect(url_for('manage_employees', success=True))
-            
+                """, (employee_id,))
+                was_manager = tx.rowcount > 0
+                
+                deleted = tx.execute_one(
+                    "DELETE FROM employees WHERE employee_id = %s RETURNING employee_id",
+                    (employee_id,)
+                )
+                
         except Exception as e:
-            conn.rollback()
-            cur.close()
-            conn.close()
-            
             # Проверяем, если ошибка из-за внешних ключей
             if "foreign key constraint" in str(e).lower():
                 return redirect(url_for('manage_employees', 
                                      error="Невозможно удалить сотрудника: имеются связанные записи в полисах или документах"))
             else:
                 return redirect(url_for('manage_employees', error=f"Ошибка при удалении: {str(e)}"))
+        
+        if not deleted:
+            return redirect(url_for('manage_employees', error="Сотрудник не найден"))
+        
+        # Контексты сотрудников отдела ссылались на удаленного начальника
+        if was_manager:
+            invalidate_user_context()
+        else:
+            invalidate_user_context(employee_id)
+        
+        return redirect(url_for('manage_employees', success=True))
 
     except Exception as e:
         print(f"Error deleting employee: {e}")
@@ -1742,38 +1781,10 @@ def delete_employee(employee_id):
 
 def get_employee_department(username):
     """Определяет отдел сотрудника по username"""
-    try:
-        query = """
-            SELECT d.department_id, d.name
-            FROM employees e
-            JOIN departments d ON e.department_id = d.department_id
-            WHERE e.email ILIKE %s OR e.email ILIKE %s
-            LIMIT 1
-        """
-        # Пробуем найти по email
-        email_pattern = f"%{username}@company.ru"
-        search_pattern = f"%{username}%"
-        result = execute_query(query, (email_pattern, search_pattern))
-        
-        if result:
-            return result[0]
-        return None
-    except Exception as e:
-        print(f"Error getting employee department: {e}")
-        return None
-
-def get_extended_user_role(username, role):
-    """Определяет расширенную роль с учетом отдела"""
-    try:
-        # Если пользователь auditor, проверяем его отдел
-        if role == 'auditor':
-            dept = get_employee_department(username)
-            if dept:
-                return 'auditor'  # Все аудиторы теперь имеют расширенные права
-        return role
-    except Exception as e:
-        print(f"Error getting extended role: {e}")
-        return role
+    identity = resolve_identity(username)
+    if identity and identity['department_id'] is not None:
+        return {'department_id': identity['department_id'], 'name': identity['department_name']}
+    return None
 
 
 
@@ -1783,21 +1794,13 @@ def get_extended_user_role(username, role):
 def auditor_dashboard():
     """Дашборд для аудиторов"""
     try:
-        # Получаем статистику
-        stats_query = """
-            SELECT 
-                (SELECT COUNT(*) FROM employees) as employees_count,
-                (SELECT COUNT(*) FROM policies) as policies_total,
-                (SELECT COUNT(*) FROM documents WHERE confidentiality_level < 2) as documents_count,
-                (SELECT COUNT(*) FROM clients) as clients_count
-        """
-        stats = execute_query(stats_query)
-        
-        stats_data = stats[0] if stats else {
-            'employees_count': 0,
-            'policies_total': 0,
-            'documents_count': 0,
-            'clients_count': 0
+        # Получаем статистику (аудитору доступны только документы с уровнем < 2)
+        company_stats = get_company_stats()
+        stats_data = {
+            'employees_count': company_stats['employees_count'],
+            'policies_total': company_stats['policies_count'],
+            'documents_count': company_stats['public_documents_count'],
+            'clients_count': company_stats['clients_count']
         }
         
         return render_template('auditor/dashboard.html', stats=stats_data)
@@ -1824,16 +1827,17 @@ def auditor_documents():
     """Просмотр документов для аудиторов"""
     try:
         # Аудиторы видят все документы кроме секретных (уровень 2)
-        docs_query = """
-            SELECT d.*, dep.name as department_name, emp.full_name as created_by
+        docs_query = f"""
+            SELECT {DOCUMENT_COLUMNS}, dep.name as department_name, emp.full_name as created_by
             FROM documents d
             JOIN departments dep ON d.created_in_department_id = dep.department_id
             JOIN employees emp ON d.created_by_employee_id = emp.employee_id
             WHERE d.confidentiality_level < 2
-            ORDER BY d.created_at DESC
         """
-        docs = execute_query(docs_query)
-        return render_template('auditor/documents.html', documents=docs)
+        page = paginate(docs_query,
+                        sort_columns={'created_at': ('created_at', 'document_id')},
+                        default_sort='created_at', default_direction='desc')
+        return render_template('auditor/documents.html', documents=page['rows'], page=page)
     except Exception as e:
         return render_template('auditor/documents.html', documents=[])
 
@@ -1843,23 +1847,8 @@ def auditor_documents():
 def auditor_clients():
     """Просмотр клиентов для аудиторов"""
     try:
-        clients_data = execute_query("""
-            SELECT 
-                client_id,
-                full_name,
-                phone,
-                email,
-                passport_series,
-                passport_number,
-                birth_date,
-                registration_address,
-                driver_license_series,
-                driver_license_number,
-                created_at
-            FROM clients 
-            ORDER BY full_name
-        """)
-        return render_template('auditor/clients.html', clients=clients_data)
+        page = paginate(CLIENTS_QUERY, sort_columns=CLIENTS_SORTS, default_sort='full_name')
+        return render_template('auditor/clients.html', clients=page['rows'], page=page)
     except Exception as e:
         return render_template('auditor/clients.html', clients=[])
     
@@ -1872,8 +1861,9 @@ def replace_document_file(document_id):
     """Замена файла документа"""
     try:
         user_id = session.get('user_id')
-        user_role = session.get('user_role')
-        user_dept_id = get_user_department(user_id)
+        context = get_user_context()
+        user_role = context['role']
+        user_dept_id = context['department_id']
         
         # Проверяем доступ
         has_access, document = check_document_access(user_role, user_dept_id, user_id, document_id, 'edit')
@@ -1897,11 +1887,10 @@ def replace_document_file(document_id):
                                   error="Недопустимый тип файла"))
         
         # Сохраняем новый файл С ОРИГИНАЛЬНЫМ ИМЕНЕМ
-        stored_file_path, saved_filename, file_size = save_document_file(
+        stored_file_path, saved_filename, file_size, file_hash = save_document_file(
             file, 
             document['created_in_department_id'], 
             document['confidentiality_level'],
-            document_id,
             use_original_name=True  # ← ВАЖНО!
         )
         
@@ -1917,20 +1906,22 @@ def replace_document_file(document_id):
             document_id,
             {
                 'stored_file_path': stored_file_path,
+                'content_hash': file_hash,
                 'file_size': file_size,
                 'file_name': new_filename
-            }
+            },
+            user_id
         )
         
         if not update_success:
-            # Удаляем только что сохраненный файл
-            delete_document_file(stored_file_path)
+            # Сохраненный файл удаляется в фоне (если на него не ссылаются другие документы)
+            enqueue_job('delete_blob', {'content_hash': file_hash}, delay=Config.BLOB_GC_DELAY)
             return redirect(url_for('view_document', document_id=document_id,
                                   error="Ошибка при обновлении записи в БД"))
         
-        # Создаем уведомление
-        change_description = f"Файл документа '{new_filename}' был заменен"
-        create_notification(document_id, user_id, change_description)
+        # Прежний файл удаляется и новый обрабатывается в фоне
+        enqueue_job('delete_file', {'stored_file_path': document['stored_file_path']})
+        enqueue_job('process_upload', {'document_id': document_id})
         
         return redirect(url_for('view_document', document_id=document_id,
                               success="Файл успешно заменен"))
@@ -0,0 +1,233 @@
+"""
+Модуль определения личности пользователя
+Одним запросом получает сотрудника, роли PostgreSQL, отдел и признак начальника отдела.
+Результат хранится в сессии как контекст пользователя и обновляется после инвалидации
+или по истечении Config.USER_CONTEXT_TTL.
+"""
+
+import threading
+import time
+from flask import session
+from config import Config
+from database.db import execute_query
+
+# Роли сотрудников в порядке приоритета
+EMPLOYEE_ROLES = ['company_director', 'hr_manager', 'department_manager', 'auditor', 'db_admin', 'employee']
+
+IDENTITY_QUERY = """
+    WITH member_roles AS (
+        SELECT COALESCE(array_agg(r.rolname::text), ARRAY[]::text[]) AS roles
+        FROM pg_roles r
+        JOIN pg_auth_members am ON r.oid = am.roleid
+        JOIN pg_user u ON u.usesysid = am.member
+        WHERE u.usename = %(login)s
+    ),
+    matched AS (
+        SELECT e.employee_id, e.full_name, e.email, e.is_active, e.department_id
+        FROM employees e
+        WHERE e.login_name = %(login)s AND e.is_active = true
+    )
+    SELECT
+        mr.roles,
+        m.employee_id,
+        m.full_name,
+        m.email,
+        m.is_active,
+        m.department_id,
+        d.name AS department_name,
+        (d.manager_id = m.employee_id) AS manages_own_department,
+        md.department_id AS managed_department_id,
+        md.name AS managed_department_name
+    FROM member_roles mr
+    LEFT JOIN matched m ON true
+    LEFT JOIN departments d ON d.department_id = m.department_id
+    LEFT JOIN LATERAL (
+        SELECT department_id, name FROM departments
+        WHERE manager_id = m.employee_id
+        ORDER BY department_id
+        LIMIT 1
+    ) md ON true
+"""
+
+
+def _role_from_employee(row):
+    """Роль по данным таблицы employees, если у пользователя нет ролей PostgreSQL"""
+    if row.get('manages_own_department') and row.get('department_id') == 1:
+        return 'company_director'
+    if row.get('manages_own_department'):
+        return 'department_manager'  # Начальник любого отдела
+    if row.get('department_id') == 3:
+        return 'hr_manager'
+    if row.get('department_id') == 4:
+        return 'auditor'  # Сотрудник отдела безопасности
+    return 'employee'
+
+
+def resolve_identity(username):
+    """
+    Определяет сотрудника, роль и отдел пользователя за один запрос к БД
+
+    Args:
+        username: имя пользователя PostgreSQL
+
+    Returns:
+        dict: employee (dict или None), role, roles, department_id,
+              department_name, managed_department_id, managed_department_name
+              или None при ошибке
+    """
+    try:
+        result = execute_query(IDENTITY_QUERY, {'login': username})
+        row = result[0] if result else {}
+    except Exception as e:
+        print(f"Error resolving identity: {e}")
+        return None
+
+    role_names = row.get('roles') or []
+    identity = {
+        'login': username,
+        'roles': role_names,
+        'employee': None,
+        'role': None,
+        'department_id': None,
+        'department_name': None,
+        'managed_department_id': None,
+        'managed_department_name': None,
+    }
+
+    # Для пользователей с ролью db_admin создаем специальную запись
+    if 'db_admin' in role_names:
+        identity['employee'] = {
+            'employee_id': 0,  # Специальный ID для db_admin
+            'full_name': 'Администратор БД',
+            'email': f"{username}@company.ru",
+            'is_active': True
+        }
+        identity['role'] = 'db_admin'
+        return identity
+
+    if row.get('employee_id') is None:
+        return identity
+
+    has_employee_role = any(role in EMPLOYEE_ROLES for role in role_names)
+
+    identity['employee'] = {
+        'employee_id': row['employee_id'],
+        'full_name': row['full_name'],
+        'email': row['email'],
+        'is_active': row['is_active']
+    }
+    identity['department_id'] = row['department_id']
+    identity['department_name'] = row['department_name']
+    identity['managed_department_id'] = row['managed_department_id']
+    identity['managed_department_name'] = row['managed_department_name']
+
+    if has_employee_role:
+        # Аудитор, назначенный начальником отдела, работает как department_manager
+        if 'auditor' in role_names and row['managed_department_id'] is not None:
+            identity['role'] = 'department_manager'
+        else:
+            identity['role'] = next(role for role in EMPLOYEE_ROLES if role in role_names)
+    else:
+        identity['role'] = _role_from_employee(row)
+
+    # Начальник без отдела из отдела безопасности работает как аудитор
+    if (identity['role'] == 'department_manager' and row['managed_department_id'] is None
+            and row['department_id'] == 4):
+        identity['role'] = 'auditor'
+
+    return identity
+
+
+# Время инвалидации контекста: по сотруднику и для всех пользователей сразу.
+# Хранится в памяти процесса и сбрасывает контекст сразу только в нем; остальные
+# процессы перечитывают контекст по истечении Config.USER_CONTEXT_TTL.
+_invalidated_at = {}
+_invalidated_all_at = 0.0
+_invalidation_lock = threading.Lock()
+
+
+def invalidate_user_context(employee_id=None):
+    """
+    Помечает контекст пользователя устаревшим
+
+    Args:
+        employee_id: ID сотрудника; None - сбросить контексты всех пользователей
+                     (например, после смены начальника отдела)
+    """
+    global _invalidated_all_at
+    now = time.time()
+    with _invalidation_lock:
+        if employee_id is None:
+            _invalidated_all_at = now
+        else:
+            _invalidated_at[employee_id] = now
+
+
+def _is_stale(context):
+    built_at = context.get('built_at', 0)
+    if time.time() - built_at > Config.USER_CONTEXT_TTL:
+        return True
+    if built_at < _invalidated_all_at:
+        return True
+    return built_at < _invalidated_at.get(context.get('employee_id'), 0)
+
+
+def store_user_context(identity):
+    """Сохраняет контекст пользователя в сессии"""
+    context = {
+        'login': identity['login'],
+        'employee_id': identity['employee']['employee_id'] if identity['employee'] else None,
+        'role': identity['role'],
+        'department_id': identity['department_id'],
+        'department_name': identity['department_name'],
+        'managed_department_id': identity['managed_department_id'],
+        'managed_department_name': identity['managed_department_name'],
+        'built_at': time.time(),
+    }
+    session['user_context'] = context
+    session['user_role'] = context['role']
+    if context['department_id']:
+        session['user_dept_id'] = context['department_id']
+    else:
+        session.pop('user_dept_id', None)
+    return context
+
+
+def get_user_context():
+    """
+    Возвращает контекст текущего пользователя из сессии
+
+    Запрос к БД выполняется только если контекст отсутствует, устарел
+    или был инвалидирован.
+
+    Returns:
+        dict: employee_id, role, department_id, department_name,
+              managed_department_id, managed_department_name
+              или None, если сотрудник деактивирован (сессия при этом очищается)
+    """
+    context = session.get('user_context')
+    if context and not _is_stale(context):
+        return context
+
+    login = session.get('user_login')
+    identity = resolve_identity(login) if login else None
+    if identity and identity['employee'] and identity['role']:
+        return store_user_context(identity)
+
+    if identity is not None and identity['employee'] is None:
+        # Логин больше не связан с активным сотрудником - завершаем сессию
+        print(f"DEBUG: No active employee for login {login}, clearing session")
+        session.clear()
+        return None
+
+    # Ошибка БД - работаем с тем, что есть в сессии
+    return context or {
+        'login': login,
+        'employee_id': session.get('user_id'),
+        'role': session.get('user_role'),
+        'department_id': session.get('user_dept_id'),
+        'department_name': None,
+        'managed_department_id': None,
+        'managed_department_name': None,
+        'built_at': 0,
+    }
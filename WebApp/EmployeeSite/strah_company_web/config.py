@@ -12,9 +12,102 @@ class Config:
     
     DATABASE_URI = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
     
+    # Пул соединений
+    DB_POOL_MIN_SIZE = int(os.environ.get('DB_POOL_MIN_SIZE', '1'))
+    DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '10'))
+    DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', '5'))  # секунд ожидания свободного соединения
+    DB_POOL_HEALTHCHECK_INTERVAL = float(os.environ.get('DB_POOL_HEALTHCHECK_INTERVAL', '30'))  # проверка SELECT 1 после простоя
+    
+    # Выполнение запросов под ролями PostgreSQL (SET ROLE), пул на каждую роль
+    DB_ROLE_SESSIONS = os.environ.get('DB_ROLE_SESSIONS', 'false').lower() in ['true', '1', 'yes', 'on']
+    DB_ROLE_POOL_ROLES = ('company_director', 'department_manager', 'employee', 'hr_manager', 'auditor', 'db_admin')
+    DB_ROLE_POOL_SIZE = int(os.environ.get('DB_ROLE_POOL_SIZE', '3'))
+    DB_ROLE_POOL_MAX_POOLS = int(os.environ.get('DB_ROLE_POOL_MAX_POOLS', '6'))  # LRU: простаивающие пулы сверх лимита закрываются
+    DB_ROLE_POOL_IDLE_TTL = float(os.environ.get('DB_ROLE_POOL_IDLE_TTL', '300'))  # LRU: пул без обращений дольше TTL закрывается (0 - без TTL)
+
+    # Контекст пользователя в сессии (auth/identity.py): перечитывается из БД не реже чем раз в TTL секунд,
+    # чтобы смена роли/отдела или деактивация, сделанная в другом процессе, дошла до всех сессий
+    USER_CONTEXT_TTL = int(os.environ.get('USER_CONTEXT_TTL', '60'))
+    
+    # Постраничный вывод списков
+    PAGE_SIZE_DEFAULT = int(os.environ.get('PAGE_SIZE_DEFAULT', '50'))
+    PAGE_SIZE_MAX = int(os.environ.get('PAGE_SIZE_MAX', '500'))
+
+    # Выгрузка таблиц: строк за одно обращение к серверному курсору
+    EXPORT_FETCH_SIZE = int(os.environ.get('EXPORT_FETCH_SIZE', '2000'))
+
+    # Массовая загрузка записей (database/bulk_import.py): строк отчета об ошибках на странице
+    IMPORT_ERROR_LIMIT = int(os.environ.get('IMPORT_ERROR_LIMIT', '1000'))
+
+    # Статистика дашбордов: максимальное устаревание счетчиков в кэше (секунды)
+    DASHBOARD_STATS_TTL = int(os.environ.get('DASHBOARD_STATS_TTL', '30'))
+
+    # Справочники форм (отделы): максимальное устаревание кэша (секунды)
+    REFERENCE_CACHE_TTL = int(os.environ.get('REFERENCE_CACHE_TTL', '300'))
+    # Поиск по префиксу (полисы, сотрудники): максимум подсказок в ответе
+    TYPEAHEAD_LIMIT = int(os.environ.get('TYPEAHEAD_LIMIT', '20'))
+
+    # Уведомления в реальном времени (LISTEN/NOTIFY -> server-sent events)
+    NOTIFICATIONS_CHANNEL = 'document_notifications'
+    # Изменения схемы БД (событийный триггер notify_schema_change) - сброс метаданных редактора таблиц
+    SCHEMA_CHANGES_CHANNEL = 'schema_changes'
+    SSE_HEARTBEAT_INTERVAL = int(os.environ.get('SSE_HEARTBEAT_INTERVAL', '15'))
+    SSE_QUEUE_SIZE = int(os.environ.get('SSE_QUEUE_SIZE', '100'))
+
+    # Фоновые задачи (python -m tasks.worker)
+    JOB_POLL_INTERVAL = float(os.environ.get('JOB_POLL_INTERVAL', '1'))
+    JOB_MAX_ATTEMPTS = int(os.environ.get('JOB_MAX_ATTEMPTS', '5'))
+    JOB_RETRY_DELAY = int(os.environ.get('JOB_RETRY_DELAY', '10'))  # секунды, удваивается с каждой попыткой
+    JOB_LOCK_TIMEOUT = int(os.environ.get('JOB_LOCK_TIMEOUT', '600'))  # задача в работе дольше - считается зависшей
+    JOB_RETENTION_DAYS = int(os.environ.get('JOB_RETENTION_DAYS', '7'))
+    
     # File upload configuration
     UPLOAD_FOLDER = os.path.join(os.path.dirname(__file__), 'uploads')
     ALLOWED_EXTENSIONS = {'pdf', 'doc', 'docx', 'xls', 'xlsx', 'jpg', 'jpeg', 'png', 'txt'}
+    UPLOAD_CHUNK_SIZE = 64 * 1024  # файл пишется на диск блоками этого размера
+    # Лимит размера файла по ролям (байты); запрос сверх лимита отклоняется до разбора формы
+    UPLOAD_ROLE_QUOTAS = {
+        'company_director': 100 * 1024 * 1024,
+        'db_admin': 100 * 1024 * 1024,
+        'department_manager': 50 * 1024 * 1024,
+        'hr_manager': 20 * 1024 * 1024,
+    }
+    UPLOAD_DEFAULT_QUOTA = 10 * 1024 * 1024
+    UPLOAD_FORM_OVERHEAD = 64 * 1024  # поля формы и заголовки multipart сверх размера файла
+    MAX_CONTENT_LENGTH = max(UPLOAD_ROLE_QUOTAS.values()) + UPLOAD_FORM_OVERHEAD
+    # Файл хранилища без ссылок удаляется не сразу: за это время загрузка того же
+    # файла успеет сослаться на него (то же значение в триггере count_document_blobs)
+    BLOB_GC_DELAY = 600  # секунды
+
+    # Хранилище файлов документов (documents/storage_backends.py): 'local' или 's3' (требует boto3)
+    STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'local')
+    S3_BUCKET = os.environ.get('S3_BUCKET', 'documents')
+    S3_PREFIX = os.environ.get('S3_PREFIX', '')
+    S3_ENDPOINT_URL = os.environ.get('S3_ENDPOINT_URL')  # например http://localhost:9000 для MinIO
+    S3_REGION = os.environ.get('S3_REGION', 'us-east-1')
+    S3_ACCESS_KEY = os.environ.get('S3_ACCESS_KEY')
+    S3_SECRET_KEY = os.environ.get('S3_SECRET_KEY')
+    S3_PRESIGN_EXPIRES = int(os.environ.get('S3_PRESIGN_EXPIRES', '300'))  # секунды
+    # Скачивание по временной ссылке хранилища, минуя приложение (если хранилище их выдает)
+    STORAGE_REDIRECT_DOWNLOADS = os.environ.get('STORAGE_REDIRECT_DOWNLOADS', 'true').lower() in ['true', '1', 'yes', 'on']
+    # Отдача файлов веб-сервером после проверки доступа (documents/downloads.py):
+    #   ''         - файл отдает приложение (с поддержкой Range и ETag)
+    #   'nginx'    - X-Accel-Redirect на internal location, например:
+    #                location /protected-uploads/ { internal; alias /path/to/uploads/; }
+    #   'sendfile' - X-Sendfile (Apache mod_xsendfile, lighttpd)
+    DOWNLOAD_OFFLOAD = os.environ.get('DOWNLOAD_OFFLOAD', '')
+    DOWNLOAD_ACCEL_PREFIX = os.environ.get('DOWNLOAD_ACCEL_PREFIX', '/protected-uploads/')
+    USE_X_SENDFILE = DOWNLOAD_OFFLOAD == 'sendfile'
+
+    # Превью документов (documents/previews.py): изображения - Pillow, PDF - pdftoppm
+    PREVIEW_MAX_SIZE = (320, 320)
+    PREVIEW_QUALITY = 80
+    PREVIEW_RENDER_TIMEOUT = 20  # секунды на рендеринг страницы PDF
+    PREVIEW_MAX_AGE = 365 * 24 * 3600  # URL превью содержит версию файла, кешируется надолго
+
+    # Полнотекстовый поиск (documents/search.py, documents/text_extraction.py)
+    SEARCH_TEXT_LIMIT = 100000  # символов текста файла в индексе (tsvector ограничен 1 МБ)
+    SEARCH_EXTRACT_TIMEOUT = 30  # секунды на извлечение текста из PDF
     
     # Security settings
     SESSION_PERMANENT = True
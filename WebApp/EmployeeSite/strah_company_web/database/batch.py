@@ -0,0 +1,204 @@
+"""
+Модуль пакетных изменений для универсального редактора таблиц (db_admin)
+Выбранные записи (список ID или фильтр по колонке) изменяются или удаляются
+одним запросом в одной транзакции; записи с разными значениями обновляются
+одним UPDATE ... FROM (VALUES ...) через execute_values. Имена колонок
+проверяются по метаданным схемы (database/schema.py).
+"""
+
+from psycopg2 import sql
+from psycopg2.extras import execute_values
+from database.db import get_db_connection, release_db_connection
+from database.schema import get_table_schema, coerce_value
+
+# Операторы фильтра выбора записей
+FILTER_OPERATORS = {
+    '=': '=', '<>': '<>', '<': '<', '<=': '<=', '>': '>', '>=': '>=',
+    'is_null': 'IS NULL', 'is_not_null': 'IS NOT NULL',
+}
+READONLY_COLUMNS = ('created_at', 'updated_at')
+
+
+def _table(table_name):
+    schema = get_table_schema(table_name)
+    if schema is None or len(schema['primary_key']) != 1:
+        raise ValueError(f"Пакетные изменения таблицы {table_name} не поддерживаются")
+    return schema, {column['column_name']: column for column in schema['columns']}
+
+
+def _column(columns, name, writable=False):
+    if name not in columns or (writable and name in READONLY_COLUMNS):
+        raise ValueError(f"Неизвестная колонка: {name}")
+    return columns[name]
+
+
+def _value(column, value):
+    """Значение из формы для колонки: пустая строка - NULL"""
+    if value is None or value == '':
+        if column['is_nullable'] == 'NO':
+            raise ValueError(f"Поле '{column['column_name']}' не может быть пустым")
+        return None
+    try:
+        return coerce_value(column, value)
+    except ValueError:
+        raise ValueError(f"Неверный формат значения поля '{column['column_name']}'")
+
+
+def _where(schema, columns, ids=None, filters=None):
+    """
+    Условие выбора записей: по списку ID и/или по фильтрам
+
+    Args:
+        ids: значения первичного ключа
+        filters: [(колонка, оператор из FILTER_OPERATORS, значение)]
+
+    Returns:
+        (sql.Composed, list) - условие и параметры
+    """
+    conditions, params = [], []
+    if ids is not None:
+        conditions.append(sql.SQL('{} = ANY(%s)').format(sql.Identifier(schema['primary_key'][0])))
+        params.append(list(ids))
+    for name, operator, value in filters or []:
+        column = _column(columns, name)
+        if operator not in FILTER_OPERATORS:
+            raise ValueError(f"Неизвестный оператор фильтра: {operator}")
+        if operator in ('is_null', 'is_not_null'):
+            conditions.append(sql.SQL('{} ' + FILTER_OPERATORS[operator]).format(sql.Identifier(name)))
+        else:
+            conditions.append(sql.SQL('{} ' + FILTER_OPERATORS[operator] + ' %s').format(sql.Identifier(name)))
+            try:
+                params.append(coerce_value(column, value))
+            except ValueError:
+                raise ValueError(f"Неверный формат значения фильтра '{name}'")
+    # Без условия пакетная операция затронула бы всю таблицу
+    if not conditions:
+        raise ValueError("Не выбраны записи")
+    return sql.SQL(' AND ').join(conditions), params
+
+
+def _execute(query, params):
+    """Выполняет изменение в отдельной транзакции, возвращает число затронутых строк"""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute(query, params)
+        rowcount = cur.rowcount
+        conn.commit()
+        return rowcount
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        release_db_connection(conn)
+
+
+def batch_update(table_name, changes, ids=None, filters=None):
+    """
+    Устанавливает одинаковые значения колонок у выбранных записей
+
+    Args:
+        table_name: таблица
+        changes: {колонка: значение из формы}
+        ids, filters: выбор записей (см. _where)
+
+    Returns:
+        int: число измененных записей
+
+    Raises:
+        ValueError: неизвестная колонка, неверное значение или не выбраны записи
+    """
+    schema, columns = _table(table_name)
+    if not changes:
+        raise ValueError("Не указаны изменения")
+    assignments, params = [], []
+    for name, value in changes.items():
+        column = _column(columns, name, writable=True)
+        assignments.append(sql.SQL('{} = %s').format(sql.Identifier(name)))
+        params.append(_value(column, value))
+    if 'updated_at' in columns:
+        assignments.append(sql.SQL('updated_at = NOW()'))
+
+    where, where_params = _where(schema, columns, ids, filters)
+    query = sql.SQL("UPDATE {table} SET {assignments} WHERE {where}").format(
+        table=sql.Identifier(table_name), assignments=sql.SQL(', ').join(assignments), where=where)
+    rowcount = _execute(query, params + where_params)
+    print(f"DEBUG: Batch update {table_name}: {rowcount} rows")
+    return rowcount
+
+
+def batch_update_rows(table_name, rows):
+    """
+    Обновляет записи разными значениями одним запросом
+
+    Args:
+        table_name: таблица
+        rows: [{первичный ключ: ID, колонка: значение, ...}] - набор колонок у всех строк одинаковый
+
+    Returns:
+        int: число измененных записей
+    """
+    schema, columns = _table(table_name)
+    if not rows:
+        return 0
+    key = schema['primary_key'][0]
+    names = [name for name in rows[0] if name != key]
+    if not names or any(set(row) != set(rows[0]) for row in rows):
+        raise ValueError("У всех строк должны быть первичный ключ и одинаковый набор колонок")
+    targets = [_column(columns, name, writable=True) for name in names]
+
+    values = []
+    for row in rows:
+        values.append([coerce_value(columns[key], str(row[key]))] +
+                      [_value(column, None if row[column['column_name']] is None else str(row[column['column_name']]))
+                       for column in targets])
+
+    assignments = [sql.SQL('{name} = v.{name}').format(name=sql.Identifier(name)) for name in names]
+    if 'updated_at' in columns:
+        assignments.append(sql.SQL('updated_at = NOW()'))
+    # Типы колонок в шаблоне: в VALUES параметры иначе приходят как text
+    template = sql.SQL('({})').format(sql.SQL(', ').join(
+        sql.SQL('%s::' + columns[name]['data_type']) for name in [key] + names))
+
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        query = sql.SQL("""
+            UPDATE {table} t SET {assignments}
+            FROM (VALUES %s) AS v({columns})
+            WHERE t.{key} = v.{key}
+        """).format(table=sql.Identifier(table_name), assignments=sql.SQL(', ').join(assignments),
+                    columns=sql.SQL(', ').join(sql.Identifier(name) for name in [key] + names),
+                    key=sql.Identifier(key))
+        rowcount = 0
+        # execute_values разбивает строки на запросы по page_size; rowcount - у последнего
+        page_size = 1000
+        for start in range(0, len(values), page_size):
+            execute_values(cur, query.as_string(conn), values[start:start + page_size],
+                           template=template.as_string(conn), page_size=page_size)
+            rowcount += cur.rowcount
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        release_db_connection(conn)
+    print(f"DEBUG: Batch update {table_name}: {rowcount} rows (per-row values)")
+    return rowcount
+
+
+def batch_delete(table_name, ids=None, filters=None):
+    """
+    Удаляет выбранные записи одним запросом
+
+    Returns:
+        int: число удаленных записей
+    """
+    schema, columns = _table(table_name)
+    where, params = _where(schema, columns, ids, filters)
+    query = sql.SQL("DELETE FROM {table} WHERE {where}").format(table=sql.Identifier(table_name), where=where)
+    rowcount = _execute(query, params)
+    print(f"DEBUG: Batch delete {table_name}: {rowcount} rows")
+    return rowcount
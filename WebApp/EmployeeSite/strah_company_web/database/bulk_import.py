@@ -0,0 +1,451 @@
+"""
+Модуль массовой загрузки записей из CSV/XLSX (db_admin)
+Файл читается потоково, каждая строка проверяется по метаданным колонок
+(database/schema.py) и сразу передается в COPY FROM STDIN во временную
+таблицу. Внешние ключи, уникальность и CHECK проверяются одним запросом на
+ограничение, отклоненные строки попадают в отчет, остальные переносятся в
+таблицу одним INSERT ... SELECT (при колонке первичного ключа в файле -
+с обновлением существующих записей).
+
+Запуск из командной строки (замер скорости загрузки):
+    python -m database.bulk_import clients clients.csv [--dry-run]
+"""
+
+import argparse
+import csv
+import io
+import json
+import os
+import time
+from datetime import date, datetime
+from psycopg2 import sql
+from config import Config
+from database.db import get_db_connection, release_db_connection
+from database.schema import get_table_schema, coerce_value, INTEGER_TYPES, DECIMAL_TYPES
+
+try:
+    from openpyxl import load_workbook
+except ImportError:  # XLSX не поддерживается, CSV загружается
+    load_workbook = None
+
+IMPORT_TABLES = ['clients', 'policies', 'employees']
+IMPORT_FORMATS = ('csv', 'xlsx')
+# Заполняются базой; при выгрузке таблицы попадают в файл и при загрузке пропускаются
+SYSTEM_COLUMNS = ('created_at', 'updated_at')
+STAGING_TABLE = 'import_staging'
+CSV_DELIMITERS = (',', ';', '\t')
+
+BOOLEAN_VALUES = {
+    'true': True, 't': True, '1': True, 'yes': True, 'y': True, 'on': True, 'да': True,
+    'false': False, 'f': False, '0': False, 'no': False, 'n': False, 'off': False, 'нет': False,
+}
+DATE_FORMATS = ('%Y-%m-%d', '%d.%m.%Y')
+DATETIME_FORMATS = ('%d.%m.%Y %H:%M:%S', '%d.%m.%Y %H:%M')
+
+
+def _cell_text(value):
+    """Значение ячейки XLSX в виде текста, как в CSV"""
+    if value is None:
+        return ''
+    if isinstance(value, datetime):
+        return value.isoformat(sep=' ')
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def _read_csv(path):
+    with open(path, 'rb') as f:
+        head = f.read(64 * 1024)
+    encoding = 'utf-8-sig'
+    try:
+        head.decode(encoding)
+    except UnicodeDecodeError as e:
+        # Символ, обрезанный границей прочитанного блока, не ошибка кодировки
+        if not (e.start >= len(head) - 3 and e.reason == 'unexpected end of data'):
+            encoding = 'cp1251'
+
+    with open(path, newline='', encoding=encoding) as f:
+        # Разделитель - самый частый в строке заголовка (Excel в русской локали пишет ';')
+        header = f.readline()
+        delimiter = max(CSV_DELIMITERS, key=header.count)
+        f.seek(0)
+        for row in csv.reader(f, delimiter=delimiter):
+            yield row
+
+
+def _read_xlsx(path):
+    if load_workbook is None:
+        raise ValueError("Для загрузки XLSX на сервере нужен пакет openpyxl; сохраните файл как CSV")
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        for row in workbook.worksheets[0].iter_rows(values_only=True):
+            yield [_cell_text(value) for value in row]
+    finally:
+        workbook.close()
+
+
+def _parse_temporal(value, data_type):
+    if data_type == 'date':
+        for date_format in DATE_FORMATS:
+            try:
+                return datetime.strptime(value, date_format).date()
+            except ValueError:
+                pass
+        raise ValueError("ожидается дата (ГГГГ-ММ-ДД или ДД.ММ.ГГГГ)")
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        pass
+    for datetime_format in DATETIME_FORMATS:
+        try:
+            return datetime.strptime(value, datetime_format)
+        except ValueError:
+            pass
+    raise ValueError("ожидается дата и время (ГГГГ-ММ-ДД ЧЧ:ММ)")
+
+
+def _parse_value(column, value):
+    """
+    Значение ячейки для COPY (None - NULL)
+
+    Raises:
+        ValueError: значение не соответствует колонке (сообщение для отчета)
+    """
+    data_type = column['data_type']
+    if data_type in INTEGER_TYPES or data_type in DECIMAL_TYPES:
+        try:
+            return coerce_value(column, value)
+        except ValueError:
+            raise ValueError("ожидается число")
+    if data_type == 'boolean':
+        if value.lower() not in BOOLEAN_VALUES:
+            raise ValueError("ожидается да/нет (true/false)")
+        return 't' if BOOLEAN_VALUES[value.lower()] else 'f'
+    if data_type == 'date' or data_type.startswith('timestamp'):
+        return _parse_temporal(value, data_type).isoformat()
+    if data_type in ('json', 'jsonb'):
+        try:
+            json.loads(value)
+        except ValueError:
+            raise ValueError("ожидается JSON")
+        return value
+    length = column['character_maximum_length']
+    if length and len(value) > length:
+        raise ValueError(f"длиннее {length} символов")
+    return value
+
+
+def _is_required(column):
+    return column['is_nullable'] == 'NO' and not column['column_default']
+
+
+def _map_header(header, schema):
+    """
+    Колонки таблицы в порядке колонок файла
+
+    Returns:
+        list: метаданные колонки или None (колонка файла пропускается)
+
+    Raises:
+        ValueError: неизвестные, повторяющиеся или отсутствующие обязательные колонки
+    """
+    by_name = {column['column_name']: column for column in schema['columns']}
+    mapped, unknown, seen = [], [], set()
+    for name in header:
+        name = name.strip().lower()
+        if not name:
+            # Пустые колонки справа (частый случай в XLSX)
+            mapped.append(None)
+            continue
+        if name in seen:
+            raise ValueError(f"Колонка {name} указана в файле дважды")
+        seen.add(name)
+        if name in SYSTEM_COLUMNS:
+            mapped.append(None)
+        elif name in by_name:
+            mapped.append(by_name[name])
+        else:
+            unknown.append(name)
+    if unknown:
+        raise ValueError(f"Неизвестные колонки: {', '.join(unknown)}")
+
+    missing = [column['column_name'] for column in schema['columns']
+               if _is_required(column) and column['column_name'] not in seen]
+    if missing:
+        raise ValueError(f"В файле нет обязательных колонок: {', '.join(missing)}")
+    return mapped
+
+
+class _CopySource:
+    """Файлоподобный объект для copy_expert поверх генератора блоков CSV"""
+
+    def __init__(self, chunks):
+        self._chunks = chunks
+        self._buffer = ''
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buffer) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buffer += chunk
+        if size < 0:
+            data, self._buffer = self._buffer, ''
+        else:
+            data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+
+def _copy_chunks(rows, columns, result):
+    """Проверяет строки файла и отдает подходящие блоками CSV для COPY"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for line_number, row in rows:
+        if not any(cell.strip() for cell in row):
+            continue
+        result['total_rows'] += 1
+        values = [line_number]
+        errors = []
+        for index, column in enumerate(columns):
+            if column is None:
+                continue
+            value = row[index].strip() if index < len(row) else ''
+            if not value:
+                if _is_required(column):
+                    errors.append(f"{column['column_name']}: обязательное поле")
+                values.append(None)
+                continue
+            try:
+                values.append(_parse_value(column, value))
+            except ValueError as e:
+                errors.append(f"{column['column_name']}: {e}")
+        if errors:
+            _reject(result, line_number, '; '.join(errors))
+            continue
+        writer.writerow(values)
+        if buffer.tell() >= Config.UPLOAD_CHUNK_SIZE:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def _reject(result, line_number, message):
+    result['rejected'] += 1
+    if len(result['errors']) < Config.IMPORT_ERROR_LIMIT:
+        result['errors'].append({'line': line_number, 'message': message})
+
+
+def _reject_rows(cur, result, query, message):
+    """Удаляет из временной таблицы строки, не прошедшие проверку (запрос с RETURNING row_no[, value])"""
+    cur.execute(query)
+    for row in sorted(cur.fetchall(), key=lambda row: row['row_no']):
+        _reject(result, row['row_no'], message.format(value=row.get('value')))
+
+
+def _check_constraints(cur, table_name, schema, names, upsert_key, result):
+    """Проверки ограничений таблицы для всех строк сразу"""
+    staging = sql.Identifier(STAGING_TABLE)
+    target = sql.Identifier(table_name)
+
+    for key in [schema['primary_key']] + [unique['columns'] for unique in schema['unique_keys']]:
+        if not key or not set(key) <= set(names):
+            continue
+        label = ', '.join(key)
+        # Повтор в файле: остается первая строка
+        _reject_rows(cur, result, sql.SQL("""
+            DELETE FROM {staging} s USING {staging} f
+            WHERE ({f_key}) = ({s_key}) AND f.row_no < s.row_no
+            RETURNING s.row_no
+        """).format(staging=staging,
+                    f_key=sql.SQL(', ').join(sql.SQL('f.') + sql.Identifier(n) for n in key),
+                    s_key=sql.SQL(', ').join(sql.SQL('s.') + sql.Identifier(n) for n in key)),
+            f"{label}: повтор значения из строки выше")
+        if key == upsert_key:
+            continue
+        # Значение уже есть у другой записи таблицы
+        same_record = sql.SQL('')
+        if upsert_key:
+            same_record = sql.SQL(' AND t.{key} IS DISTINCT FROM s.{key}').format(
+                key=sql.Identifier(upsert_key[0]))
+        _reject_rows(cur, result, sql.SQL("""
+            DELETE FROM {staging} s USING {target} t
+            WHERE ({t_key}) = ({s_key}){same_record}
+            RETURNING s.row_no
+        """).format(staging=staging, target=target, same_record=same_record,
+                    t_key=sql.SQL(', ').join(sql.SQL('t.') + sql.Identifier(n) for n in key),
+                    s_key=sql.SQL(', ').join(sql.SQL('s.') + sql.Identifier(n) for n in key)),
+            f"{label}: значение уже есть в таблице")
+
+    for name, (ref_table, ref_column) in schema['foreign_keys'].items():
+        if name not in names:
+            continue
+        _reject_rows(cur, result, sql.SQL("""
+            DELETE FROM {staging} s
+            WHERE s.{column} IS NOT NULL
+              AND NOT EXISTS (SELECT 1 FROM {ref_table} r WHERE r.{ref_column} = s.{column})
+            RETURNING s.row_no, s.{column} AS value
+        """).format(staging=staging, column=sql.Identifier(name),
+                    ref_table=sql.Identifier(ref_table), ref_column=sql.Identifier(ref_column)),
+            f"{name}: нет записи {ref_table}.{ref_column} = {{value}}")
+
+    for check in schema['checks']:
+        if not set(check['columns']) <= set(names):
+            continue
+        # Выражение из pg_catalog ссылается на колонки, которые есть и во временной таблице
+        _reject_rows(cur, result, sql.SQL("DELETE FROM {staging} WHERE NOT ({expression}) RETURNING row_no").format(
+            staging=staging, expression=sql.SQL(check['expression'])),
+            f"нарушено ограничение {check['name']}")
+
+
+def _merge(cur, table_name, schema, names, upsert_key):
+    """Переносит проверенные строки в таблицу, возвращает (добавлено, обновлено)"""
+    by_name = {column['column_name']: column for column in schema['columns']}
+    select_list = []
+    for name in names:
+        default = by_name[name]['column_default']
+        if default and default != 'identity':
+            # Пустая ячейка колонки со значением по умолчанию - значение по умолчанию
+            select_list.append(sql.SQL('COALESCE({name}, {default})').format(
+                name=sql.Identifier(name), default=sql.SQL(default)))
+        else:
+            select_list.append(sql.Identifier(name))
+
+    conflict = sql.SQL('')
+    if upsert_key:
+        updates = [sql.SQL('{name} = EXCLUDED.{name}').format(name=sql.Identifier(name))
+                   for name in names if name not in upsert_key]
+        if 'updated_at' in by_name:
+            updates.append(sql.SQL('updated_at = NOW()'))
+        conflict = sql.SQL(' ON CONFLICT ({key}) DO UPDATE SET {updates}').format(
+            key=sql.SQL(', ').join(sql.Identifier(name) for name in upsert_key),
+            updates=sql.SQL(', ').join(updates))
+
+    # xmax = 0 только у вставленных строк, у обновленных - номер этой транзакции
+    cur.execute(sql.SQL("""
+        WITH merged AS (
+            INSERT INTO {target} ({columns})
+            SELECT {select_list} FROM {staging} ORDER BY row_no{conflict}
+            RETURNING (xmax = 0) AS inserted
+        )
+        SELECT COUNT(*) FILTER (WHERE inserted) AS inserted,
+               COUNT(*) FILTER (WHERE NOT inserted) AS updated
+        FROM merged
+    """).format(target=sql.Identifier(table_name),
+                columns=sql.SQL(', ').join(sql.Identifier(name) for name in names),
+                select_list=sql.SQL(', ').join(select_list),
+                staging=sql.Identifier(STAGING_TABLE), conflict=conflict))
+    counts = cur.fetchone()
+    inserted, updated = counts['inserted'], counts['updated']
+
+    if upsert_key:
+        # Ключи из файла не берутся из последовательности - сдвигаем ее за максимальный
+        cur.execute(sql.SQL("""
+            SELECT setval(seq, GREATEST((SELECT MAX({key}) FROM {target}), 1))
+            FROM pg_get_serial_sequence(%s, %s) AS seq
+            WHERE seq IS NOT NULL
+        """).format(key=sql.Identifier(upsert_key[0]), target=sql.Identifier(table_name)),
+            (table_name, upsert_key[0]))
+    return inserted, updated
+
+
+def import_file(table_name, path, file_format, dry_run=False):
+    """
+    Загружает записи из файла в таблицу
+
+    Args:
+        table_name: таблица из IMPORT_TABLES
+        path: путь к файлу
+        file_format: 'csv' или 'xlsx'
+        dry_run: только проверить, изменения откатываются
+
+    Returns:
+        dict: total_rows, inserted, updated, rejected, errors (не больше
+              IMPORT_ERROR_LIMIT: [{line, message}]), seconds, rows_per_second
+
+    Raises:
+        ValueError: таблица или файл не подходят для загрузки целиком
+    """
+    if table_name not in IMPORT_TABLES:
+        raise ValueError(f"Загрузка в таблицу {table_name} не поддерживается")
+    if file_format not in IMPORT_FORMATS:
+        raise ValueError("Поддерживаются файлы CSV и XLSX")
+    schema = get_table_schema(table_name)
+    if schema is None:
+        raise ValueError(f"Таблица {table_name} не найдена")
+
+    started = time.monotonic()
+    reader = _read_csv(path) if file_format == 'csv' else _read_xlsx(path)
+    rows = enumerate(reader, start=1)
+    first = next(rows, None)
+    if first is None:
+        raise ValueError("Файл пуст")
+    columns = _map_header(first[1], schema)
+    names = [column['column_name'] for column in columns if column is not None]
+    if not names:
+        raise ValueError("В файле нет колонок таблицы")
+    # Колонка первичного ключа в файле: строки с существующим ключом обновляются
+    upsert_key = schema['primary_key'] if set(schema['primary_key']) <= set(names) else []
+
+    result = {
+        'table': table_name, 'total_rows': 0, 'inserted': 0, 'updated': 0,
+        'rejected': 0, 'errors': [], 'dry_run': dry_run,
+    }
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute(sql.SQL("""
+            CREATE TEMP TABLE {staging} ON COMMIT DROP AS
+            SELECT 0 AS row_no, {columns} FROM {target} WITH NO DATA
+        """).format(staging=sql.Identifier(STAGING_TABLE),
+                    columns=sql.SQL(', ').join(sql.Identifier(name) for name in names),
+                    target=sql.Identifier(table_name)))
+        cur.copy_expert(
+            sql.SQL("COPY {staging} (row_no, {columns}) FROM STDIN WITH (FORMAT csv)").format(
+                staging=sql.Identifier(STAGING_TABLE),
+                columns=sql.SQL(', ').join(sql.Identifier(name) for name in names)).as_string(conn),
+            _CopySource(_copy_chunks(rows, columns, result)),
+        )
+        cur.execute(sql.SQL("ANALYZE {staging}").format(staging=sql.Identifier(STAGING_TABLE)))
+
+        _check_constraints(cur, table_name, schema, names, upsert_key, result)
+        result['inserted'], result['updated'] = _merge(cur, table_name, schema, names, upsert_key)
+
+        if dry_run:
+            conn.rollback()
+        else:
+            conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        release_db_connection(conn)
+
+    result['errors'].sort(key=lambda error: error['line'])
+    result['seconds'] = time.monotonic() - started
+    result['rows_per_second'] = int(result['total_rows'] / result['seconds']) if result['seconds'] else 0
+    print(f"DEBUG: Imported {table_name}: {result['total_rows']} rows, {result['inserted']} inserted, "
+          f"{result['updated']} updated, {result['rejected']} rejected "
+          f"in {result['seconds']:.2f}s ({result['rows_per_second']} rows/s)")
+    return result
+
+
+def get_import_format(filename):
+    """Формат файла по расширению ('csv', 'xlsx') или None"""
+    extension = os.path.splitext(filename or '')[1].lower().lstrip('.')
+    return 'csv' if extension == 'txt' else extension if extension in IMPORT_FORMATS else None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Массовая загрузка записей из CSV/XLSX")
+    parser.add_argument('table', choices=IMPORT_TABLES)
+    parser.add_argument('path')
+    parser.add_argument('--dry-run', action='store_true', help="только проверить файл, изменения откатываются")
+    args = parser.parse_args()
+    summary = import_file(args.table, args.path, get_import_format(args.path) or 'csv', dry_run=args.dry_run)
+    for error in summary['errors']:
+        print(f"строка {error['line']}: {error['message']}")
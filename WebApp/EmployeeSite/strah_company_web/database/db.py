@@ -1,26 +1,482 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
 import psycopg2
+from psycopg2 import extensions, sql
+from psycopg2.pool import PoolError
 from psycopg2.extras import RealDictCursor
+from flask import g, has_app_context, has_request_context, session
 from config import Config
 
-def get_db_connection():
-    conn = psycopg2.connect(
-        host=Config.DB_HOST,
-        port=Config.DB_PORT,
-        database=Config.DB_NAME,
-        user=Config.DB_USER,
-        password=Config.DB_PASSWORD,
-        cursor_factory=RealDictCursor
-    )
-    return conn
-
-def execute_query(query, params=None, fetch=True):
-    conn = get_db_connection()
+
+class PoolTimeoutError(PoolError):
+    """Пул исчерпан: свободное соединение не появилось за отведенное время"""
+
+
+class ConnectionPool:
+    """
+    Потокобезопасный пул соединений с PostgreSQL
+
+    Соединения создаются лениво до max_size, при выдаче проверяется их
+    состояние, а при исчерпании пула запрос ждет не дольше timeout секунд.
+    """
+
+    def __init__(self, min_size, max_size, timeout, healthcheck_interval, role=None, **connect_kwargs):
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.healthcheck_interval = healthcheck_interval
+        self.role = role
+        self.connect_kwargs = connect_kwargs
+
+        self._cond = threading.Condition()
+        self._idle = []  # [(conn, время возврата в пул)]
+        self._applied_roles = {}  # id(conn) -> роль, установленная через SET ROLE
+        self._size = 0
+        self._in_use = 0
+        self._waiting = 0
+        self._reserved = 0  # выдачи, обещанные менеджером пулов, но еще не начатые
+        self._closed = False
+
+        # Метрики
+        self._checkouts = 0
+        self._timeouts = 0
+        self._discarded = 0
+        self._checkout_time_total = 0.0
+        self._checkout_time_max = 0.0
+
+    def _connect(self):
+        return psycopg2.connect(**self.connect_kwargs)
+
+    def fill(self):
+        """Создает минимальное количество соединений"""
+        while True:
+            with self._cond:
+                if self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                conn = self._connect()
+            except Exception:
+                with self._cond:
+                    self._size -= 1
+                raise
+            with self._cond:
+                self._idle.append((conn, time.monotonic()))
+                self._cond.notify()
+
+    def _is_healthy(self, conn, idle_since):
+        """Проверяет соединение перед выдачей"""
+        if conn.closed:
+            return False
+        if conn.get_transaction_status() == extensions.TRANSACTION_STATUS_UNKNOWN:
+            return False
+        # Запрос к серверу только для давно простаивающих соединений
+        if time.monotonic() - idle_since >= self.healthcheck_interval:
+            try:
+                cur = conn.cursor()
+                cur.execute("SELECT 1")
+                cur.close()
+                conn.rollback()
+            except psycopg2.Error:
+                return False
+        return True
+
+    def _apply_role(self, conn):
+        """Переключает соединение на роль пула (SET ROLE), если она еще не установлена"""
+        if self._applied_roles.get(id(conn)) == self.role:
+            return
+        cur = conn.cursor()
+        try:
+            cur.execute(sql.SQL("SET ROLE {}").format(sql.Identifier(self.role)))
+        finally:
+            cur.close()
+        # SET без LOCAL откатывается вместе с транзакцией, поэтому фиксируем
+        conn.commit()
+        self._applied_roles[id(conn)] = self.role
+
+    def _discard(self, conn):
+        self._applied_roles.pop(id(conn), None)
+        try:
+            if not conn.closed:
+                conn.close()
+        except Exception:
+            pass
+        with self._cond:
+            self._size -= 1
+            self._discarded += 1
+            self._cond.notify()
+
+    def getconn(self):
+        """Выдает соединение из пула"""
+        started = time.monotonic()
+        deadline = started + self.timeout
+
+        while True:
+            conn = None
+            idle_since = None
+            create = False
+
+            with self._cond:
+                if self._closed:
+                    raise PoolError("Пул соединений закрыт")
+
+                while not self._idle and self._size >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._timeouts += 1
+                        raise PoolTimeoutError(
+                            f"Нет свободных соединений в пуле за {self.timeout} с"
+                        )
+                    self._waiting += 1
+                    try:
+                        self._cond.wait(remaining)
+                    finally:
+                        self._waiting -= 1
+
+                if self._idle:
+                    conn, idle_since = self._idle.pop()
+                else:
+                    self._size += 1
+                    create = True
+
+            if create:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._size -= 1
+                        self._cond.notify()
+                    raise
+            elif not self._is_healthy(conn, idle_since):
+                self._discard(conn)
+                continue
+
+            if self.role:
+                try:
+                    self._apply_role(conn)
+                except psycopg2.Error:
+                    self._discard(conn)
+                    raise
+
+            elapsed = time.monotonic() - started
+            with self._cond:
+                self._in_use += 1
+                self._checkouts += 1
+                self._checkout_time_total += elapsed
+                self._checkout_time_max = max(self._checkout_time_max, elapsed)
+            return conn
+
+    def putconn(self, conn, close=False):
+        """Возвращает соединение в пул"""
+        with self._cond:
+            self._in_use -= 1
+
+        if close or self._closed or conn.closed:
+            self._discard(conn)
+            return
+
+        # Незавершенная транзакция не должна попасть к следующему запросу
+        try:
+            if conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+        except psycopg2.Error:
+            self._discard(conn)
+            return
+
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def closeall(self):
+        """Закрывает все свободные соединения и запрещает выдачу новых"""
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn, _ in idle:
+            self._applied_roles.pop(id(conn), None)
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def reserve(self):
+        """Защищает пул от вытеснения до ближайшей выдачи соединения"""
+        with self._cond:
+            self._reserved += 1
+
+    def unreserve(self):
+        with self._cond:
+            self._reserved -= 1
+
+    def is_idle(self):
+        """True если ни одно соединение пула не выдано и не обещано"""
+        with self._cond:
+            return self._in_use == 0 and self._waiting == 0 and self._reserved == 0
+
+    def stats(self):
+        """Возвращает метрики пула"""
+        with self._cond:
+            avg = self._checkout_time_total / self._checkouts if self._checkouts else 0.0
+            return {
+                'role': self.role,
+                'size': self._size,
+                'min_size': self.min_size,
+                'max_size': self.max_size,
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'waiting': self._waiting,
+                'checkouts': self._checkouts,
+                'timeouts': self._timeouts,
+                'discarded': self._discarded,
+                'checkout_avg_ms': round(avg * 1000, 3),
+                'checkout_max_ms': round(self._checkout_time_max * 1000, 3),
+            }
+
+
+def _connect_kwargs():
+    return {
+        'host': Config.DB_HOST,
+        'port': Config.DB_PORT,
+        'database': Config.DB_NAME,
+        'user': Config.DB_USER,
+        'password': Config.DB_PASSWORD,
+        'cursor_factory': RealDictCursor,
+    }
+
+
+def open_dedicated_connection():
+    """Открывает отдельное соединение вне пула (LISTEN и другие долгие задачи)"""
+    return psycopg2.connect(**_connect_kwargs())
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Возвращает общий пул соединений приложения (создается при первом обращении)"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                pool = ConnectionPool(
+                    Config.DB_POOL_MIN_SIZE,
+                    Config.DB_POOL_MAX_SIZE,
+                    Config.DB_POOL_TIMEOUT,
+                    Config.DB_POOL_HEALTHCHECK_INTERVAL,
+                    **_connect_kwargs()
+                )
+                try:
+                    pool.fill()
+                except psycopg2.Error as e:
+                    print(f"DEBUG: Pool prefill failed: {e}")
+                _pool = pool
+    return _pool
+
+
+class RolePoolManager:
+    """
+    Набор небольших пулов, по одному на роль PostgreSQL
+
+    Все соединения открываются под общим пользователем приложения, а роль
+    переключается через SET ROLE при выдаче. Простаивающие пулы вытесняются
+    по LRU: при превышении max_pools и по истечении idle_ttl секунд.
+    """
+
+    def __init__(self, allowed_roles, pool_size, max_pools, idle_ttl):
+        self.allowed_roles = set(allowed_roles)
+        self.pool_size = pool_size
+        self.max_pools = max_pools
+        self.idle_ttl = idle_ttl
+        self._lock = threading.Lock()
+        self._pools = OrderedDict()  # role -> pool, от давно использованных к недавним
+        self._last_used = {}
+        self._evicted = 0
+
+    def get_pool(self, role, reserve=False):
+        """
+        Возвращает пул роли, создавая его при необходимости
+
+        Args:
+            reserve: зарезервировать пул под блокировкой, чтобы другой поток
+                     не вытеснил его до getconn (снимается через unreserve)
+        """
+        if role not in self.allowed_roles:
+            raise ValueError(f"Недопустимая роль для пула соединений: {role}")
+
+        evicted = []
+        with self._lock:
+            pool = self._pools.get(role)
+            if pool is None:
+                pool = ConnectionPool(
+                    0,
+                    self.pool_size,
+                    Config.DB_POOL_TIMEOUT,
+                    Config.DB_POOL_HEALTHCHECK_INTERVAL,
+                    role=role,
+                    **_connect_kwargs()
+                )
+                self._pools[role] = pool
+            if reserve:
+                pool.reserve()
+            self._pools.move_to_end(role)
+            self._last_used[role] = time.monotonic()
+            evicted = self._collect_evictions(keep=role)
+
+        for old_pool in evicted:
+            old_pool.closeall()
+        return pool
+
+    def getconn(self, role):
+        """Выдает соединение из пула роли"""
+        pool = self.get_pool(role, reserve=True)
+        try:
+            return pool.getconn()
+        finally:
+            pool.unreserve()
+
+    def _collect_evictions(self, keep):
+        """Выбирает простаивающие пулы на вытеснение (вызывается под блокировкой)"""
+        now = time.monotonic()
+        evicted = []
+        for role in list(self._pools):
+            if role == keep or not self._pools[role].is_idle():
+                continue
+            over_limit = len(self._pools) > self.max_pools
+            expired = self.idle_ttl and now - self._last_used[role] > self.idle_ttl
+            if over_limit or expired:
+                evicted.append(self._pools.pop(role))
+                del self._last_used[role]
+                self._evicted += 1
+        return evicted
+
+    def stats(self):
+        with self._lock:
+            return {
+                'pools': {role: pool.stats() for role, pool in self._pools.items()},
+                'max_pools': self.max_pools,
+                'idle_ttl': self.idle_ttl,
+                'evicted': self._evicted,
+            }
+
+
+_role_pools = None
+
+
+def get_role_pools():
+    """Возвращает менеджер пулов по ролям (создается при первом обращении)"""
+    global _role_pools
+    if _role_pools is None:
+        with _pool_lock:
+            if _role_pools is None:
+                _role_pools = RolePoolManager(
+                    Config.DB_ROLE_POOL_ROLES,
+                    Config.DB_ROLE_POOL_SIZE,
+                    Config.DB_ROLE_POOL_MAX_POOLS,
+                    Config.DB_ROLE_POOL_IDLE_TTL
+                )
+    return _role_pools
+
+
+def _pool_for(role):
+    return get_role_pools().get_pool(role) if role else get_pool()
+
+
+def _getconn(role):
+    return get_role_pools().getconn(role) if role else get_pool().getconn()
+
+
+def get_pool_stats():
+    """Метрики пула: занятые, ожидающие, время выдачи соединения"""
+    if _pool is None:
+        return {}
+    stats = _pool.stats()
+    if _role_pools is not None:
+        stats['role_pools'] = _role_pools.stats()
+    return stats
+
+
+def get_session_db_role(granted_roles):
+    """
+    Роль PostgreSQL для запросов текущего пользователя
+
+    Возвращает None (запрос выполняется под пользователем приложения), если
+    режим выполнения под ролями выключен, роль пользователя не обслуживается
+    отдельным пулом или у нее нет привилегий на объекты запроса.
+
+    Args:
+        granted_roles: роли, которым в Roles and Views.sql выданы
+                       привилегии на все объекты запроса
+    """
+    if not Config.DB_ROLE_SESSIONS or not has_request_context():
+        return None
+    role = session.get('user_role')
+    if role in Config.DB_ROLE_POOL_ROLES and role in granted_roles:
+        return role
+    return None
+
+
+def get_db_connection(role=None):
+    """
+    Возвращает соединение из пула
+
+    Внутри запроса Flask соединение закрепляется за g и переиспользуется
+    всеми запросами к БД до конца обработки. Вне контекста приложения
+    соединение нужно вернуть через release_db_connection.
+
+    Args:
+        role: роль PostgreSQL; соединение берется из пула этой роли
+    """
+    if has_app_context():
+        if 'db_conns' not in g:
+            g.db_conns = {}
+        conn = g.db_conns.get(role)
+        if conn is None or conn.closed:
+            conn = _getconn(role)
+            g.db_conns[role] = conn
+        return conn
+    return _getconn(role)
+
+
+def release_db_connection(conn, role=None):
+    """Возвращает соединение в пул (соединение из g возвращается в конце запроса)"""
+    if has_app_context() and g.get('db_conns', {}).get(role) is conn:
+        return
+    _pool_for(role).putconn(conn)
+
+
+def close_db_connection(exception=None):
+    """Возвращает закрепленные за запросом соединения в пулы"""
+    conns = g.pop('db_conns', None) or {}
+    for role, conn in conns.items():
+        _pool_for(role).putconn(conn)
+
+
+def init_db_pool(app):
+    """Регистрирует возврат соединения в пул по завершении запроса"""
+    app.teardown_appcontext(close_db_connection)
+
+
+def execute_query(query, params=None, fetch=True, role=None):
+    # Внутри transaction() запрос выполняется в открытой транзакции без фиксации
+    tx = current_transaction(role)
+    if tx is not None:
+        result = tx.execute(query, params)
+        return result if fetch else None
+
+    conn = get_db_connection(role)
     cur = conn.cursor()
-    
+
     try:
         cur.execute(query, params)
         if fetch:
-            if query.strip().upper().startswith('SELECT'):
+            # Результат есть у SELECT, WITH ... SELECT и INSERT/UPDATE ... RETURNING
+            if cur.description is not None:
                 result = cur.fetchall()
             else:
                 result = None
@@ -33,6 +489,158 @@ def execute_query(query, params=None, fetch=True):
         raise e
     finally:
         cur.close()
-        conn.close()
-    
-    return result
\ No newline at end of file
+        release_db_connection(conn, role)
+
+    return result
+
+
+def execute_role_query(query, granted_roles, params=None, fetch=True):
+    """Выполняет запрос с привилегиями роли текущего пользователя (см. get_session_db_role)"""
+    return execute_query(query, params, fetch, role=get_session_db_role(granted_roles))
+
+
+class Transaction:
+    """
+    Единица работы: запросы на одном соединении пула с общей фиксацией
+
+    Создается через transaction(); COMMIT выполняется при выходе из блока
+    with, ROLLBACK - при исключении.
+    """
+
+    def __init__(self, conn, role=None):
+        self.conn = conn
+        self.role = role
+        self.rowcount = -1
+        self._savepoints = 0
+
+    def execute(self, query, params=None):
+        """
+        Выполняет запрос в транзакции
+
+        Returns:
+            list: строки результата (SELECT, ... RETURNING) или None
+        """
+        cur = self.conn.cursor()
+        try:
+            cur.execute(query, params)
+            self.rowcount = cur.rowcount
+            if cur.description is not None:
+                return cur.fetchall()
+            return None
+        finally:
+            cur.close()
+
+    def execute_one(self, query, params=None):
+        """Выполняет запрос и возвращает первую строку результата (None если строк нет)"""
+        rows = self.execute(query, params)
+        return rows[0] if rows else None
+
+    @contextmanager
+    def savepoint(self):
+        """
+        Точка сохранения: при исключении внутри блока откатываются только его
+        изменения, транзакция остается открытой
+        """
+        self._savepoints += 1
+        name = sql.Identifier(f"sp_{self._savepoints}")
+        self.execute(sql.SQL("SAVEPOINT {}").format(name))
+        try:
+            yield self
+        except Exception:
+            self.execute(sql.SQL("ROLLBACK TO SAVEPOINT {}").format(name))
+            self.execute(sql.SQL("RELEASE SAVEPOINT {}").format(name))
+            raise
+        else:
+            self.execute(sql.SQL("RELEASE SAVEPOINT {}").format(name))
+
+
+_local = threading.local()
+
+
+def current_transaction(role=None):
+    """Открытая в текущем потоке транзакция для роли (None если ее нет)"""
+    return getattr(_local, 'transactions', {}).get(role)
+
+
+@contextmanager
+def transaction(role=None):
+    """
+    Выполняет блок запросов в одной транзакции на одном соединении
+
+    Пример:
+        with transaction() as tx:
+            row = tx.execute_one("INSERT ... RETURNING employee_id", params)
+            tx.execute("UPDATE departments ...", (row['employee_id'], ...))
+
+    execute_query внутри блока выполняется в той же транзакции. Вложенный
+    transaction() становится точкой сохранения внешней транзакции.
+
+    Args:
+        role: роль PostgreSQL (как в get_db_connection)
+
+    Yields:
+        Transaction
+    """
+    tx = current_transaction(role)
+    if tx is not None:
+        with tx.savepoint():
+            yield tx
+        return
+
+    conn = get_db_connection(role)
+    tx = Transaction(conn, role)
+    if not hasattr(_local, 'transactions'):
+        _local.transactions = {}
+    _local.transactions[role] = tx
+    try:
+        yield tx
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        del _local.transactions[role]
+        release_db_connection(conn, role)
+
+
+def stream_query(query, params=None, role=None, fetch_size=None):
+    """
+    Читает результат запроса пачками через серверный (именованный) курсор
+
+    В памяти одновременно находится не больше fetch_size строк. Соединение
+    берется из пула отдельно от закрепленного за g и удерживается, пока
+    генератор не будет исчерпан или закрыт.
+
+    Yields:
+        tuple: (имена колонок, список строк) - первая пачка выдается всегда,
+               даже если результат пустой
+    """
+    fetch_size = fetch_size or Config.EXPORT_FETCH_SIZE
+    conn = _getconn(role)
+    # Пока соединение выдано, пул роли не вытесняется
+    pool = _pool_for(role)
+    broken = False
+    try:
+        cur = conn.cursor(name=f"stream_{uuid.uuid4().hex}")
+        try:
+            cur.execute(query, params)
+            first = True
+            while True:
+                rows = cur.fetchmany(fetch_size)
+                if not rows and not first:
+                    break
+                columns = [column.name for column in cur.description or []]
+                yield columns, rows
+                first = False
+                if len(rows) < fetch_size:
+                    break
+        finally:
+            try:
+                cur.close()
+            except psycopg2.Error:
+                broken = True
+    except psycopg2.Error:
+        broken = True
+        raise
+    finally:
+        pool.putconn(conn, close=broken)
@@ -0,0 +1,89 @@
+"""
+Модуль выгрузки таблиц и представлений в CSV и NDJSON
+Строки читаются серверным курсором и сразу отдаются клиенту потоком,
+поэтому расход памяти не зависит от размера таблицы.
+"""
+
+import csv
+import io
+import json
+import psycopg2
+from flask import Response
+from database.db import stream_query
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson; charset=utf-8',
+}
+
+
+def _with_first(first, batches):
+    """Возвращает уже прочитанную первую пачку, затем остальные"""
+    try:
+        yield first
+        yield from batches
+    finally:
+        batches.close()
+
+
+def _csv_chunks(batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    # BOM, чтобы Excel открывал файл в UTF-8 (кириллица)
+    yield '\ufeff'
+    header_written = False
+    for columns, rows in batches:
+        if not header_written:
+            writer.writerow(columns)
+            header_written = True
+        for row in rows:
+            writer.writerow(['' if value is None else value for value in row.values()])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def _ndjson_chunks(batches):
+    for columns, rows in batches:
+        if rows:
+            yield ''.join(
+                json.dumps(row, default=str, ensure_ascii=False) + '\n' for row in rows
+            )
+
+
+def export_response(query, filename, export_format, params=None, role=None):
+    """
+    Потоковый ответ с результатом запроса
+
+    Args:
+        query: SELECT для выгрузки
+        filename: имя файла без расширения
+        export_format: 'csv' или 'ndjson'
+        params: параметры запроса
+        role: роль PostgreSQL для выполнения запроса
+
+    Returns:
+        Response или None для неизвестного формата и при ошибке запроса
+    """
+    if export_format not in EXPORT_FORMATS:
+        return None
+
+    # Первая пачка читается до отправки заголовков: ошибка прав или SQL
+    # должна вернуть None, а не оборванный файл с кодом 200
+    batches = stream_query(query, params, role=role)
+    try:
+        first = next(batches)
+    except psycopg2.Error as e:
+        print(f"Error exporting {filename}: {e}")
+        return None
+    batches = _with_first(first, batches)
+    chunks = _csv_chunks(batches) if export_format == 'csv' else _ndjson_chunks(batches)
+
+    print(f"DEBUG: Streaming export {filename}.{export_format} (role={role})")
+    # Без stream_with_context: stream_query берет собственное соединение, а
+    # закрепленные за запросом соединения возвращаются в пул сразу
+    response = Response(chunks, mimetype=EXPORT_FORMATS[export_format])
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}.{export_format}"'
+    # Отключаем буферизацию ответа на nginx
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,146 @@
+"""
+Модуль постраничного вывода списков
+Keyset-пагинация (seek): страница выбирается условием по индексированным
+колонкам сортировки, а не OFFSET, поэтому стоимость не растет с номером страницы.
+"""
+
+import base64
+import json
+from flask import request
+from config import Config
+from database.db import execute_query
+
+
+def encode_cursor(sort, direction, values):
+    """Кодирует позицию в списке для передачи в URL"""
+    payload = json.dumps({'s': sort, 'd': direction, 'v': values}, default=str, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, sort, direction, size):
+    """
+    Декодирует позицию в списке
+
+    Returns:
+        list: значения колонок сортировки или None, если курсор
+              поврежден или относится к другой сортировке
+    """
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8'))
+    except (ValueError, UnicodeDecodeError):
+        return None
+    if not isinstance(payload, dict) or payload.get('s') != sort or payload.get('d') != direction:
+        return None
+    values = payload.get('v')
+    if not isinstance(values, list) or len(values) != size:
+        return None
+    return values
+
+
+def get_page_size():
+    """Размер страницы из параметра per_page с ограничением сверху"""
+    try:
+        per_page = int(request.args.get('per_page', Config.PAGE_SIZE_DEFAULT))
+    except ValueError:
+        per_page = Config.PAGE_SIZE_DEFAULT
+    return max(1, min(per_page, Config.PAGE_SIZE_MAX))
+
+
+def paginate(base_query, params=None, sort_columns=None, default_sort=None,
+             default_direction='asc', with_total=None, role=None):
+    """
+    Выбирает одну страницу результата запроса
+
+    Параметры страницы читаются из запроса: sort, dir, after, before,
+    per_page и count (1 - посчитать общее количество строк).
+
+    Args:
+        base_query: SELECT без ORDER BY и LIMIT
+        params: параметры base_query
+        sort_columns: {имя сортировки: (колонка, ..., уникальная колонка)} -
+                      колонки результата base_query; последняя колонка
+                      должна делать порядок однозначным, значения - не NULL
+        default_sort: сортировка по умолчанию
+        default_direction: 'asc' или 'desc'
+        with_total: считать ли общее количество (None - по параметру count)
+        role: роль PostgreSQL для выполнения запроса
+
+    Returns:
+        dict: rows, sort, direction, per_page, next_cursor, prev_cursor,
+              has_next, has_prev, total (None если не считали)
+    """
+    params = list(params or [])
+
+    sort = request.args.get('sort', default_sort)
+    if sort not in sort_columns:
+        sort = default_sort
+    direction = request.args.get('dir', default_direction)
+    if direction not in ['asc', 'desc']:
+        direction = default_direction
+    columns = sort_columns[sort]
+    per_page = get_page_size()
+
+    after = decode_cursor(request.args.get('after'), sort, direction, len(columns))
+    before = None if after else decode_cursor(request.args.get('before'), sort, direction, len(columns))
+
+    # При движении назад читаем в обратном порядке и разворачиваем результат
+    backwards = before is not None
+    ascending = (direction == 'asc') != backwards
+    order = 'ASC' if ascending else 'DESC'
+
+    column_list = ', '.join(columns)
+    where = ''
+    page_params = list(params)
+    cursor_values = after or before
+    if cursor_values is not None:
+        operator = '>' if ascending else '<'
+        placeholders = ', '.join(['%s'] * len(columns))
+        where = f"WHERE ({column_list}) {operator} ({placeholders})"
+        page_params.extend(cursor_values)
+
+    order_by = ', '.join(f"{column} {order}" for column in columns)
+    query = f"""
+        SELECT * FROM ({base_query}) AS page_src
+        {where}
+        ORDER BY {order_by}
+        LIMIT %s
+    """
+    page_params.append(per_page + 1)
+
+    rows = execute_query(query, page_params, role=role) or []
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if backwards:
+        rows.reverse()
+
+    def cursor_for(row):
+        return encode_cursor(sort, direction, [row[column] for column in columns])
+
+    if backwards:
+        has_next = True
+        has_prev = has_more
+    else:
+        has_next = has_more
+        has_prev = after is not None
+
+    if with_total is None:
+        with_total = request.args.get('count') == '1'
+    total = None
+    if with_total:
+        count_result = execute_query(f"SELECT COUNT(*) AS total FROM ({base_query}) AS count_src", params, role=role)
+        total = count_result[0]['total'] if count_result else 0
+
+    return {
+        'rows': rows,
+        'sort': sort,
+        'direction': direction,
+        'per_page': per_page,
+        'next_cursor': cursor_for(rows[-1]) if rows and has_next else None,
+        'prev_cursor': cursor_for(rows[0]) if rows and has_prev else None,
+        'has_next': bool(rows) and has_next,
+        'has_prev': bool(rows) and has_prev,
+        'total': total,
+    }
@@ -0,0 +1,114 @@
+"""
+Модуль справочных данных для форм
+Небольшие справочники (отделы) кэшируются в процессе не дольше
+Config.REFERENCE_CACHE_TTL секунд и сбрасываются при изменении таблиц,
+из которых они построены. Большие таблицы (полисы, сотрудники) в формы
+целиком не выгружаются - для них поиск по префиксу (typeahead) по индексу.
+"""
+
+import threading
+import time
+from config import Config
+from database.db import execute_query
+
+# Справочник -> (запрос, таблицы, при изменении которых он сбрасывается)
+REFERENCE_QUERIES = {
+    'departments': (
+        "SELECT department_id, name FROM departments ORDER BY name",
+        ('departments',),
+    ),
+}
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def get_reference(name):
+    """
+    Возвращает справочник из кэша (список строк)
+
+    Справочник перечитывается из БД, если он старше REFERENCE_CACHE_TTL секунд
+    или был сброшен invalidate_reference_data().
+    """
+    now = time.monotonic()
+    with _cache_lock:
+        entry = _cache.get(name)
+        if entry is not None and now - entry[0] < Config.REFERENCE_CACHE_TTL:
+            return entry[1]
+
+    query, tables = REFERENCE_QUERIES[name]
+    rows = execute_query(query) or []
+    with _cache_lock:
+        _cache[name] = (now, rows)
+    return rows
+
+
+def get_departments():
+    """Список отделов [{department_id, name}] по алфавиту"""
+    return get_reference('departments')
+
+
+def invalidate_reference_data(table_name=None):
+    """
+    Сбрасывает справочники, построенные по таблице (без аргумента - все)
+
+    Args:
+        table_name: измененная таблица
+    """
+    with _cache_lock:
+        for name, (query, tables) in REFERENCE_QUERIES.items():
+            if table_name is None or table_name in tables:
+                _cache.pop(name, None)
+
+
+def _prefix_pattern(prefix):
+    """Шаблон LIKE для поиска по префиксу (спецсимволы LIKE экранируются)"""
+    escaped = prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return escaped + '%'
+
+
+def _limit(limit):
+    return max(1, min(limit or Config.TYPEAHEAD_LIMIT, Config.TYPEAHEAD_LIMIT))
+
+
+def search_policies(prefix, limit=None):
+    """
+    Полисы, номер которых начинается с prefix (без учета регистра)
+
+    Поиск по индексу idx_policies_number_prefix.
+
+    Returns:
+        list: [{policy_id, policy_number}] по возрастанию номера
+    """
+    prefix = (prefix or '').strip()
+    if not prefix:
+        return []
+    return execute_query("""
+        SELECT policy_id, policy_number
+        FROM policies
+        WHERE upper(policy_number) LIKE upper(%s)
+        ORDER BY upper(policy_number)
+        LIMIT %s
+    """, (_prefix_pattern(prefix), _limit(limit))) or []
+
+
+def search_employees(prefix, limit=None, active_only=True):
+    """
+    Сотрудники, ФИО которых начинается с prefix (без учета регистра)
+
+    Поиск по индексу idx_employees_full_name_prefix.
+
+    Returns:
+        list: [{employee_id, full_name, department_id}] по алфавиту
+    """
+    prefix = (prefix or '').strip()
+    if not prefix:
+        return []
+    active_filter = "AND is_active = true" if active_only else ""
+    return execute_query(f"""
+        SELECT employee_id, full_name, department_id
+        FROM employees
+        WHERE lower(full_name) LIKE lower(%s) {active_filter}
+        ORDER BY lower(full_name)
+        LIMIT %s
+    """, (_prefix_pattern(prefix), _limit(limit))) or []
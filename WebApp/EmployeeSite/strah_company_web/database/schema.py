@@ -0,0 +1,201 @@
+"""
+Модуль метаданных схемы для универсального редактора таблиц (db_admin)
+Колонки, типы, обязательность, значения по умолчанию, первичные и внешние
+ключи, ограничения уникальности и CHECK всех таблиц редактора читаются из pg_catalog одним обращением и
+хранятся в процессе до сброса: вручную (invalidate_schema) или по DDL -
+событийный триггер notify_schema_change (Trigger.sql) отправляет уведомление
+в канал Config.SCHEMA_CHANGES_CHANNEL, которое слушает поток этого модуля.
+"""
+
+import select
+import threading
+import time
+import psycopg2
+from decimal import Decimal, InvalidOperation
+from psycopg2 import extensions, sql
+from config import Config
+from database.db import execute_query, open_dedicated_connection
+
+# Таблицы универсального редактора
+SCHEMA_TABLES = [
+    'employees', 'clients', 'policies', 'documents', 'departments',
+    'car_brands', 'car_models', 'policy_statuses', 'notifications'
+]
+
+# Типы колонок (format_type) по способу преобразования значения из формы
+INTEGER_TYPES = ('smallint', 'integer', 'bigint')
+DECIMAL_TYPES = ('numeric', 'real', 'double precision')
+
+_cache = {'tables': None, 'generation': 0}
+_cache_lock = threading.Lock()
+_listener = None
+
+
+def _load_schema():
+    tables = {
+        name: {'columns': [], 'primary_key': [], 'foreign_keys': {}, 'unique_keys': [], 'checks': []}
+        for name in SCHEMA_TABLES
+    }
+
+    # data_type и is_nullable - в тех же значениях, что и в information_schema
+    columns = execute_query("""
+        SELECT c.relname AS table_name,
+               a.attname AS column_name,
+               format_type(a.atttypid, NULL) AS data_type,
+               CASE WHEN a.attnotnull THEN 'NO' ELSE 'YES' END AS is_nullable,
+               CASE WHEN a.attidentity <> '' THEN 'identity'
+                    ELSE pg_get_expr(d.adbin, d.adrelid) END AS column_default,
+               CASE WHEN a.atttypid IN ('varchar'::regtype, 'bpchar'::regtype) AND a.atttypmod > 0
+                    THEN a.atttypmod - 4 END AS character_maximum_length
+        FROM pg_class c
+        JOIN pg_attribute a ON a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped
+        LEFT JOIN pg_attrdef d ON d.adrelid = a.attrelid AND d.adnum = a.attnum
+        WHERE c.relnamespace = 'public'::regnamespace
+          AND c.relkind IN ('r', 'p')
+          AND c.relname = ANY(%s)
+        ORDER BY c.relname, a.attnum
+    """, (SCHEMA_TABLES,)) or []
+    for column in columns:
+        tables[column.pop('table_name')]['columns'].append(column)
+
+    constraints = execute_query("""
+        SELECT t.relname AS table_name, con.conname, con.contype, a.attname AS column_name,
+               ft.relname AS ref_table, fa.attname AS ref_column,
+               pg_get_expr(con.conbin, con.conrelid) AS check_expression
+        FROM pg_constraint con
+        JOIN pg_class t ON t.oid = con.conrelid
+        CROSS JOIN LATERAL unnest(con.conkey, con.confkey) WITH ORDINALITY AS k(attnum, ref_attnum, position)
+        JOIN pg_attribute a ON a.attrelid = con.conrelid AND a.attnum = k.attnum
+        LEFT JOIN pg_class ft ON ft.oid = con.confrelid
+        LEFT JOIN pg_attribute fa ON fa.attrelid = con.confrelid AND fa.attnum = k.ref_attnum
+        WHERE con.contype IN ('p', 'f', 'u', 'c')
+          AND t.relnamespace = 'public'::regnamespace
+          AND t.relname = ANY(%s)
+        ORDER BY t.relname, con.conname, k.position
+    """, (SCHEMA_TABLES,)) or []
+    grouped = {}
+    for row in constraints:
+        table = tables[row['table_name']]
+        if row['contype'] == 'p':
+            table['primary_key'].append(row['column_name'])
+        elif row['contype'] == 'f':
+            table['foreign_keys'][row['column_name']] = (row['ref_table'], row['ref_column'])
+        else:
+            key = (row['table_name'], row['conname'])
+            if key not in grouped:
+                grouped[key] = {'name': row['conname'], 'columns': [], 'expression': row['check_expression']}
+                target = table['unique_keys'] if row['contype'] == 'u' else table['checks']
+                target.append(grouped[key])
+            grouped[key]['columns'].append(row['column_name'])
+
+    # Таблицы, которых нет в базе (старая схема), в редакторе не показываются
+    return {name: table for name, table in tables.items() if table['columns']}
+
+
+def get_schema():
+    """Метаданные всех таблиц редактора {таблица: {columns, primary_key, foreign_keys, ...}}"""
+    with _cache_lock:
+        tables = _cache['tables']
+        generation = _cache['generation']
+    if tables is not None:
+        return tables
+
+    _ensure_listener()
+    tables = _load_schema()
+    with _cache_lock:
+        # Сброс во время загрузки: прочитанное может быть уже устаревшим
+        if _cache['generation'] == generation:
+            _cache['tables'] = tables
+    print(f"DEBUG: Schema metadata loaded for {len(tables)} tables")
+    return tables
+
+
+def get_table_schema(table_name):
+    """
+    Метаданные таблицы
+
+    Returns:
+        dict: {'columns': [...], 'primary_key': [...], 'foreign_keys': {колонка: (таблица, колонка)},
+               'unique_keys': [{name, columns}], 'checks': [{name, columns, expression}]}
+              или None если таблицы нет
+    """
+    return get_schema().get(table_name)
+
+
+def get_primary_key_column(table_name):
+    """Имя колонки первичного ключа таблицы (None если ключ не из одной колонки)"""
+    table = get_table_schema(table_name)
+    if table is None or len(table['primary_key']) != 1:
+        return None
+    return table['primary_key'][0]
+
+
+def invalidate_schema():
+    """Сбрасывает метаданные (следующий запрос перечитает их из pg_catalog)"""
+    with _cache_lock:
+        _cache['tables'] = None
+        _cache['generation'] += 1
+
+
+def coerce_value(column, value):
+    """
+    Преобразует значение поля формы к типу колонки
+
+    Returns:
+        значение для параметра запроса ('' для числовых колонок - None)
+
+    Raises:
+        ValueError: значение не соответствует типу колонки
+    """
+    data_type = column['data_type']
+    if data_type in INTEGER_TYPES:
+        return int(value) if value else None
+    if data_type in DECIMAL_TYPES:
+        if not value:
+            return None
+        try:
+            return Decimal(value.replace(',', '.'))
+        except InvalidOperation:
+            raise ValueError(value)
+    if data_type == 'boolean':
+        return value.lower() in ['true', '1', 'yes', 'on']
+    return value
+
+
+def _listen():
+    conn = open_dedicated_connection()
+    try:
+        conn.set_isolation_level(extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        cur = conn.cursor()
+        cur.execute(sql.SQL("LISTEN {}").format(sql.Identifier(Config.SCHEMA_CHANGES_CHANNEL)))
+        # DDL, выполненный пока слушателя не было, не должен остаться незамеченным
+        invalidate_schema()
+        while True:
+            if select.select([conn], [], [], 60) == ([], [], []):
+                continue
+            conn.poll()
+            if conn.notifies:
+                print(f"DEBUG: Schema changed ({conn.notifies[-1].payload}), metadata invalidated")
+                conn.notifies.clear()
+                invalidate_schema()
+    finally:
+        conn.close()
+
+
+def _run_listener():
+    delay = 1
+    while True:
+        try:
+            _listen()
+        except psycopg2.Error as e:
+            print(f"DEBUG: Schema listener error: {e}, reconnecting in {delay}s")
+            time.sleep(delay)
+            delay = min(delay * 2, 30)
+
+
+def _ensure_listener():
+    global _listener
+    with _cache_lock:
+        if _listener is None or not _listener.is_alive():
+            _listener = threading.Thread(target=_run_listener, name='schema-listener', daemon=True)
+            _listener.start()
@@ -0,0 +1,67 @@
+"""
+Модуль статистики для дашбордов
+Счетчики хранятся в таблице dashboard_counters и обновляются триггерами,
+в процессе они кэшируются не дольше Config.DASHBOARD_STATS_TTL секунд.
+Все варианты дашбордов читают один и тот же снимок счетчиков.
+"""
+
+import threading
+import time
+from config import Config
+from database.db import execute_query
+
+_cache = {'loaded_at': 0.0, 'counters': None}
+_cache_lock = threading.Lock()
+
+
+def _load_counters():
+    rows = execute_query("SELECT metric, department_id, value FROM dashboard_counters") or []
+    return {(row['metric'], row['department_id']): row['value'] for row in rows}
+
+
+def get_counters():
+    """
+    Возвращает снимок счетчиков {(metric, department_id): value}
+
+    Снимок перечитывается из БД, если он старше DASHBOARD_STATS_TTL секунд.
+    """
+    now = time.monotonic()
+    with _cache_lock:
+        counters = _cache['counters']
+        if counters is not None and now - _cache['loaded_at'] < Config.DASHBOARD_STATS_TTL:
+            return counters
+
+    counters = _load_counters()
+    with _cache_lock:
+        _cache['counters'] = counters
+        _cache['loaded_at'] = now
+    return counters
+
+
+def invalidate_stats():
+    """Сбрасывает кэш счетчиков (следующий запрос перечитает их из БД)"""
+    with _cache_lock:
+        _cache['counters'] = None
+
+
+def get_company_stats():
+    """Общие показатели по компании"""
+    counters = get_counters()
+    return {
+        'employees_count': counters.get(('employees', 0), 0),
+        'active_employees': counters.get(('employees_active', 0), 0),
+        'clients_count': counters.get(('clients', 0), 0),
+        'policies_count': counters.get(('policies', 0), 0),
+        'documents_count': counters.get(('documents', 0), 0),
+        'public_documents_count': counters.get(('documents_public', 0), 0),
+    }
+
+
+def get_department_stats(department_id):
+    """Показатели отдела"""
+    counters = get_counters()
+    return {
+        'employees_count': counters.get(('employees', department_id), 0),
+        'policies_count': counters.get(('policies', department_id), 0),
+        'documents_count': counters.get(('documents', department_id), 0),
+    }
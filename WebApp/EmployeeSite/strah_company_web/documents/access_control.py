@@ -1,23 +1,163 @@
 """
 Модуль контроля доступа к документам
 Проверяет права пользователей на просмотр, редактирование и удаление документов
+
+Правила доступа описаны один раз в ACCESS_RULES и применяются двумя способами:
+компилируются в условие WHERE для выборки из БД и проверяются в Python для
+уже загруженного документа.
 """
 
 from database.db import execute_query
 
-def get_user_department(user_id):
-    """Получает отдел пользователя по его ID"""
-    try:
-        result = execute_query(
-            "SELECT department_id FROM employees WHERE employee_id = %s", 
-            (user_id,)
-        )
-        if result:
-            return result[0]['department_id']
-        return None
-    except Exception as e:
-        print(f"Error getting user department: {e}")
-        return None
+# Отдел безопасности: его аудиторы работают с документами своего отдела
+SECURITY_DEPARTMENT_ID = 4
+
+# Колонки документа для списков и карточки (без search_vector - он большой и нужен только поиску)
+DOCUMENT_COLUMNS = """
+    d.document_id, d.policy_id, d.created_by_employee_id, d.created_in_department_id,
+    d.file_name, d.description, d.stored_file_path, d.content_hash, d.file_size,
+    d.confidentiality_level, d.created_at
+"""
+
+# Правила доступа: действие -> роль -> список правил (достаточно одного).
+# Правило - набор условий, которые должны выполняться одновременно:
+#   own_department   - документ создан в отделе пользователя
+#   author           - пользователь создал документ
+#   max_level        - уровень конфиденциальности не выше указанного
+#   user_department  - пользователь работает в указанном отделе
+#   other_department - пользователь работает НЕ в указанном отделе
+# Пустое правило разрешает всё. Правила роли '*' действуют для всех ролей.
+ACCESS_RULES = {
+    'view': {
+        # Публичные документы видны всем
+        '*': [{'max_level': 0}],
+        'company_director': [{}],
+        'db_admin': [{}],
+        # Сотрудник видит документы своего отдела (уровни 0,1) и свои документы
+        'employee': [{'own_department': True, 'max_level': 1}, {'author': True}],
+        # Начальник отдела видит все документы своего отдела
+        'department_manager': [{'own_department': True}],
+        # HR видит документы своего отдела (уровни 0,1)
+        'hr_manager': [{'own_department': True, 'max_level': 1}],
+        # Аудитор из отдела безопасности видит все документы своего отдела,
+        # остальные аудиторы - публичные и ДСП
+        'auditor': [
+            {'user_department': SECURITY_DEPARTMENT_ID, 'own_department': True},
+            {'other_department': SECURITY_DEPARTMENT_ID, 'max_level': 1},
+        ],
+    },
+    'edit': {
+        # Создатель может редактировать свой документ
+        '*': [{'author': True}],
+        'company_director': [{}],
+        'db_admin': [{}],
+        'department_manager': [{'own_department': True}],
+        'hr_manager': [{'own_department': True, 'max_level': 1}],
+        'auditor': [{'user_department': SECURITY_DEPARTMENT_ID, 'own_department': True}],
+    },
+    'delete': {
+        # Создатель может удалять свой документ
+        '*': [{'author': True}],
+        'company_director': [{}],
+        'db_admin': [{}],
+        'department_manager': [{'own_department': True}],
+    },
+}
+
+
+def _rules_for(action, user_role, user_dept_id):
+    """
+    Правила действия для пользователя
+
+    Условия на самого пользователя (user_department, other_department)
+    проверяются здесь, в результате остаются только условия на документ.
+    """
+    role_rules = ACCESS_RULES.get(action, {})
+    rules = []
+    for rule in role_rules.get('*', []) + role_rules.get(user_role, []):
+        if 'user_department' in rule and user_dept_id != rule['user_department']:
+            continue
+        if 'other_department' in rule and user_dept_id == rule['other_department']:
+            continue
+        rules.append({key: value for key, value in rule.items()
+                      if key not in ('user_department', 'other_department')})
+    # Правила, уже покрытые более широкими, только удлиняют условие SQL
+    return [rule for index, rule in enumerate(rules)
+            if not any(_covers(other, rule) for other_index, other in enumerate(rules)
+                       if other_index != index and (other != rule or other_index < index))]
+
+
+def _covers(wide, narrow):
+    """True если правило wide разрешает всё, что разрешает narrow"""
+    for key, value in wide.items():
+        if key not in narrow:
+            return False
+        if key == 'max_level':
+            if narrow[key] > value:
+                return False
+        elif narrow[key] != value:
+            return False
+    return True
+
+
+def compile_access_predicate(action, user_role, user_dept_id, user_id, alias='d'):
+    """
+    Компилирует правила доступа в условие SQL
+
+    Args:
+        action: 'view', 'edit' или 'delete'
+        user_role: роль пользователя
+        user_dept_id: ID отдела пользователя
+        user_id: ID пользователя
+        alias: псевдоним таблицы documents в запросе
+
+    Returns:
+        tuple: (условие, список параметров)
+    """
+    clauses = []
+    params = []
+    for rule in _rules_for(action, user_role, user_dept_id):
+        conditions = []
+        rule_params = []
+        if rule.get('own_department'):
+            if user_dept_id is None:
+                continue
+            conditions.append(f"{alias}.created_in_department_id = %s")
+            rule_params.append(user_dept_id)
+        if rule.get('author'):
+            if user_id is None:
+                continue
+            conditions.append(f"{alias}.created_by_employee_id = %s")
+            rule_params.append(user_id)
+        if 'max_level' in rule:
+            conditions.append(f"{alias}.confidentiality_level <= %s")
+            rule_params.append(rule['max_level'])
+
+        if not conditions:
+            # Правило без условий разрешает всё
+            return 'TRUE', []
+        clauses.append('(' + ' AND '.join(conditions) + ')')
+        params.extend(rule_params)
+
+    if not clauses:
+        return 'FALSE', []
+    return '(' + ' OR '.join(clauses) + ')', params
+
+
+def is_action_allowed(action, user_role, user_dept_id, user_id, document):
+    """Проверяет правила доступа для загруженного документа"""
+    for rule in _rules_for(action, user_role, user_dept_id):
+        if rule.get('own_department') and (
+                user_dept_id is None or document.get('created_in_department_id') != user_dept_id):
+            continue
+        if rule.get('author') and (
+                user_id is None or document.get('created_by_employee_id') != user_id):
+            continue
+        if 'max_level' in rule and document.get('confidentiality_level', 0) > rule['max_level']:
+            continue
+        return True
+    return False
+
 
 def can_view_document(user_role, user_dept_id, user_id, document):
     """
@@ -32,48 +172,7 @@ def can_view_document(user_role, user_dept_id, user_id, document):
     Returns:
         bool: True если доступ разрешен
     """
-    
-    # company_director видит всё
-    if user_role == 'company_director':
-        return True
-    
-    # db_admin видит всё
-    if user_role == 'db_admin':
-        return True
-    
-    # Публичные документы видны всем
-    if document.get('confidentiality_level') == 0:
-        return True
-    
-    # Сотрудник видит документы своего отдела (уровни 0,1) и свои документы
-    if user_role == 'employee':
-        return (document.get('created_in_department_id') == user_dept_id 
-                and document.get('confidentiality_level') in [0, 1]
-                or document.get('created_by_employee_id') == user_id)
-    
-    # Начальник отдела видит все документы своего отдела
-    if user_role == 'department_manager':
-        return document.get('created_in_department_id') == user_dept_id
-    
-    # HR видит документы своего отдела (уровни 0,1)
-    if user_role == 'hr_manager':
-        return (document.get('created_in_department_id') == user_dept_id 
-                and document.get('confidentiality_level') in [0, 1])
-    
-    # Аудитор
-    if user_role == 'auditor':
-        # Аудитор из отдела безопасности видит все документы своего отдела
-        if user_dept_id == 4:  # Отдел безопасности
-            return document.get('created_in_department_id') == user_dept_id
-        else:
-            # Остальные аудиторы видят публичные и ДСП
-            return document.get('confidentiality_level') in [0, 1]
-    
-    # Публичные пользователи
-    if user_role == 'public_users':
-        return document.get('confidentiality_level') == 0
-    
-    return False
+    return is_action_allowed('view', user_role, user_dept_id, user_id, document)
 
 def can_edit_document(user_role, user_dept_id, user_id, document):
     """
@@ -88,28 +187,7 @@ def can_edit_document(user_role, user_dept_id, user_id, document):
     Returns:
         bool: True если редактирование разрешено
     """
-    
-    # Создатель может редактировать свой документ
-    if document.get('created_by_employee_id') == user_id:
-        return True
-    
-    # Начальник отдела может редактировать документы своего отдела
-    if user_role == 'department_manager' and document.get('created_in_department_id') == user_dept_id:
-        return True
-    
-    # HR может редактировать документы своего отдела (уровни 0,1)
-    if user_role == 'hr_manager' and document.get('created_in_department_id') == user_dept_id and document.get('confidentiality_level') in [0, 1]:
-        return True
-    
-    # Аудитор из отдела безопасности может редактировать ВСЕ документы своего отдела
-    if user_role == 'auditor' and user_dept_id == 4 and document.get('created_in_department_id') == user_dept_id:
-        return True
-    
-    # Руководитель и админ БД могут всё
-    if user_role in ['company_director', 'db_admin']:
-        return True
-    
-    return False
+    return is_action_allowed('edit', user_role, user_dept_id, user_id, document)
 
 def can_delete_document(user_role, user_dept_id, user_id, document):
     """
@@ -124,20 +202,21 @@ def can_delete_document(user_role, user_dept_id, user_id, document):
     Returns:
         bool: True если удаление разрешено
     """
-    
-    # Создатель может удалять свой документ
-    if document.get('created_by_employee_id') == user_id:
-        return True
-    
-    # Начальник отдела может удалять документы своего отдела
-    if user_role == 'department_manager' and document.get('created_in_department_id') == user_dept_id:
-        return True
-    
-    # Руководитель и админ БД могут всё
-    if user_role in ['company_director', 'db_admin']:
-        return True
-    
-    return False
+    return is_action_allowed('delete', user_role, user_dept_id, user_id, document)
+
+def get_user_department(user_id):
+    """Получает отдел пользователя по его ID"""
+    try:
+        result = execute_query(
+            "SELECT department_id FROM employees WHERE employee_id = %s", 
+            (user_id,)
+        )
+        if result:
+            return result[0]['department_id']
+        return None
+    except Exception as e:
+        print(f"Error getting user department: {e}")
+        return None
 
 def get_documents_for_user(user_role, user_dept_id, user_id):
     """
@@ -153,111 +232,47 @@ def get_documents_for_user(user_role, user_dept_id, user_id):
     """
     
     try:
-        if user_role in ['company_director', 'db_admin']:
-            # Видят все документы
-            return execute_query("""
-                SELECT d.*, dep.name as department_name, emp.full_name as created_by_name
-                FROM documents d
-                LEFT JOIN departments dep ON d.created_in_department_id = dep.department_id
-                LEFT JOIN employees emp ON d.created_by_employee_id = emp.employee_id
-                ORDER BY d.created_at DESC
-            """)
-        
-        elif user_role == 'department_manager':
-            # Видят все документы своего отдела И все публичные документы
-            return execute_query("""
-                SELECT d.*, dep.name as department_name, emp.full_name as created_by_name
-                FROM documents d
-                LEFT JOIN departments dep ON d.created_in_department_id = dep.department_id
-                LEFT JOIN employees emp ON d.created_by_employee_id = emp.employee_id
-                WHERE d.created_in_department_id = %s 
-                   OR d.confidentiality_level = 0
-                ORDER BY d.created_at DESC
-            """, (user_dept_id,))
-        
-        elif user_role == 'hr_manager':
-            # Видят документы своего отдела (уровни 0,1) И все публичные
-            return execute_query("""
-                SELECT d.*, dep.name as department_name, emp.full_name as created_by_name
-                FROM documents d
-                LEFT JOIN departments dep ON d.created_in_department_id = dep.department_id
-                LEFT JOIN employees emp ON d.created_by_employee_id = emp.employee_id
-                WHERE (d.created_in_department_id = %s AND d.confidentiality_level IN (0, 1))
-                   OR d.confidentiality_level = 0
-                ORDER BY d.created_at DESC
-            """, (user_dept_id,))
-        
-        elif user_role == 'employee':
-            # Видят документы своего отдела (уровни 0,1), свои документы И все публичные
-            return execute_query("""
-                SELECT d.*, dep.name as department_name, emp.full_name as created_by_name
-                FROM documents d
-                LEFT JOIN departments dep ON d.created_in_department_id = dep.department_id
-                LEFT JOIN employees emp ON d.created_by_employee_id = emp.employee_id
-                WHERE (d.created_in_department_id = %s AND d.confidentiality_level IN (0, 1))
-                   OR d.created_by_employee_id = %s
-                   OR d.confidentiality_level = 0
-                ORDER BY d.created_at DESC
-            """, (user_dept_id, user_id))
-        
-        elif user_role == 'auditor':
-            # Аудитор из отдела безопасности видит все документы своего отдела
-            if user_dept_id == 4:  # Отдел безопасности
-                return execute_query("""
-                    SELECT d.*, dep.name as department_name, emp.full_name as created_by_name
-                    FROM documents d
-                    LEFT JOIN departments dep ON d.created_in_department_id = dep.department_id
-                    LEFT JOIN employees emp ON d.created_by_employee_id = emp.employee_id
-                    WHERE d.created_in_department_id = %s
-                    ORDER BY d.created_at DESC
-                """, (user_dept_id,))
-            else:
-                # Остальные аудиторы видят публичные и ДСП
-                return execute_query("""
-                    SELECT d.*, dep.name as department_name, emp.full_name as created_by_name
-                    FROM documents d
-                    LEFT JOIN departments dep ON d.created_in_department_id = dep.department_id
-                    LEFT JOIN employees emp ON d.created_by_employee_id = emp.employee_id
-                    WHERE d.confidentiality_level IN (0, 1)
-                    ORDER BY d.created_at DESC
-                """)
-        
-        elif user_role == 'public_users':
-            # Видят только публичные документы
-            return execute_query("""
-                SELECT d.*, dep.name as department_name, emp.full_name as created_by_name
-                FROM documents d
-                LEFT JOIN departments dep ON d.created_in_department_id = dep.department_id
-                LEFT JOIN employees emp ON d.created_by_employee_id = emp.employee_id
-                WHERE d.confidentiality_level = 0
-                ORDER BY d.created_at DESC
-            """)
-        
-        else:
+        predicate, params = compile_access_predicate('view', user_role, user_dept_id, user_id)
+        if predicate == 'FALSE':
             return []
+        return execute_query(f"""
+            SELECT {DOCUMENT_COLUMNS}, dep.name as department_name, emp.full_name as created_by_name
+            FROM documents d
+            LEFT JOIN departments dep ON d.created_in_department_id = dep.department_id
+            LEFT JOIN employees emp ON d.created_by_employee_id = emp.employee_id
+            WHERE {predicate}
+            ORDER BY d.created_at DESC
+        """, params)
             
     except Exception as e:
         print(f"Error getting documents for user: {e}")
         return []
 
-def get_document_by_id(document_id):
+def get_document_by_id(document_id, access=None):
     """
     Получает документ по ID
     
     Args:
         document_id: ID документа
+        access: (действие, роль, ID отдела, ID пользователя) - если указано,
+                в документ добавляется поле has_access, вычисленное в том же запросе
     
     Returns:
         dict: данные документа или None если не найден
     """
     try:
-        result = execute_query("""
-            SELECT d.*, dep.name as department_name, emp.full_name as created_by_name
+        access_column = ''
+        params = []
+        if access:
+            predicate, params = compile_access_predicate(*access)
+            access_column = f", {predicate} AS has_access"
+        result = execute_query(f"""
+            SELECT {DOCUMENT_COLUMNS}, dep.name as department_name, emp.full_name as created_by_name{access_column}
             FROM documents d
             LEFT JOIN departments dep ON d.created_in_department_id = dep.department_id
             LEFT JOIN employees emp ON d.created_by_employee_id = emp.employee_id
             WHERE d.document_id = %s
-        """, (document_id,))
+        """, params + [document_id])
         
         return result[0] if result else None
     except Exception as e:
@@ -279,17 +294,12 @@ def check_document_access(user_role, user_dept_id, user_id, document_id, action=
         tuple: (bool, dict) - доступ разрешен и данные документа
     """
     
-    document = get_document_by_id(document_id)
+    if action not in ACCESS_RULES:
+        return False, get_document_by_id(document_id)
+    
+    document = get_document_by_id(document_id, (action, user_role, user_dept_id, user_id))
     if not document:
         return False, None
     
-    if action == 'view':
-        has_access = can_view_document(user_role, user_dept_id, user_id, document)
-    elif action == 'edit':
-        has_access = can_edit_document(user_role, user_dept_id, user_id, document)
-    elif action == 'delete':
-        has_access = can_delete_document(user_role, user_dept_id, user_id, document)
-    else:
-        has_access = False
-    
-    return has_access, document
\ No newline at end of file
+    has_access = bool(document.pop('has_access'))
+    return has_access, document
@@ -0,0 +1,97 @@
+"""
+Модуль контентно-адресуемого хранилища файлов документов
+Файл хранится один раз под ключом blobs/ab/cd/<sha256> в хранилище
+(documents/storage_backends.py), одинаковые загрузки разделяют один файл.
+Количество ссылок на файл ведет триггер по таблице documents
+(document_blobs.ref_count); файл без ссылок удаляет фоновая задача delete_blob.
+"""
+
+from config import Config
+from database.db import execute_query, get_db_connection, release_db_connection
+from documents.storage_backends import get_storage
+from documents.file_index import index_file
+from documents.previews import delete_preview
+
+BLOB_FOLDER = 'blobs'
+
+
+def blob_relative_path(content_hash):
+    """Путь файла относительно папки загрузок (хранится в documents.stored_file_path)"""
+    return f"{BLOB_FOLDER}/{content_hash[:2]}/{content_hash[2:4]}/{content_hash}"
+
+
+def is_blob_path(stored_file_path):
+    """True если путь указывает на файл в хранилище, а не на файл старого формата"""
+    return stored_file_path.startswith(BLOB_FOLDER + '/')
+
+
+def store_upload(upload):
+    """
+    Сохраняет загруженный файл в хранилище
+
+    Если файл с таким содержимым уже есть, временный файл просто удаляется.
+    Имя файла определяется содержимым, поэтому подбирать свободное имя не нужно.
+    Перед проверкой файл отмечается используемым (document_blobs.last_used_at),
+    чтобы delete_blob не удалил его, пока документ на него еще не сослался.
+
+    Args:
+        upload: HashingUploadFile с полностью записанным содержимым
+
+    Returns:
+        tuple: (относительный путь, True если файл уже был в хранилище)
+    """
+    relative_path = blob_relative_path(upload.sha256)
+    storage = get_storage()
+    try:
+        # Ждет завершения идущего delete_blob; после фиксации файл уже не удаляется
+        execute_query("""
+            INSERT INTO document_blobs (content_hash, ref_count, byte_size, last_used_at)
+            VALUES (%s, 0, %s, NOW())
+            ON CONFLICT (content_hash) DO UPDATE SET last_used_at = NOW()
+        """, (upload.sha256, upload.size), fetch=False)
+        if storage.exists(relative_path):
+            return relative_path, True
+        storage.put(relative_path, upload)
+        index_file(relative_path, upload.size, upload.sha256)
+        return relative_path, False
+    finally:
+        upload.close()
+
+
+def delete_blob(content_hash):
+    """
+    Удаляет файл, на который не ссылается ни один документ
+
+    Файл, загруженный заново за последние Config.BLOB_GC_DELAY секунд,
+    не удаляется: загрузка могла найти его в хранилище и еще не сохранить
+    документ. Строка document_blobs блокируется до удаления файла, поэтому
+    store_upload, начатый во время удаления, увидит, что файла уже нет.
+
+    Returns:
+        bool: True если файл удален
+    """
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute("""
+            SELECT ref_count,
+                   last_used_at > NOW() - make_interval(secs => %s) AS recently_used
+            FROM document_blobs WHERE content_hash = %s FOR UPDATE
+        """, (Config.BLOB_GC_DELAY, content_hash))
+        row = cur.fetchone()
+        if row and (row['ref_count'] > 0 or row['recently_used']):
+            conn.rollback()
+            return False
+
+        cur.execute("DELETE FROM document_blobs WHERE content_hash = %s", (content_hash,))
+        cur.execute("DELETE FROM document_files WHERE path = %s", (blob_relative_path(content_hash),))
+        get_storage().delete(blob_relative_path(content_hash))
+        delete_preview(blob_relative_path(content_hash))
+        conn.commit()
+        return True
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        release_db_connection(conn)
@@ -0,0 +1,94 @@
+"""
+Модуль отдачи файлов документов
+Вызывается после проверки доступа (check_document_access). Файл отдается
+одним из способов, от самого дешевого для приложения:
+  - перенаправление на временную ссылку хранилища (S3);
+  - X-Accel-Redirect (nginx) или X-Sendfile (Apache, lighttpd): приложение
+    отвечает только заголовками, файл отдает веб-сервер;
+  - send_file с поддержкой Range, ETag и If-None-Match.
+"""
+
+import mimetypes
+import os
+import unicodedata
+from urllib.parse import quote
+from flask import Response, redirect, send_file
+from config import Config
+from documents.file_storage import find_document_file, get_upload_folder
+from documents.storage_backends import get_storage
+
+
+def _attachment_headers(response, download_name):
+    """Content-Disposition: attachment с именем файла (не-ASCII имена - через filename*)"""
+    try:
+        download_name.encode('ascii')
+        names = {'filename': download_name}
+    except UnicodeEncodeError:
+        simple = unicodedata.normalize('NFKD', download_name).encode('ascii', 'ignore').decode('ascii')
+        names = {'filename': simple, 'filename*': f"UTF-8''{quote(download_name, safe='!#$&+^`|~')}"}
+    response.headers.set('Content-Disposition', 'attachment', **names)
+
+
+def _accel_redirect_response(file_path, download_name):
+    """Ответ без тела: файл из internal location отдает nginx (с Range и ETag)"""
+    relative_path = os.path.relpath(file_path, get_upload_folder()).replace(os.sep, '/')
+    mimetype = mimetypes.guess_type(download_name)[0] or 'application/octet-stream'
+    response = Response(mimetype=mimetype)
+    response.headers['X-Accel-Redirect'] = Config.DOWNLOAD_ACCEL_PREFIX + quote(relative_path)
+    _attachment_headers(response, download_name)
+    return response
+
+
+def send_document_file(document):
+    """
+    Ответ со скачиванием файла документа
+
+    Args:
+        document: данные документа из БД (stored_file_path, file_name, content_hash)
+
+    Returns:
+        Response или None если файл не найден
+    """
+    storage = get_storage()
+    storage_key = document['stored_file_path']
+    download_name = document['file_name']
+    # SHA-256 содержимого - готовый ETag, не нужно читать файл
+    etag = document.get('content_hash') or True
+
+    # Если хранилище выдает временные ссылки, файл скачивается напрямую из него
+    if Config.STORAGE_REDIRECT_DOWNLOADS:
+        presigned_url = storage.presigned_url(storage_key, download_name)
+        if presigned_url:
+            return redirect(presigned_url)
+
+    try:
+        file_path = storage.local_path(storage_key)
+    except ValueError:
+        # Путь вне папки загрузок (старый формат) - ищем файл по имени
+        file_path = ''
+
+    if file_path is None:
+        if not storage.exists(storage_key):
+            return None
+        response = send_file(storage.open(storage_key), as_attachment=True,
+                             download_name=download_name, etag=etag)
+    else:
+        # Если файл не найден по основному пути, ищем по имени в индексе файлов
+        if not file_path or not os.path.exists(file_path):
+            file_path = find_document_file(download_name)
+            if not file_path:
+                return None
+
+        if Config.DOWNLOAD_OFFLOAD == 'nginx':
+            response = _accel_redirect_response(file_path, download_name)
+        else:
+            # При USE_X_SENDFILE Flask сам заменяет тело заголовком X-Sendfile
+            response = send_file(file_path, as_attachment=True, download_name=download_name,
+                                 etag=etag, conditional=True)
+
+    # Файлы доступны не всем: не кешировать в общих кешах, но разрешить
+    # браузеру повторно использовать копию после проверки ETag
+    response.cache_control.private = True
+    response.cache_control.public = False
+    response.cache_control.no_cache = True
+    return response
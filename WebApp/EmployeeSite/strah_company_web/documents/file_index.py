@@ -0,0 +1,44 @@
+"""
+Модуль индекса файлов хранилища
+Таблица document_files хранит путь, имя, размер, время изменения и SHA-256
+каждого файла в хранилище. Индекс обновляется при сохранении и удалении
+файлов, полностью сверяется с диском командой python -m documents.reconcile.
+Поиск файла - один запрос по индексу, без перебора папок.
+"""
+
+import posixpath
+from werkzeug.utils import secure_filename
+from database.db import execute_query
+
+
+def index_file(path, size, content_hash=None, mtime=None):
+    """Добавляет файл в индекс или обновляет его запись"""
+    execute_query("""
+        INSERT INTO document_files (path, file_name, size, mtime, content_hash)
+        VALUES (%s, %s, %s, %s, %s)
+        ON CONFLICT (path) DO UPDATE
+        SET file_name = EXCLUDED.file_name, size = EXCLUDED.size, mtime = EXCLUDED.mtime,
+            content_hash = EXCLUDED.content_hash, indexed_at = NOW()
+    """, (path, posixpath.basename(path), size, mtime, content_hash), fetch=False)
+
+
+def remove_from_index(path):
+    """Удаляет файл из индекса"""
+    execute_query("DELETE FROM document_files WHERE path = %s", (path,), fetch=False)
+
+
+def find_indexed_file(file_name):
+    """
+    Ищет файл по имени (как в documents.file_name) в индексе
+
+    Returns:
+        str: путь файла в хранилище или None
+    """
+    possible_names = list({file_name, secure_filename(file_name), file_name.replace(' ', '_')})
+    result = execute_query("""
+        SELECT path FROM document_files
+        WHERE file_name = ANY(%s)
+        ORDER BY indexed_at DESC
+        LIMIT 1
+    """, (possible_names,))
+    return result[0]['path'] if result else None
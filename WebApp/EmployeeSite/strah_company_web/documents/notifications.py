@@ -1,101 +1,87 @@
 """
 Модуль уведомлений об изменениях документов
+Уведомления создает триггер notify_document_change (Trigger.sql) для автора
+документа (recipient_id). Количество непрочитанных хранится в
+notification_counters и обновляется триггером.
 """
 
 from database.db import execute_query
+from database.pagination import paginate
 
-def create_notification(document_id, changed_by_user_id, change_description):
+# Лента: последняя колонка делает порядок однозначным
+NOTIFICATION_SORTS = {
+    'created_at': ('created_at', 'notification_id'),
+}
+
+def get_user_notifications(user_id, unread_only=False):
     """
-    Создает уведомление об изменении документа
+    Получает страницу уведомлений пользователя
+    
+    Параметры страницы (after, before, per_page) читаются из запроса.
     
     Args:
-        document_id: ID измененного документа
-        changed_by_user_id: ID пользователя, который внес изменения
-        change_description: описание изменений
+        user_id: ID пользователя
+        unread_only: только непрочитанные
     
     Returns:
-        bool: True если уведомление создано успешно
+        dict: страница (см. database.pagination.paginate), rows - уведомления
+    """
+    unread_filter = "AND n.is_read = false" if unread_only else ""
+    query = f"""
+        SELECT n.*, d.file_name, emp.full_name as changed_by_name
+        FROM notifications n
+        JOIN documents d ON n.document_id = d.document_id
+        JOIN employees emp ON n.changed_by_employee_id = emp.employee_id
+        WHERE n.recipient_id = %s {unread_filter}
+    """
+    return paginate(query, (user_id,), sort_columns=NOTIFICATION_SORTS,
+                    default_sort='created_at', default_direction='desc')
+
+def get_unread_count(user_id):
+    """
+    Количество непрочитанных уведомлений пользователя
+    
+    Returns:
+        int: количество (0 при ошибке)
     """
     try:
-        # Получаем информацию о создателе документа
-        creator_query = """
-            SELECT created_by_employee_id, file_name 
-            FROM documents 
-            WHERE document_id = %s
-        """
-        doc_info = execute_query(creator_query, (document_id,))
-        
-        if not doc_info:
-            return False
-        
-        creator_id = doc_info[0]['created_by_employee_id']
-        file_name = doc_info[0]['file_name']
-        
-        # Создаем уведомление только если изменял не сам создатель
-        if creator_id != changed_by_user_id:
-            # Получаем имя изменившего пользователя
-            changer_query = """
-                SELECT full_name FROM employees WHERE employee_id = %s
-            """
-            changer_info = execute_query(changer_query, (changed_by_user_id,))
-            changer_name = changer_info[0]['full_name'] if changer_info else "Неизвестный пользователь"
-            
-            # Формируем описание уведомления
-            notification_text = f"Документ '{file_name}' был изменен пользователем {changer_name}. {change_description}"
-            
-            execute_query("""
-                INSERT INTO notifications (document_id, changed_by_employee_id, change_description)
-                VALUES (%s, %s, %s)
-            """, (document_id, changed_by_user_id, notification_text), fetch=False)
-        
-        return True
+        result = execute_query(
+            "SELECT unread FROM notification_counters WHERE recipient_id = %s",
+            (user_id,)
+        )
+        return result[0]['unread'] if result else 0
     except Exception as e:
-        print(f"Error creating notification: {e}")
-        return False
+        print(f"Error getting unread count: {e}")
+        return 0
 
-def get_user_notifications(user_id):
+def mark_notifications_as_read(user_id, notification_ids=None):
     """
-    Получает уведомления пользователя
+    Помечает уведомления пользователя как прочитанные
     
     Args:
-        user_id: ID пользователя
+        user_id: ID пользователя (чужие уведомления не затрагиваются)
+        notification_ids: список ID; None - все непрочитанные
     
     Returns:
-        list: список уведомлений
+        int: количество помеченных уведомлений
     """
     try:
-        # Получаем документы, созданные пользователем
-        user_documents = execute_query("""
-            SELECT document_id FROM documents WHERE created_by_employee_id = %s
-        """, (user_id,))
-        
-        if not user_documents:
-            return []
-        
-        document_ids = [doc['document_id'] for doc in user_documents]
-        
-        # Получаем уведомления об изменениях этих документов
-        placeholders = ','.join(['%s'] * len(document_ids))
-        query = f"""
-            SELECT n.*, d.file_name, emp.full_name as changed_by_name
-            FROM notifications n
-            JOIN documents d ON n.document_id = d.document_id
-            JOIN employees emp ON n.changed_by_employee_id = emp.employee_id
-            WHERE n.document_id IN ({placeholders})
-            ORDER BY n.created_at DESC
-            LIMIT 50
+        query = """
+            UPDATE notifications SET is_read = true
+            WHERE recipient_id = %s AND is_read = false
         """
-        
-        return execute_query(query, document_ids)
-        
+        params = [user_id]
+        if notification_ids is not None:
+            if not notification_ids:
+                return 0
+            query += " AND notification_id = ANY(%s)"
+            params.append(list(notification_ids))
+        result = execute_query(query + " RETURNING notification_id", params)
+        return len(result or [])
     except Exception as e:
-        print(f"Error getting user notifications: {e}")
-        return []
+        print(f"Error marking notifications as read: {e}")
+        return 0
 
-def mark_notification_as_read(notification_id):
-    """
-    Помечает уведомление как прочитанное
-    (В будущем можно добавить поле is_read в таблицу notifications)
-    """
-    # Заглушка для будущей реализации
-    return True
\ No newline at end of file
+def mark_notification_as_read(notification_id, user_id):
+    """Помечает одно уведомление как прочитанное"""
+    return mark_notifications_as_read(user_id, [notification_id]) == 1
@@ -0,0 +1,145 @@
+"""
+Модуль превью документов
+Превью (JPEG до PREVIEW_MAX_SIZE точек) создается при первом запросе и
+хранится рядом с файлом документа: <stored_file_path>.preview.jpg.
+Изображения уменьшаются через Pillow, для PDF рисуется первая страница
+через pdftoppm (poppler-utils). Если нужного инструмента нет, превью
+не создается и страница документа показывается без него.
+
+Путь превью зависит от файла документа, поэтому замена файла дает новое
+превью; старое удаляется вместе со своим файлом.
+"""
+
+import hashlib
+import io
+import os
+import shutil
+import subprocess
+import tempfile
+from config import Config
+from documents.storage_backends import get_storage, local_file
+from documents.uploads import HashingUploadFile, get_temp_folder
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+PREVIEW_SUFFIX = '.preview.jpg'
+
+# Сигнатуры поддерживаемых форматов (у файлов хранилища нет расширения)
+FILE_SIGNATURES = {
+    b'\xff\xd8\xff': 'image',
+    b'\x89PNG\r\n\x1a\n': 'image',
+    b'%PDF-': 'pdf',
+}
+
+
+def get_preview_key(stored_file_path):
+    return f"{stored_file_path}{PREVIEW_SUFFIX}"
+
+
+def is_preview_key(path):
+    return path.endswith(PREVIEW_SUFFIX)
+
+
+def get_preview_version(document):
+    """Версия превью для URL: меняется при замене файла, поэтому превью можно кешировать надолго"""
+    if document.get('content_hash'):
+        return document['content_hash'].strip()[:16]
+    return hashlib.sha1(document['stored_file_path'].encode('utf-8')).hexdigest()[:16]
+
+
+def _detect_kind(head):
+    for signature, kind in FILE_SIGNATURES.items():
+        if head.startswith(signature):
+            return kind
+    return None
+
+
+def _render_image(source_path):
+    if Image is None:
+        return None
+    with Image.open(source_path) as image:
+        image.thumbnail(Config.PREVIEW_MAX_SIZE)
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+        buffer = io.BytesIO()
+        image.save(buffer, 'JPEG', quality=Config.PREVIEW_QUALITY, optimize=True)
+        return buffer.getvalue()
+
+
+def _render_pdf(source_path):
+    pdftoppm = shutil.which('pdftoppm')
+    if pdftoppm is None:
+        return None
+    with tempfile.TemporaryDirectory(dir=get_temp_folder()) as work_dir:
+        output_prefix = os.path.join(work_dir, 'page')
+        subprocess.run(
+            [pdftoppm, '-f', '1', '-l', '1', '-singlefile', '-jpeg',
+             '-scale-to', str(max(Config.PREVIEW_MAX_SIZE)), source_path, output_prefix],
+            check=True, timeout=Config.PREVIEW_RENDER_TIMEOUT,
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        with open(output_prefix + '.jpg', 'rb') as f:
+            return f.read()
+
+
+def generate_preview(stored_file_path):
+    """
+    Создает превью файла
+
+    Returns:
+        bool: True если превью создано, False если формат не поддерживается
+              или нет инструмента для рендеринга
+    """
+    storage = get_storage()
+    with local_file(storage, stored_file_path, get_temp_folder()) as source_path:
+        with open(source_path, 'rb') as f:
+            kind = _detect_kind(f.read(8))
+        if kind == 'image':
+            data = _render_image(source_path)
+        elif kind == 'pdf':
+            data = _render_pdf(source_path)
+        else:
+            data = None
+
+    if not data:
+        return False
+
+    upload = HashingUploadFile(None)
+    try:
+        upload.write(data)
+        storage.put(get_preview_key(stored_file_path), upload)
+    finally:
+        upload.close()
+    return True
+
+
+def get_preview(stored_file_path):
+    """
+    Ключ превью в хранилище; превью создается при первом обращении
+
+    Returns:
+        str: ключ превью или None если превью для файла нет
+    """
+    preview_key = get_preview_key(stored_file_path)
+    storage = get_storage()
+    if storage.exists(preview_key):
+        return preview_key
+    if not storage.exists(stored_file_path):
+        return None
+    try:
+        if generate_preview(stored_file_path):
+            return preview_key
+    except Exception as e:
+        print(f"Error generating preview for {stored_file_path}: {e}")
+    return None
+
+
+def delete_preview(stored_file_path):
+    """Удаляет превью файла (вместе с самим файлом)"""
+    try:
+        get_storage().delete(get_preview_key(stored_file_path))
+    except Exception as e:
+        print(f"Error deleting preview for {stored_file_path}: {e}")
@@ -0,0 +1,137 @@
+"""
+Модуль доставки уведомлений в реальном времени
+Один поток на процесс слушает канал PostgreSQL (LISTEN), куда триггер
+notify_document_change отправляет уведомления, и раздает их очередям
+подключенных браузеров (server-sent events).
+"""
+
+import json
+import queue
+import select
+import threading
+import time
+import psycopg2
+from psycopg2 import extensions, sql
+from config import Config
+from database.db import open_dedicated_connection
+
+
+class NotificationListener:
+    """
+    Слушатель канала уведомлений
+
+    Держит одно отдельное соединение с autocommit (вне пула) и переподключается
+    при обрыве. Поток запускается при первой подписке.
+    """
+
+    def __init__(self, channel):
+        self.channel = channel
+        self._lock = threading.Lock()
+        self._subscribers = {}  # recipient_id -> set(queue.Queue)
+        self._thread = None
+
+    def subscribe(self, recipient_id):
+        """Регистрирует очередь событий для получателя"""
+        events = queue.Queue(maxsize=Config.SSE_QUEUE_SIZE)
+        with self._lock:
+            self._subscribers.setdefault(recipient_id, set()).add(events)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='notification-listener', daemon=True)
+                self._thread.start()
+        return events
+
+    def unsubscribe(self, recipient_id, events):
+        with self._lock:
+            queues = self._subscribers.get(recipient_id)
+            if queues is not None:
+                queues.discard(events)
+                if not queues:
+                    del self._subscribers[recipient_id]
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(queues) for queues in self._subscribers.values())
+
+    def _dispatch(self, payload):
+        try:
+            event = json.loads(payload)
+        except ValueError:
+            print(f"DEBUG: Invalid notification payload: {payload!r}")
+            return
+        with self._lock:
+            queues = list(self._subscribers.get(event.get('recipient_id'), ()))
+        for events in queues:
+            try:
+                events.put_nowait(event)
+            except queue.Full:
+                # Клиент не успевает читать - событие останется в ленте /notifications
+                pass
+
+    def _listen(self):
+        conn = open_dedicated_connection()
+        try:
+            conn.set_isolation_level(extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            cur = conn.cursor()
+            cur.execute(sql.SQL("LISTEN {}").format(sql.Identifier(self.channel)))
+            print(f"DEBUG: Listening for notifications on {self.channel}")
+            while True:
+                # Без подписчиков поток завершается и закрывает соединение
+                with self._lock:
+                    if not self._subscribers:
+                        self._thread = None
+                        return
+                if select.select([conn], [], [], Config.SSE_HEARTBEAT_INTERVAL) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    self._dispatch(conn.notifies.pop(0).payload)
+        finally:
+            conn.close()
+
+    def _run(self):
+        delay = 1
+        while True:
+            try:
+                self._listen()
+                return
+            except psycopg2.Error as e:
+                print(f"DEBUG: Notification listener error: {e}, reconnecting in {delay}s")
+                time.sleep(delay)
+                delay = min(delay * 2, 30)
+
+
+_listener = None
+_listener_lock = threading.Lock()
+
+
+def get_listener():
+    """Возвращает слушателя уведомлений процесса"""
+    global _listener
+    if _listener is None:
+        with _listener_lock:
+            if _listener is None:
+                _listener = NotificationListener(Config.NOTIFICATIONS_CHANNEL)
+    return _listener
+
+
+def event_stream(recipient_id):
+    """
+    Генератор потока server-sent events для получателя
+
+    Раз в SSE_HEARTBEAT_INTERVAL секунд отправляет комментарий, чтобы
+    прокси не закрывали соединение, а отключение клиента обнаруживалось.
+    """
+    listener = get_listener()
+    events = listener.subscribe(recipient_id)
+    try:
+        yield "retry: 5000\n\n"
+        while True:
+            try:
+                event = events.get(timeout=Config.SSE_HEARTBEAT_INTERVAL)
+            except queue.Empty:
+                yield ": ping\n\n"
+                continue
+            data = json.dumps(event, ensure_ascii=False)
+            yield f"id: {event.get('notification_id')}\nevent: notification\ndata: {data}\n\n"
+    finally:
+        listener.unsubscribe(recipient_id, events)
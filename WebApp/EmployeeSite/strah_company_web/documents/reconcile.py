@@ -0,0 +1,177 @@
+"""
+Сверка индекса файлов с папкой загрузок
+
+Запуск (из каталога приложения):
+    python -m documents.reconcile [--dry-run]
+
+1. Папка загрузок обходится один раз, индекс document_files приводится
+   в соответствие с диском (SHA-256 пересчитывается только для новых
+   и измененных файлов).
+2. Документам, у которых stored_file_path не указывает на файл из индекса,
+   подбирается файл: по content_hash, по имени файла из stored_file_path
+   или по названию документа. Путь исправляется, только если найден
+   ровно один подходящий файл. Все исправления - одним UPDATE.
+"""
+
+import argparse
+import hashlib
+import os
+import posixpath
+from datetime import datetime, timezone
+from psycopg2.extras import execute_values
+from werkzeug.utils import secure_filename
+from config import Config
+from database.db import get_db_connection, release_db_connection
+from documents.storage_layout import get_layout
+from documents.previews import is_preview_key
+
+
+def file_sha256(path):
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(Config.UPLOAD_CHUNK_SIZE), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def scan_uploads(root, indexed):
+    """
+    Обходит папку загрузок
+
+    Args:
+        root: корень папки загрузок
+        indexed: {путь: запись индекса} - для файлов без изменений хеш берется отсюда
+
+    Returns:
+        dict: {путь: (размер, время изменения, SHA-256)}
+    """
+    files = {}
+    for folder, subfolders, filenames in os.walk(root):
+        # Временные файлы загрузок и служебные файлы не индексируются
+        subfolders[:] = [name for name in subfolders if not name.startswith('.')]
+        for filename in filenames:
+            if filename.startswith('.'):
+                continue
+            full_path = os.path.join(folder, filename)
+            path = os.path.relpath(full_path, root).replace(os.sep, '/')
+            # Превью лежат рядом с файлами, но документами не являются
+            if is_preview_key(path):
+                continue
+            stat = os.stat(full_path)
+            mtime = datetime.fromtimestamp(stat.st_mtime, tz=timezone.utc)
+            entry = indexed.get(path)
+            if entry and entry['size'] == stat.st_size and entry['mtime'] == mtime and entry['content_hash']:
+                content_hash = entry['content_hash']
+            else:
+                content_hash = file_sha256(full_path)
+            files[path] = (stat.st_size, mtime, content_hash)
+    return files
+
+
+def _single(candidates):
+    return candidates[0] if len(candidates) == 1 else None
+
+
+def plan_repairs(documents, files):
+    """
+    Подбирает файлы для документов с неверным stored_file_path
+
+    Returns:
+        tuple: (список (document_id, старый путь, новый путь), список ненайденных document_id)
+    """
+    by_hash = {}
+    by_name = {}
+    for path, (size, mtime, content_hash) in files.items():
+        by_hash.setdefault(content_hash, []).append(path)
+        by_name.setdefault(posixpath.basename(path), []).append(path)
+
+    repairs = []
+    missing = []
+    for document in documents:
+        new_path = None
+        if document['content_hash']:
+            new_path = _single(by_hash.get(document['content_hash'].strip(), []))
+        if new_path is None:
+            new_path = _single(by_name.get(posixpath.basename(document['stored_file_path']), []))
+        if new_path is None:
+            for name in (document['file_name'], secure_filename(document['file_name']),
+                         document['file_name'].replace(' ', '_')):
+                new_path = _single(by_name.get(name, []))
+                if new_path:
+                    break
+        if new_path:
+            repairs.append((document['document_id'], document['stored_file_path'], new_path))
+        else:
+            missing.append(document['document_id'])
+    return repairs, missing
+
+
+def reconcile(dry_run=False):
+    if Config.STORAGE_BACKEND != 'local':
+        print(f"Сверка поддерживается только для локального хранилища (STORAGE_BACKEND={Config.STORAGE_BACKEND})")
+        return
+
+    root = get_layout().folder()
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT path, size, mtime, content_hash FROM document_files")
+        indexed = {row['path']: row for row in cur.fetchall()}
+        files = scan_uploads(root, indexed)
+
+        changed = [(path, posixpath.basename(path), size, mtime, content_hash)
+                   for path, (size, mtime, content_hash) in files.items()
+                   if path not in indexed
+                   or (indexed[path]['size'], indexed[path]['mtime'], indexed[path]['content_hash']) != (size, mtime, content_hash)]
+        removed = [path for path in indexed if path not in files]
+        print(f"Files on disk: {len(files)}, new or changed: {len(changed)}, removed: {len(removed)}")
+
+        if not dry_run:
+            if changed:
+                execute_values(cur, """
+                    INSERT INTO document_files (path, file_name, size, mtime, content_hash)
+                    VALUES %s
+                    ON CONFLICT (path) DO UPDATE
+                    SET file_name = EXCLUDED.file_name, size = EXCLUDED.size, mtime = EXCLUDED.mtime,
+                        content_hash = EXCLUDED.content_hash, indexed_at = NOW()
+                """, changed)
+            if removed:
+                cur.execute("DELETE FROM document_files WHERE path = ANY(%s)", (removed,))
+
+        cur.execute("""
+            SELECT document_id, stored_file_path, file_name, content_hash
+            FROM documents
+            WHERE stored_file_path <> ALL(%s)
+            ORDER BY document_id
+        """, (list(files),))
+        repairs, missing = plan_repairs(cur.fetchall(), files)
+        for document_id, old_path, new_path in repairs:
+            print(f"Document {document_id}: {old_path} -> {new_path}")
+        if missing:
+            print(f"Files not found for documents: {', '.join(str(document_id) for document_id in missing)}")
+
+        if not dry_run and repairs:
+            execute_values(cur, """
+                UPDATE documents d SET stored_file_path = v.new_path
+                FROM (VALUES %s) AS v(document_id, new_path)
+                WHERE d.document_id = v.document_id
+            """, [(document_id, new_path) for document_id, old_path, new_path in repairs])
+
+        if dry_run:
+            conn.rollback()
+        else:
+            conn.commit()
+        print(f"Repaired: {len(repairs)}, still missing: {len(missing)}" + (" (dry run)" if dry_run else ""))
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+        release_db_connection(conn)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Сверка индекса файлов и путей документов с папкой загрузок")
+    parser.add_argument('--dry-run', action='store_true', help="только показать изменения")
+    args = parser.parse_args()
+    reconcile(dry_run=args.dry_run)
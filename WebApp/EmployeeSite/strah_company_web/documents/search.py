@@ -0,0 +1,49 @@
+"""
+Модуль полнотекстового поиска документов
+Поиск по documents.search_vector (название, описание и извлеченный текст
+файла, см. Trigger.sql) с GIN-индексом. Условие доступа то же, что и для
+списка документов, поэтому в результатах только доступные пользователю документы.
+"""
+
+from database.pagination import paginate
+from documents.access_control import compile_access_predicate
+
+SEARCH_SORTS = {
+    'rank': ('rank', 'document_id'),
+    'created_at': ('created_at', 'document_id'),
+}
+
+
+def search_documents(text, user_role, user_dept_id, user_id):
+    """
+    Ищет документы, доступные пользователю
+
+    Args:
+        text: поисковый запрос (синтаксис websearch: "фраза", -исключение, or)
+        user_role: роль пользователя
+        user_dept_id: ID отдела пользователя
+        user_id: ID пользователя
+
+    Returns:
+        dict: страница результатов (см. database.pagination.paginate)
+              или None если документов, доступных пользователю, нет
+    """
+    predicate, params = compile_access_predicate('view', user_role, user_dept_id, user_id)
+    if predicate == 'FALSE':
+        return None
+
+    query = f"""
+        SELECT d.document_id, d.file_name, d.description, d.confidentiality_level,
+               d.file_size, d.created_at, dep.name AS department_name,
+               emp.full_name AS created_by_name,
+               -- ts_rank_cd возвращает real; курсор страницы приходит как float8,
+               -- и сравнение real с float8 пропускало бы строки с тем же рангом
+               ts_rank_cd(d.search_vector, q.query)::float8 AS rank
+        FROM documents d
+        CROSS JOIN websearch_to_tsquery('russian', %s) AS q(query)
+        LEFT JOIN departments dep ON d.created_in_department_id = dep.department_id
+        LEFT JOIN employees emp ON d.created_by_employee_id = emp.employee_id
+        WHERE d.search_vector @@ q.query AND {predicate}
+    """
+    return paginate(query, [text] + params, sort_columns=SEARCH_SORTS,
+                    default_sort='rank', default_direction='desc')
@@ -0,0 +1,192 @@
+"""
+Модуль хранилищ файлов документов
+Файлы адресуются ключом - путем относительно корня хранилища (тот же, что
+в documents.stored_file_path). Хранилище выбирается параметром
+STORAGE_BACKEND: 'local' - папка загрузок на диске, 's3' - S3-совместимое
+хранилище (AWS S3, MinIO), требует пакет boto3.
+"""
+
+import os
+import shutil
+import tempfile
+from contextlib import closing, contextmanager
+from urllib.parse import quote
+from config import Config
+from documents.storage_layout import check_writable
+
+
+class LocalStorageBackend:
+    """Файлы в локальной папке (по умолчанию Config.UPLOAD_FOLDER)"""
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self._folders = set()  # уже созданные папки
+
+    def local_path(self, key):
+        """Путь к файлу на диске; ключ не может указывать за пределы корня"""
+        path = os.path.abspath(os.path.join(self.root, key))
+        if os.path.commonpath([self.root, path]) != self.root:
+            raise ValueError(f"Недопустимый путь файла: {key}")
+        return path
+
+    def put(self, key, upload):
+        """Сохраняет временный файл загрузки (HashingUploadFile) под ключом"""
+        path = self.local_path(key)
+        folder = os.path.dirname(path)
+        if folder not in self._folders:
+            os.makedirs(folder, exist_ok=True)
+            self._folders.add(folder)
+        upload.commit(path)
+
+    def open(self, key):
+        """Открывает файл на чтение"""
+        return open(self.local_path(key), 'rb')
+
+    def delete(self, key):
+        """Удаляет файл; True если файл был удален"""
+        path = self.local_path(key)
+        if os.path.exists(path):
+            os.remove(path)
+            return True
+        return False
+
+    def exists(self, key):
+        return os.path.exists(self.local_path(key))
+
+    def size(self, key):
+        """Размер файла в байтах или None если файла нет"""
+        try:
+            return os.path.getsize(self.local_path(key))
+        except OSError:
+            return None
+
+    def presigned_url(self, key, download_name=None, expires=None):
+        # Локальные файлы отдает приложение
+        return None
+
+    def health(self):
+        return check_writable(self.root)
+
+
+class S3StorageBackend:
+    """Файлы в бакете S3-совместимого хранилища"""
+
+    def __init__(self, bucket, prefix='', endpoint_url=None, region=None,
+                 access_key=None, secret_key=None, presign_expires=300):
+        try:
+            import boto3
+            from botocore.config import Config as BotoConfig
+            from botocore.exceptions import ClientError
+        except ImportError:
+            raise RuntimeError("Для STORAGE_BACKEND=s3 требуется пакет boto3")
+
+        self.bucket = bucket
+        self.prefix = prefix
+        self.presign_expires = presign_expires
+        self._client_error = ClientError
+        # MinIO и другие совместимые хранилища обычно работают только с адресацией по пути
+        self.client = boto3.client(
+            's3',
+            endpoint_url=endpoint_url,
+            region_name=region,
+            aws_access_key_id=access_key,
+            aws_secret_access_key=secret_key,
+            config=BotoConfig(signature_version='s3v4',
+                              s3={'addressing_style': 'path' if endpoint_url else 'auto'}),
+        )
+
+    def _object_key(self, key):
+        return f"{self.prefix}{key}"
+
+    def _head(self, key):
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self._object_key(key))
+        except self._client_error as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise
+
+    def local_path(self, key):
+        return None
+
+    def put(self, key, upload):
+        """Загружает временный файл загрузки (HashingUploadFile); временный файл удалит upload.close()"""
+        upload.flush()
+        self.client.upload_file(upload.path, self.bucket, self._object_key(key))
+
+    def open(self, key):
+        """Поток содержимого объекта (читается по мере отправки)"""
+        return self.client.get_object(Bucket=self.bucket, Key=self._object_key(key))['Body']
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=self._object_key(key))
+        return True
+
+    def exists(self, key):
+        return self._head(key) is not None
+
+    def size(self, key):
+        head = self._head(key)
+        return head['ContentLength'] if head else None
+
+    def health(self):
+        status = {'ok': False, 'bucket': self.bucket, 'error': None}
+        try:
+            self.client.head_bucket(Bucket=self.bucket)
+            status['ok'] = True
+        except Exception as e:
+            status['error'] = str(e)
+        return status
+
+    def presigned_url(self, key, download_name=None, expires=None):
+        """Временная ссылка на скачивание объекта напрямую из хранилища"""
+        params = {'Bucket': self.bucket, 'Key': self._object_key(key)}
+        if download_name:
+            params['ResponseContentDisposition'] = f"attachment; filename*=UTF-8''{quote(download_name)}"
+        return self.client.generate_presigned_url(
+            'get_object', Params=params, ExpiresIn=expires or self.presign_expires
+        )
+
+
+_storage = None
+
+
+@contextmanager
+def local_file(storage, key, temp_folder=None):
+    """
+    Путь к файлу на диске для внешних инструментов (рендеринг, извлечение текста)
+
+    Для удаленного хранилища файл копируется во временный и удаляется после использования.
+    """
+    path = storage.local_path(key)
+    if path is not None:
+        yield path
+        return
+    with closing(storage.open(key)) as source, tempfile.NamedTemporaryFile(
+            dir=temp_folder, prefix='storage_', delete=False) as copy:
+        shutil.copyfileobj(source, copy, Config.UPLOAD_CHUNK_SIZE)
+    try:
+        yield copy.name
+    finally:
+        os.remove(copy.name)
+
+
+def get_storage():
+    """Хранилище, выбранное в конфигурации (создается один раз на процесс)"""
+    global _storage
+    if _storage is None:
+        if Config.STORAGE_BACKEND == 's3':
+            _storage = S3StorageBackend(
+                Config.S3_BUCKET,
+                prefix=Config.S3_PREFIX,
+                endpoint_url=Config.S3_ENDPOINT_URL,
+                region=Config.S3_REGION,
+                access_key=Config.S3_ACCESS_KEY,
+                secret_key=Config.S3_SECRET_KEY,
+                presign_expires=Config.S3_PRESIGN_EXPIRES,
+            )
+        elif Config.STORAGE_BACKEND == 'local':
+            _storage = LocalStorageBackend(Config.UPLOAD_FOLDER)
+        else:
+            raise ValueError(f"Неизвестное хранилище: {Config.STORAGE_BACKEND}")
+    return _storage
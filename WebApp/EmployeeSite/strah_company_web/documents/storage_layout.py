@@ -0,0 +1,71 @@
+"""
+Модуль структуры папки загрузок
+Папки создаются и проверяются один раз (при запуске или при первом
+обращении), дальше пути берутся из кеша без обращений к файловой системе.
+Проверка записи выполняется при запуске и по запросу /health.
+"""
+
+import os
+import shutil
+import threading
+import uuid
+from config import Config
+
+
+def check_writable(folder):
+    """
+    Проверяет, что в папку можно записать файл
+
+    Returns:
+        dict: состояние папки (ok, path, free_bytes, error)
+    """
+    status = {'ok': False, 'path': folder, 'free_bytes': None, 'error': None}
+    test_file = os.path.join(folder, f'.health_{uuid.uuid4().hex}.tmp')
+    try:
+        with open(test_file, 'w') as f:
+            f.write('test')
+        os.remove(test_file)
+        status['free_bytes'] = shutil.disk_usage(folder).free
+        status['ok'] = True
+    except Exception as e:
+        status['error'] = str(e)
+    return status
+
+
+class StorageLayout:
+    """Папка загрузок и ее подпапки с однократным созданием"""
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self._folders = {}
+        self._lock = threading.Lock()
+
+    def folder(self, *parts):
+        """Абсолютный путь подпапки; создается при первом обращении"""
+        path = self._folders.get(parts)
+        if path is None:
+            path = os.path.join(self.root, *parts)
+            os.makedirs(path, exist_ok=True)
+            with self._lock:
+                self._folders[parts] = path
+        return path
+
+    def validate(self):
+        """Создает корневую папку и проверяет запись (при запуске)"""
+        self.folder()
+        status = check_writable(self.root)
+        if status['ok']:
+            print(f"DEBUG: Upload folder {self.root} is writable")
+        else:
+            print(f"ERROR: Upload folder {self.root} is not writable: {status['error']}")
+        return status
+
+    def health(self):
+        return check_writable(self.folder())
+
+
+_layout = StorageLayout(Config.UPLOAD_FOLDER)
+
+
+def get_layout():
+    return _layout
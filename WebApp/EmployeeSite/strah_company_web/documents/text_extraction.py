@@ -0,0 +1,85 @@
+"""
+Модуль извлечения текста из файлов документов для полнотекстового поиска
+Выполняется фоновой задачей process_upload, а не в запросе загрузки.
+Поддерживаются txt, docx (стандартная библиотека) и pdf (pdftotext из
+poppler-utils, если установлен). Формат определяется по содержимому.
+"""
+
+import shutil
+import subprocess
+import zipfile
+from xml.etree import ElementTree
+from config import Config
+from documents.storage_backends import get_storage, local_file
+from documents.uploads import get_temp_folder
+
+WORD_NAMESPACE = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+TEXT_ENCODINGS = ('utf-8-sig', 'cp1251')
+
+
+def _extract_docx(path):
+    parts = []
+    with zipfile.ZipFile(path) as archive:
+        if 'word/document.xml' not in archive.namelist():
+            return None
+        with archive.open('word/document.xml') as xml_file:
+            for event, element in ElementTree.iterparse(xml_file):
+                if element.tag == WORD_NAMESPACE + 't' and element.text:
+                    parts.append(element.text)
+                elif element.tag == WORD_NAMESPACE + 'p':
+                    parts.append('\n')
+                    element.clear()
+    return ''.join(parts)
+
+
+def _extract_pdf(path):
+    pdftotext = shutil.which('pdftotext')
+    if pdftotext is None:
+        return None
+    result = subprocess.run(
+        [pdftotext, '-q', '-enc', 'UTF-8', path, '-'],
+        check=True, timeout=Config.SEARCH_EXTRACT_TIMEOUT,
+        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+    )
+    return result.stdout.decode('utf-8', 'replace')
+
+
+def _extract_plain(path):
+    with open(path, 'rb') as f:
+        data = f.read(Config.SEARCH_TEXT_LIMIT * 4)
+    # Двоичные файлы (изображения, xls) не индексируются
+    if b'\x00' in data[:8192]:
+        return None
+    for encoding in TEXT_ENCODINGS:
+        try:
+            return data.decode(encoding)
+        except UnicodeDecodeError as e:
+            # Символ, обрезанный границей прочитанного блока, не ошибка кодировки
+            if e.start >= len(data) - 3 and e.reason == 'unexpected end of data':
+                return data[:e.start].decode(encoding)
+    return None
+
+
+def extract_text(stored_file_path):
+    """
+    Извлекает текст файла документа
+
+    Returns:
+        str: текст (не длиннее SEARCH_TEXT_LIMIT символов) или None
+    """
+    with local_file(get_storage(), stored_file_path, get_temp_folder()) as path:
+        with open(path, 'rb') as f:
+            head = f.read(8)
+        if head.startswith(b'%PDF-'):
+            text = _extract_pdf(path)
+        elif head.startswith(b'PK\x03\x04'):
+            # docx; прочие zip-форматы (xlsx) пропускаются
+            text = _extract_docx(path) if zipfile.is_zipfile(path) else None
+        elif head.startswith((b'\xff\xd8\xff', b'\x89PNG')):
+            text = None
+        else:
+            text = _extract_plain(path)
+
+    if not text or not text.strip():
+        return None
+    return text[:Config.SEARCH_TEXT_LIMIT]
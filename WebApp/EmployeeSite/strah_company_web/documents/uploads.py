@@ -0,0 +1,130 @@
+"""
+Модуль потоковой загрузки файлов
+Файл из multipart-запроса пишется блоками сразу во временный файл в папке
+загрузок, попутно считаются размер и SHA-256 и проверяется лимит роли.
+На место файл переносится атомарно (os.replace), без повторного копирования.
+"""
+
+import hashlib
+import os
+import tempfile
+from flask import Request, current_app, session
+from werkzeug.exceptions import RequestEntityTooLarge
+from config import Config
+from documents.storage_layout import get_layout
+
+
+def get_upload_quota(user_role=None):
+    """Максимальный размер загружаемого файла для роли (байты)"""
+    if user_role is None:
+        user_role = session.get('user_role')
+    return Config.UPLOAD_ROLE_QUOTAS.get(user_role, Config.UPLOAD_DEFAULT_QUOTA)
+
+
+def get_temp_folder():
+    """Папка временных файлов загрузки (в той же файловой системе, что и uploads)"""
+    return get_layout().folder('.tmp')
+
+
+class HashingUploadFile:
+    """
+    Временный файл загрузки, считающий размер и SHA-256 при записи
+
+    Превышение limit прерывает загрузку с ошибкой 413. Если файл не был
+    перенесен на место через commit(), он удаляется при закрытии.
+    """
+
+    def __init__(self, limit, folder=None):
+        self.limit = limit
+        self.size = 0
+        self._sha256 = hashlib.sha256()
+        self._file = tempfile.NamedTemporaryFile(dir=folder or get_temp_folder(), prefix='upload_', delete=False)
+        self.path = self._file.name
+        self.committed = False
+
+    def write(self, data):
+        self.size += len(data)
+        if self.limit is not None and self.size > self.limit:
+            raise RequestEntityTooLarge(
+                f"Размер файла превышает допустимый ({self.limit // (1024 * 1024)} МБ)"
+            )
+        self._sha256.update(data)
+        return self._file.write(data)
+
+    @property
+    def sha256(self):
+        return self._sha256.hexdigest()
+
+    def commit(self, destination):
+        """
+        Атомарно переносит файл в destination
+
+        Существующий файл заменяется: в хранилище (documents/blob_store.py)
+        по одному пути может лежать только файл с тем же содержимым.
+        """
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._file.close()
+        os.replace(self.path, destination)
+        self.committed = True
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
+        if not self.committed and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def __getattr__(self, name):
+        # read/seek/tell и прочее - у временного файла
+        return getattr(self._file, name)
+
+
+def spool_stream(stream, limit=None, folder=None):
+    """
+    Копирует поток во временный файл блоками UPLOAD_CHUNK_SIZE
+
+    Используется для файлов, загруженных не через UploadRequest.
+
+    Returns:
+        HashingUploadFile
+    """
+    upload = HashingUploadFile(limit, folder)
+    try:
+        while True:
+            chunk = stream.read(Config.UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            upload.write(chunk)
+    except Exception:
+        upload.close()
+        raise
+    return upload
+
+
+class UploadRequest(Request):
+    """
+    Запрос с потоковой записью загружаемых файлов
+
+    Лимит роли применяется к Content-Length до разбора формы, а при записи -
+    к фактическому размеру каждого файла.
+    """
+
+    @property
+    def max_content_length(self):
+        app_limit = current_app.config['MAX_CONTENT_LENGTH'] if current_app else None
+        if not self.path.startswith('/documents') or 'user_role' not in session:
+            return app_limit
+        role_limit = get_upload_quota() + Config.UPLOAD_FORM_OVERHEAD
+        return min(app_limit, role_limit) if app_limit else role_limit
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        limit = get_upload_quota() if 'user_role' in session else Config.UPLOAD_DEFAULT_QUOTA
+        upload = HashingUploadFile(limit)
+        # Запоминаем, чтобы удалить и недописанные файлы (например, после 413)
+        self.__dict__.setdefault('_upload_files', []).append(upload)
+        return upload
+
+    def close(self):
+        super().close()
+        for upload in self.__dict__.pop('_upload_files', []):
+            upload.close()
@@ -0,0 +1,118 @@
+"""
+Модуль очереди фоновых задач
+Задачи хранятся в таблице jobs. Обработчики забирают их через
+FOR UPDATE SKIP LOCKED, поэтому несколько обработчиков не мешают друг другу.
+"""
+
+import json
+from config import Config
+from database.db import execute_query, current_transaction
+
+
+def enqueue_job(kind, payload=None, delay=0, max_attempts=None):
+    """
+    Ставит задачу в очередь
+
+    Args:
+        kind: тип задачи (см. tasks.worker.HANDLERS)
+        payload: параметры задачи (сериализуются в JSON)
+        delay: задержка перед первым запуском, секунды
+        max_attempts: число попыток (по умолчанию Config.JOB_MAX_ATTEMPTS)
+
+    Внутри transaction() задача фиксируется вместе с остальными изменениями,
+    а ошибка постановки пробрасывается, чтобы откатить всю транзакцию.
+
+    Returns:
+        int: ID задачи или None при ошибке
+    """
+    try:
+        result = execute_query("""
+            INSERT INTO jobs (kind, payload, max_attempts, run_at)
+            VALUES (%s, %s, %s, NOW() + make_interval(secs => %s))
+            RETURNING job_id
+        """, (kind, json.dumps(payload or {}, default=str),
+              max_attempts or Config.JOB_MAX_ATTEMPTS, delay))
+        job_id = result[0]['job_id'] if result else None
+        print(f"DEBUG: Enqueued job {job_id} ({kind})")
+        return job_id
+    except Exception as e:
+        print(f"Error enqueuing job {kind}: {e}")
+        if current_transaction() is not None:
+            raise
+        return None
+
+
+def claim_job():
+    """
+    Забирает одну готовую задачу и помечает ее выполняемой
+
+    Returns:
+        dict: задача или None, если очередь пуста
+    """
+    result = execute_query("""
+        UPDATE jobs
+        SET status = 'running', attempts = attempts + 1, locked_at = NOW()
+        WHERE job_id = (
+            SELECT job_id FROM jobs
+            WHERE status = 'pending' AND run_at <= NOW()
+            ORDER BY run_at, job_id
+            FOR UPDATE SKIP LOCKED
+            LIMIT 1
+        )
+        RETURNING job_id, kind, payload, attempts, max_attempts
+    """)
+    return result[0] if result else None
+
+
+def complete_job(job_id):
+    execute_query("""
+        UPDATE jobs SET status = 'done', finished_at = NOW(), locked_at = NULL, last_error = NULL
+        WHERE job_id = %s
+    """, (job_id,), fetch=False)
+
+
+def fail_job(job, error):
+    """Откладывает повтор задачи или помечает ее проваленной после последней попытки"""
+    if job['attempts'] >= job['max_attempts']:
+        execute_query("""
+            UPDATE jobs SET status = 'failed', finished_at = NOW(), locked_at = NULL, last_error = %s
+            WHERE job_id = %s
+        """, (str(error), job['job_id']), fetch=False)
+        return
+
+    retry_delay = Config.JOB_RETRY_DELAY * 2 ** (job['attempts'] - 1)
+    execute_query("""
+        UPDATE jobs
+        SET status = 'pending', locked_at = NULL, last_error = %s,
+            run_at = NOW() + make_interval(secs => %s)
+        WHERE job_id = %s
+    """, (str(error), retry_delay, job['job_id']), fetch=False)
+
+
+def requeue_stale_jobs():
+    """
+    Возвращает в очередь задачи, зависшие после падения обработчика
+
+    Returns:
+        int: количество возвращенных задач
+    """
+    result = execute_query("""
+        UPDATE jobs
+        SET status = CASE WHEN attempts >= max_attempts THEN 'failed' ELSE 'pending' END,
+            finished_at = CASE WHEN attempts >= max_attempts THEN NOW() END,
+            locked_at = NULL,
+            last_error = 'Обработчик не завершил задачу'
+        WHERE status = 'running' AND locked_at < NOW() - make_interval(secs => %s)
+        RETURNING job_id
+    """, (Config.JOB_LOCK_TIMEOUT,))
+    return len(result or [])
+
+
+def purge_finished_jobs():
+    """Удаляет выполненные задачи старше JOB_RETENTION_DAYS (проваленные остаются для разбора)"""
+    result = execute_query("""
+        DELETE FROM jobs
+        WHERE status = 'done' AND finished_at < NOW() - make_interval(days => %s)
+        RETURNING job_id
+    """, (Config.JOB_RETENTION_DAYS,))
+    return len(result or [])
@@ -0,0 +1,135 @@
+"""
+Обработчик фоновых задач
+
+Запуск (из каталога приложения):
+    python -m tasks.worker
+
+Можно запускать несколько экземпляров: задачи распределяются через
+FOR UPDATE SKIP LOCKED.
+"""
+
+import time
+from config import Config
+from database.db import execute_query
+from documents.file_storage import delete_document_file
+from documents.storage_backends import get_storage
+from documents.text_extraction import extract_text
+from documents.blob_store import is_blob_path, delete_blob
+from tasks.queue import claim_job, complete_job, fail_job, requeue_stale_jobs, purge_finished_jobs
+
+
+def handle_delete_file(payload):
+    """Удаляет файл старого формата, на который больше не ссылается ни один документ"""
+    stored_file_path = payload['stored_file_path']
+    if is_blob_path(stored_file_path):
+        return  # Файлы хранилища удаляет delete_blob по счетчику ссылок
+    in_use = execute_query(
+        "SELECT 1 FROM documents WHERE stored_file_path = %s LIMIT 1",
+        (stored_file_path,)
+    )
+    if in_use:
+        print(f"DEBUG: File {stored_file_path} is still referenced, skipping")
+        return
+    if get_storage().exists(stored_file_path) and not delete_document_file(stored_file_path):
+        raise RuntimeError(f"Не удалось удалить файл {stored_file_path}")
+
+
+def handle_delete_blob(payload):
+    """Удаляет файл хранилища, если счетчик ссылок на него нулевой"""
+    if not delete_blob(payload['content_hash']):
+        print(f"DEBUG: Blob {payload['content_hash']} is referenced or was uploaded again, skipping")
+
+
+def handle_process_upload(payload):
+    """
+    Проверяет загруженный файл документа, сверяет его размер с БД
+    и извлекает текст для полнотекстового поиска
+    """
+    result = execute_query(
+        "SELECT stored_file_path, file_size FROM documents WHERE document_id = %s",
+        (payload['document_id'],)
+    )
+    if not result:
+        return  # Документ уже удален
+    document = result[0]
+    file_size = get_storage().size(document['stored_file_path'])
+    if file_size is None:
+        raise FileNotFoundError(f"Файл документа не найден: {document['stored_file_path']}")
+
+    if file_size != document['file_size']:
+        execute_query(
+            "UPDATE documents SET file_size = %s WHERE document_id = %s AND stored_file_path = %s",
+            (file_size, payload['document_id'], document['stored_file_path']),
+            fetch=False
+        )
+
+    # Текст сохраняется, только если файл документа за это время не заменили;
+    # search_vector документа обновляет триггер document_texts
+    text = extract_text(document['stored_file_path'])
+    if text:
+        execute_query("""
+            INSERT INTO document_texts (document_id, content_text)
+            SELECT document_id, %s FROM documents
+            WHERE document_id = %s AND stored_file_path = %s
+            ON CONFLICT (document_id) DO UPDATE
+            SET content_text = EXCLUDED.content_text, extracted_at = NOW()
+        """, (text, payload['document_id'], document['stored_file_path']), fetch=False)
+    else:
+        execute_query("""
+            DELETE FROM document_texts t USING documents d
+            WHERE t.document_id = d.document_id AND d.document_id = %s AND d.stored_file_path = %s
+        """, (payload['document_id'], document['stored_file_path']), fetch=False)
+
+
+# Тип задачи -> обработчик(payload); исключение означает неудачную попытку
+HANDLERS = {
+    'delete_file': handle_delete_file,
+    'delete_blob': handle_delete_blob,
+    'process_upload': handle_process_upload,
+}
+
+
+def run_job(job):
+    handler = HANDLERS.get(job['kind'])
+    try:
+        if handler is None:
+            raise ValueError(f"Неизвестный тип задачи: {job['kind']}")
+        handler(job['payload'])
+    except Exception as e:
+        print(f"Job {job['job_id']} ({job['kind']}) failed, attempt {job['attempts']}: {e}")
+        fail_job(job, e)
+        return False
+    complete_job(job['job_id'])
+    print(f"DEBUG: Job {job['job_id']} ({job['kind']}) done")
+    return True
+
+
+def run_worker(maintenance_interval=60):
+    """Основной цикл: выполняет задачи, пока они есть, затем ждет JOB_POLL_INTERVAL"""
+    print("Job worker started")
+    last_maintenance = 0.0
+    while True:
+        try:
+            if time.monotonic() - last_maintenance >= maintenance_interval:
+                requeued = requeue_stale_jobs()
+                purged = purge_finished_jobs()
+                if requeued or purged:
+                    print(f"DEBUG: Requeued {requeued} stale jobs, purged {purged} finished jobs")
+                last_maintenance = time.monotonic()
+
+            job = claim_job()
+            if job is None:
+                time.sleep(Config.JOB_POLL_INTERVAL)
+                continue
+            run_job(job)
+        except KeyboardInterrupt:
+            print("Job worker stopped")
+            return
+        except Exception as e:
+            # Ошибка БД: ждем и пробуем снова
+            print(f"Job worker error: {e}")
+            time.sleep(Config.JOB_POLL_INTERVAL)
+
+
+if __name__ == '__main__':
+    run_worker()